@@ -21,6 +21,7 @@
 
 import sys
 import os
+import time
 import numpy as np
 import tensorflow as tf
 import matplotlib.pyplot as plt
@@ -32,6 +33,11 @@ from PIL import Image
 from tqdm import tqdm
 from sklearn.preprocessing import LabelEncoder
 
+# The gallery index is shared with the scripts in ouput_function
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ouput_function'))
+import gallery_index
+import softmax_model
+
 os.environ['TF_XLA_FLAGS'] = '--tf_xla_enable_xla_devices'
 
 # Get embedded list images and list labels in folder
@@ -61,6 +67,43 @@ def get_image_paths(dir):
                 pbar.update(1)
     return x
 
+def decode_image(file_path, image_size=160):
+    # PIL resize scaled to [0, 1], the same pixels as the former one image at a time evaluation
+    image = Image.open(file_path.decode()).convert('RGB').resize((image_size, image_size))
+    return np.asarray(image, dtype=np.float32) / 255
+
+def image_dataset(image_paths, batch_size=256, image_size=160):
+    # Files decoded in parallel and batched, the next batches are prepared while the model runs
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(lambda file_path: tf.ensure_shape(
+        tf.numpy_function(lambda path: decode_image(path, image_size), [file_path], tf.float32),
+        (image_size, image_size, 3)), num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def evaluate(image_paths, predict_classes, batch_size=256):
+    # Predicted class of every image, one compiled model call per batch
+    y_preds = np.zeros(len(image_paths), dtype=np.int64)
+    start = time.time()
+    i = 0
+    with tqdm(total=len(image_paths), file=sys.stdout) as pbar:
+        for images in image_dataset(image_paths, batch_size):
+            y_preds[i:i+len(images)] = predict_classes(images).numpy()
+            i += len(images)
+            pbar.update(len(images))
+    elapsed = time.time() - start
+    print('%d images in %.1f s (%.1f images/s)' % (len(image_paths), elapsed, len(image_paths) / max(elapsed, 1e-6)))
+    return y_preds
+
+def build_gallery(model, model_path, image_paths, labels, class_names, gallery_path, batch_size=256):
+    # Gallery of the L2_normalization embeddings of the images, searched by the softmax scripts instead of the softmax layer
+    embedder = softmax_model.embedding_model(model)
+    embed = tf.function(lambda images: embedder(images, training=False))
+    embeddings = np.concatenate([embed(images).numpy() for images in image_dataset(image_paths, batch_size)])
+    gallery = gallery_index.build_gallery(embeddings, labels, class_names,
+                                          model=gallery_index.model_info('softmax', model_path, embeddings.shape[1]))
+    gallery.save(gallery_path)
+    print('Gallery of %d faces written to "%s"' % (len(embeddings), gallery_path))
+
 def show_wrong_predict(img_paths,y_preds,labels,out_encoder):
     idx_diff = np.flatnonzero(np.array(y_preds) != np.array(labels))
     num_wrong_predict = len(idx_diff)
@@ -125,21 +168,10 @@ def main(args):
         print('Testing images labels: ', test_y.shape)
 
     cal_acc = tf.keras.metrics.Accuracy()
+    predict_classes = tf.function(lambda images: tf.argmax(model(images, training=False), axis=1))
 
     print('Evaluate on training set')
-    y_preds_train=np.zeros_like(train_y)
-    n = len(train_x)
-    with tqdm(total=n-1, file=sys.stdout) as pbar:
-        for i in range(n):
-            file_path = train_x[i]
-            image = Image.open(file_path)
-            image = image.resize((160,160))
-            image = tf.cast(np.array(image),tf.float32)/255
-            image = tf.expand_dims(image, axis=0)
-            predict = np.argmax(model.predict(image))
-            y_preds_train[i]= predict
-            pbar.update(1)
-
+    y_preds_train = evaluate(train_x, predict_classes, args.batch_size)
     cal_acc.update_state(y_preds_train, train_y)
     score_train = cal_acc.result().numpy()
     print('Accuracy: train=%3f' % score_train)
@@ -147,24 +179,17 @@ def main(args):
     if args.test_data_path is not None:
         cal_acc.reset_state()
         print('Evaluate on testing set')
-        y_preds_test = np.zeros_like(test_y)
-        n = len(test_x)
-        with tqdm(total=n - 1, file=sys.stdout) as pbar:
-            for i in range(n):
-                file_path = test_x[i]
-                image = Image.open(file_path)
-                image = image.resize((160, 160))
-                image = tf.cast(np.array(image), tf.float32) / 255
-                image = tf.expand_dims(image, axis=0)
-                predict = np.argmax(model.predict(image))
-                y_preds_test[i] = predict
-                pbar.update(1)
+        y_preds_test = evaluate(test_x, predict_classes, args.batch_size)
         cal_acc.update_state(y_preds_test, test_y)
         score_test = cal_acc.result().numpy()
         print('Accuracy: test=%3f' % score_test)
         if args.show_wrong_predict and args.test_data_path is not None:
             show_wrong_predict(test_x,y_preds_test,test_y,out_encoder)
 
+    if args.gallery_path is not None:
+        print('Building the gallery index')
+        build_gallery(model, args.model_path, train_x, train_y, class_names, args.gallery_path, args.batch_size)
+
 def parse_arguments(argv):
     parser = argparse.ArgumentParser()
 
@@ -180,6 +205,13 @@ def parse_arguments(argv):
     parser.add_argument('--test_data_path', type=str,
                         help='Path to the test dataset directory', default=None)
 
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of images per model call in the evaluation', default=256)
+
+    parser.add_argument('--gallery_path', type=str,
+                        help='Folder of a gallery index of the training images embedded by the softmax model, '
+                             'used as class_names of the softmax scripts', default=None)
+
     parser.add_argument('--show_wrong_predict', type=bool,
                         help='Show wrong predict images', default=False)
 
@@ -25,128 +25,256 @@ import numpy as np
 import tensorflow.compat.v1 as tf
 import matplotlib.pyplot as plt
 import argparse
+import multiprocessing
+import time
 import pickle
 import cv2
 
-from scipy import misc
-from PIL import Image
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
 from mtcnn import MTCNN
 from sklearn.preprocessing import LabelEncoder
 from sklearn.svm import SVC
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
 from sklearn.linear_model import LogisticRegression
 from sklearn.neighbors import KNeighborsClassifier
 from models import facenet
 
+# The gallery index, the embedding store, the face crops and the linear classifier are shared with the scripts in ouput_function
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ouput_function'))
+import gallery_index
+import embedding_store
+import face_crop
+import linear_classifier
+
 os.environ['TF_XLA_FLAGS'] = '--tf_xla_enable_xla_devices'
 
-# Get embedded list images and list labels in folder
-def load_dataset(dir, embedder):
-    x, y, img_path = [], [] , []
-    n = len(os.listdir(dir))
-    i = 1
+def list_dataset(dir):
+    # Image paths and labels (the sub folder names) of a dataset directory
+    img_path, y = [], []
     for subdir in os.listdir(dir):
-        print('Folder: ',i,'/',n)
-        subdir_path = dir + '/' + subdir
-
-        data_embedding,data_path = get_embedding_data(subdir_path, embedder)
-        for j in range(len(data_embedding)):
-            x.append(data_embedding[j])
-            img_path.append(data_path[j])
+        subdir_path = os.path.join(dir, subdir)
+        for filename in os.listdir(subdir_path):
+            img_path.append(os.path.join(subdir_path, filename))
             y.append(subdir)
-        i+=1
-    return x, y, img_path
+    return img_path, y
 
-
-def load_dataset_mtcnn(dir, embedder, detector, margin):
-    x, y,img_path = [], [],[]
-    n = len(os.listdir(dir))
-    i = 1
-    for subdir in os.listdir(dir):
-        print('Folder: ',i,'/',n)
-        subdir_path = dir + '/' + subdir
-
-        data_embedding,data_path = get_embedding_mtcnn(subdir_path, embedder, detector,margin)
-        for j in range(len(data_embedding)):
-            x.append(data_embedding[j])
-            img_path.append(data_path[j])
-            y.append(subdir)
-        i += 1
+# Get embedded list images and list labels in folder
+def load_dataset(dir, embedder, store=None, batch_size=64, nrof_threads=None):
+    img_path, y = list_dataset(dir)
+    print('%d images of %d people in %s' % (len(img_path), len(set(y)), dir))
+    x = get_embeddings(img_path, embedder, store, batch_size, nrof_threads)
     return x, y, img_path
 
-def load_image(img, image_size, do_prewhiten=True):
-    image = np.zeros((1, image_size, image_size, 3))
-    if img.ndim == 2:
-        img = facenet.to_rgb(img)
-    if do_prewhiten:
-        img = facenet.prewhiten(img)
-    img = facenet.crop(img,False, image_size)
-    img = facenet.flip(img, False)
-    image[0,:,:,:] = img
-    return image
-
-def get_embedding(image,sess, image_size=160):
-    # Get input and output tensors
+
+def load_dataset_mtcnn(dir, embedder, detector, margin, store=None, batch_size=64):
+    img_path, y = list_dataset(dir)
+    print('%d images of %d people in %s' % (len(img_path), len(set(y)), dir))
+    x, found = get_embeddings_mtcnn(img_path, embedder, detector, margin, store, batch_size)
+    # images without a face are left out
+    return x, [y[i] for i in found], [img_path[i] for i in found]
+
+def image_batches(image_paths, batch_size=64, nrof_threads=None, image_size=160):
+    # (indices, prewhitened images) batches, every batch is decoded by nrof_threads threads
+    batches = facenet.iterate_data(image_paths, batch_size, False, False, image_size, True, nrof_threads)
+    for start, images in zip(range(0, len(image_paths), batch_size), batches):
+        yield list(range(start, start + len(images))), images
+
+def face_batches(image_paths, detector, sess, margin, batch_size=64, image_size=160):
+    # (indices, prewhitened faces) batches of the first face detected in every image, images without a face are skipped.
+    # The default session and graph are per thread, detection enters the ones MTCNN was created in,
+    # as in the video scripts
+    indices, faces = [], []
+    for i, filepath in enumerate(image_paths):
+        image = cv2.cvtColor(cv2.imread(filepath), cv2.COLOR_BGR2RGB)
+        with sess.as_default(), sess.graph.as_default():
+            results = detector.detect_faces(image)
+        if len(results) > 0:
+            indices.append(i)
+            faces.append(face_crop.crop_faces(image, [results[0]['box']], image_size, margin)[0])
+        if len(faces) == batch_size or (i == len(image_paths) - 1 and len(faces) > 0):
+            yield indices, face_crop.prewhiten_batch(np.asarray(faces, dtype=np.float32))
+            indices, faces = [], []
+
+def embed_batches(batches, sess, nrof_images):
+    # Embeddings of the (indices, images) batches, one sess.run per batch
     images_placeholder = tf.get_default_graph().get_tensor_by_name("input:0")
     embeddings = tf.get_default_graph().get_tensor_by_name("embeddings:0")
-    phase_train_placeholder = tf.get_default_graph().get_tensor_by_name("phase_train:0")
-    images = load_image(image, image_size)
-    feed_dict = {images_placeholder: images, phase_train_placeholder: False}
-    emb_array= sess.run(embeddings, feed_dict=feed_dict)
-    return emb_array
-
-def get_embedding_data(dir, sess):
-    x,img_path = [],[]
-    filename_list = os.listdir(dir)
-    with tqdm(total=len(filename_list), file=sys.stdout) as pbar:
-            for filename in filename_list:
-                # set up file path
-                filepath = os.path.join(dir,filename)
-                # load image from file
-                image = misc.imread(filepath)
-                img_path.append(filepath)
-                # convert to RGB, if needed
-                embedding = get_embedding(image,sess)
-                x.append(embedding[0])
-                pbar.update(1)
-    return x,img_path
-
-def get_embedding_mtcnn(dir, sess, detector, margin):
-    x,img_path= [],[]
-    filename_list = os.listdir(dir)
-    with tqdm(total=len(filename_list), file=sys.stdout) as pbar:
-            for filename in filename_list:
-                # set up file path
-                filepath = os.path.join(dir,filename)
-                img_path.append(filepath)
-                # load image from file
-                image = cv2.cvtColor(cv2.imread(filepath), cv2.COLOR_BGR2RGB)
-                # get image size
-                img_size = np.asarray(image.shape)[0:2]
-                # extract face, using default weights
-                results = detector.detect_faces(image)
-                if len(results)==0:
-                    continue
-                # extract the bounding box from the first face
-                x1, y1, width, height = results[0]['box']
-                x2, y2 = x1 + width, y1 + height
-
-                x1 = np.maximum(int(x1- margin/2), 0)
-                y1 = np.maximum(int(y1 - margin/2), 0)
-                x2 = np.minimum(int(x2 + margin/2), int(img_size[1]))
-                y2 = np.minimum(int(y2 + margin/2), int(img_size[0]))
-
-                # extract the face
-                face = image[y1:y2, x1:x2]
-                # resize image
-                image = Image.fromarray(face)
-                image = image.resize((182,182))
-                # convert to array
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                embedding = get_embedding(image,sess)
-                x.append(embedding)
-                pbar.update(1)
-    return x,img_path
+    feed_dict = facenet.phase_train_feed()
+    emb = {}
+    with tqdm(total=nrof_images, file=sys.stdout) as pbar:
+        for indices, images in batches:
+            feed_dict[images_placeholder] = images
+            emb.update(zip(indices, sess.run(embeddings, feed_dict=feed_dict)))
+            pbar.update(len(indices))
+    return emb
+
+def get_embeddings(image_paths, sess, store=None, batch_size=64, nrof_threads=None):
+    """Embeddings of the aligned face images, in batches of batch_size.
+
+    A background thread decodes and prewhitens the next batches while the
+    current one runs in the session. Images already in the store are not read.
+    """
+    x = [store.get(filepath) if store is not None else None for filepath in image_paths]
+    misses = [i for i, embedding in enumerate(x) if embedding is None]
+    batches = facenet.prefetch(image_batches([image_paths[i] for i in misses], batch_size, nrof_threads))
+    for j, embedding in embed_batches(batches, sess, len(misses)).items():
+        x[misses[j]] = embedding
+        if store is not None:
+            store.put(image_paths[misses[j]], embedding)
+    return x
+
+def get_embeddings_mtcnn(image_paths, sess, detector, margin, store=None, batch_size=64):
+    # Same as get_embeddings on the first face of raw images, also returns the indices of the images with a face.
+    # The next batches are decoded and detected on a background thread while the current one is embedded
+    x = [store.get(filepath) if store is not None else None for filepath in image_paths]
+    misses = [i for i, embedding in enumerate(x) if embedding is None]
+    batches = facenet.prefetch(face_batches([image_paths[i] for i in misses], detector, sess, margin, batch_size))
+    embedded = embed_batches(batches, sess, len(misses))
+    for j, i in enumerate(misses):
+        # None for an image without a face, the store remembers it so it is not detected again
+        x[i] = embedded.get(j)
+        if store is not None:
+            store.put(image_paths[i], x[i])
+    found = [i for i, embedding in enumerate(x) if embedding is not None and embedding is not embedding_store.NO_FACE]
+    return [x[i] for i in found], found
+
+def get_embedding_data(dir, sess, store=None, batch_size=64, nrof_threads=None):
+    img_path = [os.path.join(dir, filename) for filename in os.listdir(dir)]
+    return get_embeddings(img_path, sess, store, batch_size, nrof_threads), img_path
+
+def get_embedding_mtcnn(dir, sess, detector, margin, store=None, batch_size=64):
+    img_path = [os.path.join(dir, filename) for filename in os.listdir(dir)]
+    x, found = get_embeddings_mtcnn(img_path, sess, detector, margin, store, batch_size)
+    return x, [img_path[i] for i in found]
+
+def model_files(model_path):
+    # The metagraph and checkpoint files facenet.load_model restores, or the frozen graph file
+    model_path = os.path.expanduser(model_path)
+    if not os.path.isdir(model_path):
+        return [model_path]
+    meta_file, ckpt_file = facenet.get_model_filenames(model_path)
+    ckpt_files = [name for name in os.listdir(model_path) if name.startswith(ckpt_file + '.')]
+    return [os.path.join(model_path, name) for name in [meta_file] + ckpt_files]
+
+def open_embedding_store(store_path, model_path, data_path, use_mtcnn_model=False, margin=44, invalidate=False):
+    # Embeddings of the previous runs with the same model, by default in <data_path>_embeddings/<model name>
+    # next to the dataset directory, so nothing is written into the model folder. '' disables it
+    if store_path == '':
+        return None
+    if store_path is None:
+        model_name = os.path.splitext(os.path.basename(os.path.normpath(os.path.expanduser(model_path))))[0]
+        store_path = os.path.join(os.path.normpath(data_path) + '_embeddings', model_name)
+    fingerprint = embedding_store.model_fingerprint(model_files(model_path), use_mtcnn_model=use_mtcnn_model, margin=margin)
+    return embedding_store.EmbeddingStore(store_path, fingerprint, invalidate)
+
+def save_dataset_embeddings(output_file, embeddings, labels, img_paths):
+    # File written by embed_dataset.py, used in place of a dataset directory
+    np.savez(output_file, embeddings=np.asarray(embeddings, dtype=np.float32), labels=np.asarray(labels),
+             paths=np.asarray(img_paths))
+
+def load_dataset_embeddings(embeddings_file):
+    data = np.load(embeddings_file)
+    return list(data['embeddings']), list(data['labels']), list(data['paths'])
+
+def export_linear_model(model, class_names, model_classifier, x, tolerance=1e-4):
+    # numpy copy of a linear model next to the pickle, only written once it matches the pickle on the
+    # train embeddings. The weights are float32, the probabilities agree to about 1e-6
+    linear_file = linear_classifier_path(model_classifier)
+    linear = linear_classifier.from_sklearn(model, class_names)
+    x = np.asarray(x[:1000])
+    max_difference = np.max(np.abs(model.predict_proba(x) - linear.predict_proba(x)))
+    if max_difference > tolerance:
+        # A copy of an older model would no longer match the pickle either
+        if os.path.isfile(linear_file):
+            os.remove(linear_file)
+        raise ValueError('The linear classifier of "%s" does not match the pickle, max probability difference %.2e' % (
+            model_classifier, max_difference))
+    tmp_file = os.path.splitext(linear_file)[0] + '.tmp.npz'
+    linear.save(tmp_file)
+    os.replace(tmp_file, linear_file)
+    print('Linear classifier written to "%s", max probability difference with the pickle %.2e' % (
+        linear_file, max_difference))
+
+def linear_classifier_path(model_classifier):
+    return os.path.splitext(model_classifier)[0] + '.npz'
+
+def embeddings_path(model_classifier):
+    # Training embeddings kept next to the classifier, enroll_identity.py updates the classifier from them
+    return os.path.splitext(model_classifier)[0] + '_embeddings.npz'
+
+def save_embeddings(model_classifier, embeddings, labels):
+    np.savez(embeddings_path(model_classifier), embeddings=np.asarray(embeddings, dtype=np.float32),
+             labels=np.asarray(labels, dtype=np.int32))
+
+def fold_path(model, C_values, x, y, train_index, test_index, patience=3, tol=1e-3):
+    """Validation score and fit time of model for every C of one fold, smallest C first.
+
+    The model is fitted again for every C, a warm_start model (logistic
+    regression) starts from the solution of the previous, more regularized C,
+    which makes the whole path little more expensive than one fit. The path
+    stops once the score did not improve by tol for patience values of C.
+    """
+    model = clone(model)
+    scores, times = [], []
+    best_score, nrof_stale = -1.0, 0
+    for C in C_values:
+        model.set_params(C=C)
+        start = time.time()
+        model.fit(x[train_index], y[train_index])
+        times.append(time.time() - start)
+        scores.append(model.score(x[test_index], y[test_index]))
+        if scores[-1] > best_score + tol:
+            best_score, nrof_stale = scores[-1], 0
+        else:
+            nrof_stale += 1
+            if nrof_stale >= patience:
+                break
+    return scores, times
+
+def sweep_C(model, train_x, train_y, args, model_classifier):
+    """Best C of model by k-fold cross validation over np.arange(C_min, C, C_step).
+
+    Every fold runs its path in its own process. The processes are spawned,
+    the sweep runs inside the TensorFlow session and forking it is not safe.
+    The score and fit time of every C are printed and written to
+    <classifier>_sweep.csv. There are at most as many folds as images in the
+    smallest class, with less than two the sweep is skipped and args.C is
+    returned. The caller fits the final model once with the returned C.
+    """
+    C_values = np.arange(args.C_min, args.C, args.C_step)
+    if len(C_values) == 0:
+        raise ValueError('No value of C to sweep: --C_min (%g) must be below --C (%g) and --C_step (%g) positive' % (
+            args.C_min, args.C, args.C_step))
+    x, y = np.asarray(train_x), np.asarray(train_y)
+    nrof_folds = min(args.nrof_folds, int(np.min(np.unique(y, return_counts=True)[1])))
+    if nrof_folds < 2:
+        print('Warning: a class has a single training image, C is not swept, using C=%.4f' % args.C)
+        return args.C
+    if nrof_folds < args.nrof_folds:
+        print('Warning: the smallest class has %d training images, sweeping C with %d folds instead of %d' % (
+            nrof_folds, nrof_folds, args.nrof_folds))
+    folds = StratifiedKFold(n_splits=nrof_folds, shuffle=True, random_state=0).split(x, y)
+    start = time.time()
+    with ProcessPoolExecutor(args.nrof_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        paths = list(pool.map(fold_path, *zip(*[(model, C_values, x, y, train_index, test_index, args.patience)
+                                                 for train_index, test_index in folds])))
+    # C values reached by every fold
+    nrof_C = min(len(scores) for scores, _ in paths)
+    scores = np.array([fold_scores[:nrof_C] for fold_scores, _ in paths])
+    times = np.array([fold_times[:nrof_C] for _, fold_times in paths])
+    table_file = os.path.splitext(model_classifier)[0] + '_sweep.csv'
+    with open(table_file, 'w') as f:
+        f.write('C,mean_score,std_score,mean_fit_seconds\n')
+        for i in range(nrof_C):
+            print('C=%.4f  accuracy: validation=%.3f +- %.3f  fit %.2f s' % (
+                C_values[i], scores[:, i].mean(), scores[:, i].std(), times[:, i].mean()))
+            f.write('%f,%f,%f,%f\n' % (C_values[i], scores[:, i].mean(), scores[:, i].std(), times[:, i].mean()))
+    best_C = C_values[np.argmax(scores.mean(axis=0))]
+    print('Swept %d of %d values of C in %.1f s, best C=%.4f, table written to "%s"' % (
+        nrof_C, len(C_values), time.time() - start, best_C, table_file))
+    return best_C
 
 def show_wrong_predict(img_paths,imgs_emd,labels,out_encoder,model):
     y_preds = model.predict(imgs_emd)
@@ -170,6 +298,12 @@ def show_wrong_predict(img_paths,imgs_emd,labels,out_encoder,model):
         k=1
         plt.show()
 def main(args):
+    # Embeddings files written by embed_dataset.py are used as they are
+    train_data, test_data = None, None
+    if args.train_data_path.endswith('.npz'):
+        train_data = load_dataset_embeddings(args.train_data_path)
+    if args.test_data_path is not None and args.test_data_path.endswith('.npz'):
+        test_data = load_dataset_embeddings(args.test_data_path)
 
     # Create facenet model with L2 embeddings, load weights from pretrained model
     with tf.device('/GPU:0'):
@@ -178,18 +312,40 @@ def main(args):
                 # Load facenet model
                 print('Loading feature extraction model')
                 facenet.load_model(args.model_path)
-                # Create train dataset
-                if args.use_mtcnn_model:
+                # Only the datasets given as a directory are embedded here
+                test_is_dir = args.test_data_path is not None and test_data is None
+                # Embeddings of the previous runs with the same model, kept next to the first dataset directory
+                store = None
+                if train_data is None or test_is_dir:
+                    data_path = args.train_data_path if train_data is None else args.test_data_path
+                    store = open_embedding_store(args.embedding_store, args.model_path, data_path,
+                                                 args.use_mtcnn_model, args.margin, args.invalidate_embeddings)
+                # MTCNN is needed by any dataset given as a directory
+                detector = None
+                if args.use_mtcnn_model and (train_data is None or test_is_dir):
                     detector = MTCNN()
-                    train_x, train_y,_ = load_dataset_mtcnn(args.train_data_path, sess, detector,args.marign)
+                # Create train dataset
+                if train_data is not None:
+                    train_x, train_y, _ = train_data
+                elif args.use_mtcnn_model:
+                    train_x, train_y,_ = load_dataset_mtcnn(args.train_data_path, sess, detector,args.margin, store,
+                                                            args.batch_size)
                 else:
-                    train_x, train_y,_ = load_dataset(args.train_data_path, sess)
+                    train_x, train_y,_ = load_dataset(args.train_data_path, sess, store, args.batch_size,
+                                                      args.nrof_threads)
                 # Create test dataset
-                if args.test_data_path is not None:
+                if test_data is not None:
+                    test_x, test_y, img_paths = test_data
+                elif args.test_data_path is not None:
                     if args.use_mtcnn_model:
-                        test_x, test_y,img_paths = load_dataset_mtcnn(args.test_data_path, sess,detector, args.marign)
+                        test_x, test_y,img_paths = load_dataset_mtcnn(args.test_data_path, sess,detector, args.margin,
+                                                                      store, args.batch_size)
                     else:
-                        test_x, test_y,img_paths = load_dataset(args.test_data_path, sess)
+                        test_x, test_y,img_paths = load_dataset(args.test_data_path, sess, store, args.batch_size,
+                                                                args.nrof_threads)
+                if store is not None:
+                    store.save()
+                    store.report()
 
                 # label encode targets
                 out_encoder = LabelEncoder()
@@ -219,74 +375,71 @@ def main(args):
                 # Create embedding model
                 if args.mode == 'LOGISTIC':
                     print('Training with Logistic model.')
-                    best_score = 0
-                    best_model = None
                     max_iter = 10000
                     if args.max_iter > 0:
                         max_iter = args.max_iter
-                    for C in np.arange(args.C_min, args.C, args.C_step):
-                        print('Training with the Regularization parameter:', C)
-                        model = LogisticRegression(multi_class='multinomial', C=C, max_iter=max_iter)
-                        model.fit(train_x, train_y)
-                        # score
-                        score_train = model.score(train_x, train_y)
-                        print('Accuracy: train=%3f' % score_train)
-                        if args.test_data_path is not None:
-                            score_test = model.score(test_x, test_y)
-                            if score_test > best_score:
-                                best_score = score_test
-                                best_model = model
-                            print('Accuracy: test=%.3f' % score_test)
-                        else:
-                            if score_train >best_score:
-                                best_model = model
-                                best_score = score_train
-                        # Saving model
-                        if args.model_classifier_path is None:
-                            model_classifier = os.path.join(os.path.split(args.model_path)[0], 'model_classifier_Logistic.sav')
-                        else:
-                            model_classifier = args.model_classifier_path
-                        print('------------------------------------------')
-                        # save model
+                    # Saving model
+                    if args.model_classifier_path is None:
+                        model_classifier = os.path.join(os.path.split(args.model_path)[0], 'model_classifier_Logistic.sav')
+                    else:
+                        model_classifier = args.model_classifier_path
+                    model = LogisticRegression(multi_class='multinomial', max_iter=max_iter, warm_start=True)
+                    best_C = sweep_C(model, train_x, train_y, args, model_classifier)
+                    best_model = model.set_params(C=best_C)
+                    best_model.fit(train_x, train_y)
+                    print('Accuracy: train=%3f' % best_model.score(train_x, train_y))
+                    if args.test_data_path is not None:
+                        print('Accuracy: test=%.3f' % best_model.score(test_x, test_y))
+                    print('------------------------------------------')
+                    # save model
                     with open(model_classifier, 'wb') as f:
                         pickle.dump(best_model, f)
                         pickle.dump(class_names, f)
+                    save_embeddings(model_classifier, train_x, train_y)
+                    export_linear_model(best_model, class_names, model_classifier, train_x)
                     if args.show_wrong_predict and args.test_data_path is not None:
                         show_wrong_predict(img_paths,test_x,test_y,out_encoder,best_model)
 
                 elif args.mode=='SVM':
                     print('Training with SVM model')
-                    best_score=0
-                    best_model=None
-                    for C in np.arange(args.C_min,args.C,args.C_step):
-                        print('Training with the Regularization parameter:', C)
-                        model = SVC(kernel='linear', probability=True)
-                        model.fit(train_x, train_y)
-                        # score
-                        score_train = model.score(train_x,train_y)
-                        print('Accuracy: train=%3f' % score_train)
-                        if args.test_data_path is not None:
-                            score_test = model.score(test_x,test_y)
-                            if score_test>best_score:
-                                best_score=score_test
-                                best_model=model
-                            print('Accuracy: test=%.3f' % score_test)
-                        else:
-                            if score_train >best_score:
-                                best_model = model
-                                best_score = score_train
-                        # Saving model
-                        if args.model_classifier_path is None:
-                            model_classifier=os.path.join(os.path.split(args.model_path)[0],'model_classifier_SVM.sav')
-                        else:
-                            model_classifier=args.model_classifier_path
-                        print('------------------------------------------')
-                        # save model
+                    if args.model_classifier_path is None:
+                        model_classifier=os.path.join(os.path.split(args.model_path)[0],'model_classifier_SVM.sav')
+                    else:
+                        model_classifier=args.model_classifier_path
+                    # Platt scaling is only needed by the final model, the sweep scores the plain SVC
+                    best_C = sweep_C(SVC(kernel='linear'), train_x, train_y, args, model_classifier)
+                    best_model = SVC(kernel='linear', C=best_C, probability=True)
+                    best_model.fit(train_x, train_y)
+                    print('Accuracy: train=%3f' % best_model.score(train_x, train_y))
+                    if args.test_data_path is not None:
+                        print('Accuracy: test=%.3f' % best_model.score(test_x, test_y))
+                    print('------------------------------------------')
+                    # save model
                     with open(model_classifier,'wb') as f:
                         pickle.dump(best_model, f)
                         pickle.dump(class_names,f)
+                    save_embeddings(model_classifier, train_x, train_y)
+                    export_linear_model(best_model, class_names, model_classifier, train_x)
                     if args.show_wrong_predict and args.test_data_path is not None:
                         show_wrong_predict(img_paths,test_x,test_y,out_encoder,best_model)
+                elif args.mode == 'GALLERY':
+                    print('Building the gallery index')
+                    embedder = gallery_index.model_info('triplet', args.model_path, np.shape(train_x)[1])
+                    gallery = gallery_index.build_gallery(train_x, train_y, class_names, nrof_lists=args.nrof_lists,
+                                                          nprobe=args.nprobe, model=embedder)
+                    # score
+                    class_index, _ = gallery.classify(train_x)
+                    print('Accuracy: train=%3f' % np.mean(class_index == train_y))
+                    if args.test_data_path is not None:
+                        class_index, _ = gallery.classify(test_x)
+                        print('Accuracy: test=%.3f' % np.mean(class_index == test_y))
+                    # Saving the gallery folder
+                    if args.model_classifier_path is None:
+                        model_classifier = os.path.join(os.path.split(args.model_path)[0], 'gallery')
+                    else:
+                        model_classifier = args.model_classifier_path
+                    gallery.save(model_classifier)
+                    print('Saved gallery index to "%s"' % model_classifier)
                 else:
                     print('Training with KNN:')
                     model = KNeighborsClassifier(n_neighbors=len(class_names),algorithm='ball_tree',weights='distance')
@@ -306,25 +459,26 @@ def main(args):
                     with open(model_classifier, 'wb') as f:
                         pickle.dump(model, f)
                         pickle.dump(class_names, f)
+                    save_embeddings(model_classifier, train_x, train_y)
                     if args.show_wrong_predict and args.test_data_path is not None:
                         show_wrong_predict(img_paths,test_x,test_y,out_encoder,model)
 def parse_arguments(argv):
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('mode', type=str, choices=['KNN', 'SVM', 'LOGISTIC'],
+    parser.add_argument('mode', type=str, choices=['KNN', 'SVM', 'LOGISTIC', 'GALLERY'],
                         help='Method for classification ', default='KNN')
 
     parser.add_argument('model_path', type=str,
                         help='Path to the model facenet (.h5 file)')
 
     parser.add_argument('train_data_path', type=str,
-                        help='Path to the train dataset directory')
+                        help='Path to the train dataset directory, or its embeddings file written by embed_dataset.py')
 
     parser.add_argument('--model_classifier_path', type=str,
                         help='Path to save the classifier model, if training with softmax, the classifier model path is the model_path', default=None)
 
     parser.add_argument('--test_data_path', type=str,
-                        help='Path to the test dataset directory', default=None)
+                        help='Path to the test dataset directory, or its embeddings file written by embed_dataset.py', default=None)
 
     parser.add_argument('--use_mtcnn_model', type=bool,
                         help='True if the data input is raw data', default=False)
@@ -340,9 +494,33 @@ def parse_arguments(argv):
     parser.add_argument('--C_step', type=float,
                         help='Use for C option. Step increase from C_min to C', default=0.1)
 
+    parser.add_argument('--nrof_folds', type=int,
+                        help='Number of cross validation folds used to pick C', default=5)
+    parser.add_argument('--nrof_workers', type=int,
+                        help='Number of processes of the C sweep, one per CPU if not set', default=None)
+    parser.add_argument('--patience', type=int,
+                        help='Stop the C sweep after this number of values without improvement', default=3)
+
     parser.add_argument('--max_iter', type=int,
                         help='Maximum number of iterations taken for the solvers to converge.', default=-1)
 
+    parser.add_argument('--nrof_lists', type=int,
+                        help='GALLERY mode: number of inverted lists of the approximate nearest neighbour index, '
+                             '0 picks it from the gallery size, -1 for exact search only', default=-1)
+    parser.add_argument('--nprobe', type=int,
+                        help='GALLERY mode: number of inverted lists scanned per face, more is slower but more accurate', default=8)
+
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of images to embed in one batch', default=64)
+    parser.add_argument('--nrof_threads', type=int,
+                        help='Number of threads decoding the images, one per CPU if not set', default=None)
+
+    parser.add_argument('--embedding_store', type=str,
+                        help='Folder where the embeddings are kept between runs, <train_data_path>_embeddings/<model '
+                             'name> if not set, an empty string disables it', default=None)
+    parser.add_argument('--invalidate_embeddings', action='store_true',
+                        help='Embed every image again instead of loading the stored embeddings')
+
     parser.add_argument('--show_wrong_predict', type=bool,
                         help='Show wrong predict images', default=False)
 
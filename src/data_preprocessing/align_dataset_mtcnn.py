@@ -22,51 +22,24 @@
 import sys
 import os
 import argparse
-import numpy as np
-import random
+import multiprocessing
+import queue
 import cv2
-from time import sleep
-from PIL import Image
+import tensorflow as tf
 from mtcnn import MTCNN
 from tqdm import tqdm
 
-def crop_faces_helper(img,face_bbox,margin):
-    x1, y1, width, height = face_bbox
-
-    # bug fix
-    x1, y1 = abs(x1), abs(y1)
-    x2, y2 = x1 + width, y1 + height
-
-    x1 = x1 - margin / 2 if x1 - margin / 2 > 0 else 0
-    y1 = y1 - margin / 2 if y1 - margin / 2 > 0 else 0
-    x2 = x2 + margin / 2 if x2 + margin / 2 < img.shape[1] else img.shape[1]
-    y2 = y2 + margin / 2 if y2 + margin / 2 < img.shape[0] else img.shape[0]
-    x1, x2, y1, y2 = int(x1), int(x2), int(y1), int(y2)
-
-    # extract the face
-    face = img[y1:y2, x1:x2]
-    # resize pixels to the model size
-    face = Image.fromarray(face)
-    return face
+# The face crop code is shared with the scripts in ouput_function
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ouput_function import face_crop
 
 def extract_faces(img_array, detector,detect_multiple_faces,threshold, image_size=160, margin=44):
-    faces_list, bbox = [], []
-    # convert channel
-
     results = detector.detect_faces(img_array)
 
-    for face in results:
-        confidence = face['confidence']
-        if confidence < threshold:
-            continue
-        face_bbox = face['box']
-        face = crop_faces_helper(img_array,face_bbox,margin)
-        face = face.resize((image_size, image_size))
-        face = np.asarray(face)
-        faces_list.append(face)
-        bbox.append(face_bbox)
-        if not detect_multiple_faces:
-            return faces_list, bbox
+    bbox = [face['box'] for face in results if face['confidence'] >= threshold]
+    if not detect_multiple_faces:
+        bbox = bbox[:1]
+    faces_list = face_crop.crop_faces(img_array, bbox, image_size, margin)
 
     return faces_list, bbox
 
@@ -103,53 +76,122 @@ def get_image_paths(facedir):
     image_paths = []
     if os.path.isdir(facedir):
         images = os.listdir(facedir)
-        image_paths = [os.path.join(facedir,img) for img in images]
+        image_paths = [os.path.join(facedir,img) for img in sorted(images)]
     return image_paths
 
+def align_image(image_path, output_class_dir, detector, detect_multiple_faces, threshold, image_size=160, margin=44):
+    # Writes the faces found in one image, returns the number of aligned faces and an error message or None
+    filename = os.path.splitext(os.path.split(image_path)[1])[0]
+    output_filename = os.path.join(output_class_dir, filename+'.png')
+    if os.path.exists(output_filename):
+        return 0, None
+    try:
+        img_array = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+    except (IOError, ValueError, IndexError, cv2.error) as e:
+        return 0, '{}: {}'.format(image_path, e)
+    face_list, bbox = extract_faces(img_array, detector, detect_multiple_faces, threshold, image_size=image_size, margin=margin)
+    if len(face_list) == 0:
+        return 0, 'Unable to align "%s"' % image_path
+    filename_base, file_extension = os.path.splitext(output_filename)
+    for i, face in enumerate(face_list):
+        if detect_multiple_faces:
+            output_filename_n = "{}_{}{}".format(filename_base, i, file_extension)
+        else:
+            output_filename_n = "{}{}".format(filename_base, file_extension)
+        face_rgb = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+        cv2.imwrite(output_filename_n,face_rgb)
+    return len(face_list), None
+
+def align_images(jobs, detector, args):
+    for image_path, output_class_dir in jobs:
+        yield align_image(image_path, output_class_dir, detector, args.detect_multiple_faces, args.threshold)
+
+def align_worker(jobs, args, nrof_threads, results):
+    # Runs in its own process with its own detector, the results are sent back one image at a time
+    try:
+        if nrof_threads > 0:
+            tf.config.threading.set_intra_op_parallelism_threads(nrof_threads)
+        for gpu in tf.config.list_physical_devices('GPU'):
+            tf.config.experimental.set_memory_growth(gpu, True)
+        detector = MTCNN()
+        for result in align_images(jobs, detector, args):
+            results.put(result)
+    finally:
+        results.put(None)
+
+def shard_classes(class_jobs, nrof_workers):
+    # Every class folder goes whole to one worker, so images with the same name stem (a.jpg, a.png) are still
+    # aligned one after the other as in a serial run. The largest classes go first to the least loaded worker
+    shards = [[] for _ in range(nrof_workers)]
+    for i in sorted(range(len(class_jobs)), key=lambda i: -len(class_jobs[i])):
+        shard = min(range(nrof_workers), key=lambda j: len(shards[j]))
+        shards[shard] += class_jobs[i]
+    return shards
+
+def align_parallel(class_jobs, args, nrof_workers):
+    # Processes are spawned, forking after TensorFlow has been imported is not safe
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    nrof_threads = args.nrof_threads if args.nrof_threads > 0 else max(multiprocessing.cpu_count() // nrof_workers, 1)
+    workers = [context.Process(target=align_worker, args=(shard, args, nrof_threads, results))
+               for shard in shard_classes(class_jobs, nrof_workers)]
+    for worker in workers:
+        worker.start()
+    nrof_running = len(workers)
+    while nrof_running > 0:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+            continue
+        if result is None:
+            nrof_running -= 1
+        else:
+            yield result
+    for worker in workers:
+        worker.join()
+    nrof_failed = sum(1 for worker in workers if worker.exitcode != 0)
+    if nrof_failed > 0:
+        raise RuntimeError('%d of %d alignment workers failed' % (nrof_failed, len(workers)))
+
 def main(args):
-    sleep(random.random())
     output_dir = os.path.expanduser(args.output_dir)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    print('Creating networks and loading parameters')
-    detector = MTCNN()
     dataset = get_dataset(args.input_dir)
-    nrof_images_total = 0
-    nrof_successfully_aligned = 0
+    class_jobs = []
     for cls in dataset:
         output_class_dir = os.path.join(output_dir, cls.name)
         if not os.path.exists(output_class_dir):
             os.makedirs(output_class_dir)
-        with tqdm(total=len(cls.image_paths)-1, file=sys.stdout) as pbar:
-            for image_path in cls.image_paths:
-                nrof_images_total += 1
-                filename = os.path.splitext(os.path.split(image_path)[1])[0]
-                output_filename = os.path.join(output_class_dir, filename+'.png')
-                if not os.path.exists(output_filename):
-                    try:
-                        img_array = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
-                    except (IOError, ValueError, IndexError) as e:
-                        errorMessage = '{}: {}'.format(image_path, e)
-                        print(errorMessage)
-                    else:
-                        face_list, bbox = extract_faces(img_array, detector, args.detect_multiple_faces, args.threshold, image_size=160, margin=44)
-                        if len(face_list) > 0:
-                            for i, face in enumerate(face_list):
-                                nrof_successfully_aligned += 1
-                                filename_base, file_extension = os.path.splitext(output_filename)
-                                if args.detect_multiple_faces:
-                                    output_filename_n = "{}_{}{}".format(filename_base, i, file_extension)
-                                else:
-                                    output_filename_n = "{}{}".format(filename_base, file_extension)
-                                face_rgb = cv2.cvtColor(face_list[i], cv2.COLOR_BGR2RGB)
-                                cv2.imwrite(output_filename_n,face_rgb)
-                        else:
-                            print('Unable to align "%s"' % image_path)
-                pbar.update(1)
+        class_jobs.append([(image_path, output_class_dir) for image_path in cls.image_paths])
+    jobs = [job for jobs_of_class in class_jobs for job in jobs_of_class]
+
+    nrof_workers = min(args.nrof_workers, sum(1 for jobs_of_class in class_jobs if len(jobs_of_class) > 0))
+    if nrof_workers > 1:
+        print('Aligning with %d workers' % nrof_workers)
+        results = align_parallel(class_jobs, args, nrof_workers)
+    else:
+        print('Creating networks and loading parameters')
+        results = align_images(jobs, MTCNN(), args)
+
+    nrof_images_total = 0
+    nrof_successfully_aligned = 0
+    nrof_failed = 0
+    with tqdm(total=len(jobs), file=sys.stdout) as pbar:
+        for nrof_aligned, message in results:
+            nrof_images_total += 1
+            nrof_successfully_aligned += nrof_aligned
+            if message is not None:
+                nrof_failed += 1
+                pbar.write(message)
+            pbar.update(1)
                             
     print('Total number of images: %d' % nrof_images_total)
     print('Number of successfully aligned images: %d' % nrof_successfully_aligned)
+    print('Number of images that failed: %d' % nrof_failed)
             
 
 def parse_arguments(argv):
@@ -165,6 +207,10 @@ def parse_arguments(argv):
                         help='Detect and align multiple faces per image.', default=False)
     parser.add_argument('--threshold', type=float,
         help='Threshold for accepting the face, default is 0.8', default=0.8)
+    parser.add_argument('--nrof_workers', type=int,
+        help='Number of processes aligning images in parallel, each with its own detector and whole class folders.', default=1)
+    parser.add_argument('--nrof_threads', type=int,
+        help='TensorFlow threads per worker, 0 splits the CPU cores between the workers.', default=0)
     return parser.parse_args(argv)
 
 if __name__ == '__main__':
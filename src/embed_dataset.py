@@ -0,0 +1,81 @@
+"""Embed every image of a dataset directory into one embeddings file."""
+
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import time
+import argparse
+import tensorflow.compat.v1 as tf
+from mtcnn import MTCNN
+
+from models import facenet
+import classifier_triplet_facenet as classifier
+
+
+def main(args):
+    start = time.time()
+    with tf.Graph().as_default():
+        with tf.Session() as sess:
+            facenet.load_model(args.model_path)
+            store = classifier.open_embedding_store(args.embedding_store, args.model_path, args.data_path,
+                                                    args.use_mtcnn_model, args.margin, args.invalidate_embeddings)
+            if args.use_mtcnn_model:
+                x, y, img_paths = classifier.load_dataset_mtcnn(args.data_path, sess, MTCNN(), args.margin, store,
+                                                                args.batch_size)
+            else:
+                x, y, img_paths = classifier.load_dataset(args.data_path, sess, store, args.batch_size,
+                                                          args.nrof_threads)
+            if store is not None:
+                store.save()
+                store.report()
+    classifier.save_dataset_embeddings(args.output_file, x, y, img_paths)
+    elapsed = time.time() - start
+    print('%d embeddings written to "%s" in %.1f s (%.1f images/s)' % (len(x), args.output_file, elapsed,
+                                                                        len(x) / max(elapsed, 1e-6)))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('model_path', type=str,
+                        help='Path to the model facenet')
+    parser.add_argument('data_path', type=str,
+                        help='Path to the dataset directory, one sub folder of images per person')
+    parser.add_argument('output_file', type=str,
+                        help='Embeddings file (.npz) with the embeddings, labels and paths of the images')
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of images to embed in one batch', default=64)
+    parser.add_argument('--nrof_threads', type=int,
+                        help='Number of threads decoding the images, one per CPU if not set', default=None)
+    parser.add_argument('--use_mtcnn_model', type=bool,
+                        help='True if the data input is raw data', default=False)
+    parser.add_argument('--margin', type=int,
+                        help='Margin for the crop around the bounding box (height, width) in pixels.', default=44)
+    parser.add_argument('--embedding_store', type=str,
+                        help='Folder where the embeddings are kept between runs, <data_path>_embeddings/<model name> '
+                             'if not set, an empty string disables it', default=None)
+    parser.add_argument('--invalidate_embeddings', action='store_true',
+                        help='Embed every image again instead of loading the stored embeddings')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,207 @@
+"""Enroll or remove one identity of a trained classifier or gallery without retraining from scratch."""
+
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import time
+import pickle
+import argparse
+import numpy as np
+import tensorflow.compat.v1 as tf
+from mtcnn import MTCNN
+from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+
+from models import facenet
+import classifier_triplet_facenet as classifier
+
+# The gallery index is shared with the scripts in ouput_function
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ouput_function'))
+import gallery_index
+
+
+def embed_identity(model_path, data_path, use_mtcnn_model=False, margin=44):
+    # Embeddings of the images of one person only
+    with tf.Graph().as_default():
+        with tf.Session() as sess:
+            facenet.load_model(model_path)
+            if use_mtcnn_model:
+                embeddings, _ = classifier.get_embedding_mtcnn(data_path, sess, MTCNN(), margin)
+            else:
+                embeddings, _ = classifier.get_embedding_data(data_path, sess)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+
+def load_classifier(model_classifier_path):
+    with open(model_classifier_path, 'rb') as infile:
+        model = pickle.load(infile)
+        class_names = pickle.load(infile)
+    embeddings_file = classifier.embeddings_path(model_classifier_path)
+    if not os.path.isfile(embeddings_file):
+        raise ValueError('No training embeddings "%s" next to the classifier, train it again with '
+                         'classifier_triplet_facenet.py' % embeddings_file)
+    data = np.load(embeddings_file)
+    return model, class_names, data['embeddings'], data['labels']
+
+def save_classifier(model_classifier_path, model, class_names, embeddings, labels):
+    tmp_path = model_classifier_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model, f)
+        pickle.dump(class_names, f)
+    os.replace(tmp_path, model_classifier_path)
+    classifier.save_embeddings(model_classifier_path, embeddings, labels)
+    # Keep the numpy copy of a linear model in step with the pickle
+    if os.path.isfile(classifier.linear_classifier_path(model_classifier_path)):
+        classifier.export_linear_model(model, class_names, model_classifier_path, embeddings)
+
+def update_classifier(model, embeddings, labels, removed=None):
+    """Fit model again on all the stored embeddings, starting from its current solution when possible.
+
+    This is not an incremental update, every call goes over the whole
+    training set and its cost grows with the gallery. The multinomial
+    logistic regression keeps the weights of the unchanged identities (the
+    row of a removed one is dropped, a new one starts from zero), so lbfgs
+    converges in a few iterations, but each of them still reads every
+    embedding. KNN only rebuilds its ball tree. SVC has no incremental update
+    and is refitted from scratch, with probability=True that includes a
+    5-fold Platt calibration over every identity, so it takes about as long
+    as the training did. Only a gallery index (enroll/remove in
+    gallery_index) avoids the refit.
+    """
+    nrof_classes = int(np.max(labels)) + 1
+    if isinstance(model, LogisticRegression):
+        coef, intercept = model.coef_, model.intercept_
+        # A binary model has one row of weights. Its probabilities are the softmax of -coef_ and coef_ for class 0
+        # and 1 when trained with multi_class='multinomial', of -coef_/2 and coef_/2 (a sigmoid) otherwise
+        half = 1.0 if getattr(model, 'multi_class', None) == 'multinomial' else 0.5
+        if len(coef) == 1:
+            coef, intercept = half * np.concatenate([-coef, coef]), half * np.concatenate([-intercept, intercept])
+        if removed is not None and len(coef) > removed:
+            coef, intercept = np.delete(coef, removed, axis=0), np.delete(intercept, removed)
+        if len(coef) < nrof_classes:
+            coef = np.concatenate([coef, np.zeros((nrof_classes - len(coef), coef.shape[1]))])
+            intercept = np.concatenate([intercept, np.zeros(nrof_classes - len(intercept))])
+        if nrof_classes == 2 and len(coef) == 2:
+            # Back to the single row of a binary model, with the same class 1 - class 0 scores
+            coef, intercept = (coef[1:] - coef[:1]) / (2 * half), (intercept[1:] - intercept[:1]) / (2 * half)
+        warm_start = model.warm_start
+        if len(coef) == (1 if nrof_classes == 2 else nrof_classes):
+            model.coef_, model.intercept_ = coef, intercept
+            model.set_params(warm_start=True)
+        model.fit(embeddings, labels)
+        model.set_params(warm_start=warm_start)
+    elif isinstance(model, KNeighborsClassifier):
+        model.set_params(n_neighbors=min(nrof_classes, len(embeddings)))
+        model.fit(embeddings, labels)
+    elif isinstance(model, SVC):
+        print('Warning: SVC has no incremental update, refitting it and its probability calibration on %d embeddings '
+              'takes as long as training it. Use a LOGISTIC classifier or a GALLERY index to enroll in seconds'
+              % len(embeddings))
+        model.fit(embeddings, labels)
+    else:
+        print('%s has no incremental update, fitting it again on %d embeddings' % (type(model).__name__, len(embeddings)))
+        model.fit(embeddings, labels)
+    return model
+
+def enroll(args):
+    name = args.name if args.name is not None else os.path.basename(os.path.normpath(args.identity))
+    if args.model_path is None:
+        raise ValueError('enroll needs the facenet model (--model_path) to embed the images of %s' % name)
+    start = time.time()
+    embeddings = embed_identity(args.model_path, args.identity, args.use_mtcnn_model, args.margin)
+    if len(embeddings) == 0:
+        raise ValueError('No face embedded from "%s"' % args.identity)
+    print('Embedded %d images of %s in %.1f s' % (len(embeddings), name, time.time() - start))
+
+    start = time.time()
+    if gallery_index.is_gallery(args.model_classifier_path):
+        model = gallery_index.model_info('triplet', args.model_path, np.shape(embeddings)[1])
+        gallery = gallery_index.load_gallery(args.model_classifier_path, model=model).enroll(name, embeddings)
+        gallery.save(args.model_classifier_path)
+        nrof_classes = len(gallery.class_names)
+    else:
+        model, class_names, x, y = load_classifier(args.model_classifier_path)
+        if name not in class_names:
+            class_names.append(name)
+        class_index = class_names.index(name)
+        x = np.concatenate([x, embeddings])
+        y = np.concatenate([y, np.full(len(embeddings), class_index, dtype=np.int32)])
+        model = update_classifier(model, x, y)
+        save_classifier(args.model_classifier_path, model, class_names, x, y)
+        nrof_classes = len(class_names)
+    print('Enrolled %s in %.1f s, %d identities' % (name, time.time() - start, nrof_classes))
+
+def remove(args):
+    name = args.identity
+    start = time.time()
+    if gallery_index.is_gallery(args.model_classifier_path):
+        gallery = gallery_index.load_gallery(args.model_classifier_path).remove(name)
+        gallery.save(args.model_classifier_path)
+        nrof_classes = len(gallery.class_names)
+    else:
+        model, class_names, x, y = load_classifier(args.model_classifier_path)
+        if name not in class_names:
+            raise ValueError('"%s" is not in the classifier' % name)
+        class_index = class_names.index(name)
+        keep = y != class_index
+        x, y = x[keep], y[keep]
+        # Keep the labels contiguous, they index class_names
+        y[y > class_index] -= 1
+        class_names.pop(class_index)
+        model = update_classifier(model, x, y, removed=class_index)
+        save_classifier(args.model_classifier_path, model, class_names, x, y)
+        nrof_classes = len(class_names)
+    print('Removed %s in %.1f s, %d identities' % (name, time.time() - start, nrof_classes))
+
+def main(args):
+    if args.command == 'enroll':
+        enroll(args)
+    else:
+        remove(args)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('command', type=str, choices=['enroll', 'remove'],
+                        help='Add the images of one person, or remove one person. Only the new images are embedded, '
+                             'but a classifier is fitted again on all the stored embeddings: warm-started for '
+                             'LOGISTIC, from scratch with its probability calibration for SVM, so the time grows '
+                             'with the gallery. A gallery index is updated without any refit')
+    parser.add_argument('model_classifier_path', type=str,
+                        help='Classifier model written by classifier_triplet_facenet.py, or a gallery index folder')
+    parser.add_argument('identity', type=str,
+                        help='enroll: folder with the images of the person, named after the person. '
+                             'remove: name of the person')
+    parser.add_argument('--model_path', type=str,
+                        help='Path to the model facenet, needed by enroll', default=None)
+    parser.add_argument('--name', type=str,
+                        help='Name of the enrolled person, the name of the image folder if not set', default=None)
+    parser.add_argument('--use_mtcnn_model', type=bool,
+                        help='True if the images are not aligned faces yet', default=False)
+    parser.add_argument('--margin', type=int,
+                        help='Margin for the crop around the bounding box (height, width) in pixels.', default=44)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,117 @@
+"""Export a minimal frozen inference graph from a triplet loss checkpoint."""
+
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import numpy as np
+import tensorflow.compat.v1 as tf
+from tensorflow.python.tools import optimize_for_inference_lib
+
+from models import facenet
+
+
+def freeze_graph(model_dir, model_def, image_size=160, embedding_size=128):
+    # Rebuild the network for inference only and fold the checkpoint variables into constants
+    network = importlib.import_module(model_def)
+    meta_file, ckpt_file = facenet.get_model_filenames(os.path.expanduser(model_dir))
+    with tf.Graph().as_default():
+        with tf.Session() as sess:
+            images = tf.placeholder(tf.float32, [None, image_size, image_size, 3], name='input')
+            # phase_train=False builds batch norm on the moving averages and no dropout, without switches
+            prelogits, _ = network.inference(images, 1.0, phase_train=False, bottleneck_layer_size=embedding_size)
+            tf.nn.l2_normalize(prelogits, 1, 1e-10, name='embeddings')
+            # The moving averages of batch norm are saved with the trainable variables
+            saver = tf.train.Saver(tf.trainable_variables())
+            saver.restore(sess, os.path.join(os.path.expanduser(model_dir), ckpt_file))
+            graph_def = tf.graph_util.convert_variables_to_constants(sess, sess.graph.as_graph_def(), ['embeddings'])
+    # Strip the nodes that do not lead to embeddings and fold batch norm into the convolutions
+    return optimize_for_inference_lib.optimize_for_inference(graph_def, ['input'], ['embeddings'],
+                                                             tf.float32.as_datatype_enum)
+
+def model_size(model_path):
+    if os.path.isfile(model_path):
+        return os.path.getsize(model_path)
+    return sum(os.path.getsize(os.path.join(model_path, f)) for f in os.listdir(model_path))
+
+def benchmark(model_path, images, batch_size, nrof_runs):
+    # Load time, mean latency of a batch and the embeddings of images
+    with tf.Graph().as_default():
+        with tf.Session() as sess:
+            start = time.time()
+            facenet.load_model(model_path)
+            load_time = time.time() - start
+            images_placeholder = tf.get_default_graph().get_tensor_by_name('input:0')
+            embeddings = tf.get_default_graph().get_tensor_by_name('embeddings:0')
+            feed_dict = {images_placeholder: images[:batch_size]}
+            feed_dict.update(facenet.phase_train_feed())
+            # First run allocates the memory
+            emb = sess.run(embeddings, feed_dict=feed_dict)
+            start = time.time()
+            for _ in range(nrof_runs):
+                sess.run(embeddings, feed_dict=feed_dict)
+            latency = (time.time() - start) / nrof_runs
+    return load_time, latency, emb
+
+def main(args):
+    output_file = os.path.expanduser(args.output_file)
+    graph_def = freeze_graph(args.model_dir, args.model_def, args.image_size, args.embedding_size)
+    with tf.gfile.GFile(output_file, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    print('%d ops in the frozen graph written to "%s"' % (len(graph_def.node), output_file))
+
+    if args.nrof_runs > 0:
+        images = np.random.RandomState(0).normal(size=(args.batch_size, args.image_size, args.image_size, 3))
+        images = images.astype(np.float32)
+        print('%12s %12s %12s %16s' % ('model', 'size MB', 'load s', 'batch ms'))
+        results = []
+        for name, model_path in [('checkpoint', os.path.expanduser(args.model_dir)), ('frozen', output_file)]:
+            load_time, latency, emb = benchmark(model_path, images, args.batch_size, args.nrof_runs)
+            results.append(emb)
+            print('%12s %12.1f %12.2f %16.1f' % (name, model_size(model_path) / 2**20, load_time, 1000 * latency))
+        print('Max embedding difference: %.2e' % np.max(np.abs(results[0] - results[1])))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('model_dir', type=str,
+                        help='Directory with the metagraph and checkpoint written by train_tripletloss.py')
+    parser.add_argument('output_file', type=str,
+                        help='Filename of the exported protobuf (.pb) file')
+    parser.add_argument('--model_def', type=str,
+                        help='Model definition the checkpoint was trained with', default='models.inception_resnet_v1')
+    parser.add_argument('--image_size', type=int,
+                        help='Image size (height, width) in pixels', default=160)
+    parser.add_argument('--embedding_size', type=int,
+                        help='Dimensionality of the embedding', default=128)
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of images of the latency benchmark batch', default=64)
+    parser.add_argument('--nrof_runs', type=int,
+                        help='Number of timed runs against the checkpoint graph, 0 skips the comparison', default=20)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -37,8 +37,12 @@ from scipy import interpolate
 from tensorflow.python.training import training
 import random
 import re
+import threading
+import queue
 from tensorflow.python.platform import gfile
 import math
+import cv2
+from concurrent.futures import ThreadPoolExecutor
 from six import iteritems
 
 def triplet_loss(anchor, positive, negative, alpha):
@@ -240,20 +244,70 @@ def to_rgb(img):
     ret[:, :, 0] = ret[:, :, 1] = ret[:, :, 2] = img
     return ret
   
-def load_data(image_paths, do_random_crop, do_random_flip, image_size, do_prewhiten=True):
+def decode_image(image_path, out, do_random_crop, do_prewhiten=True):
+    # Decode an RGB image, crop it into the uint8 slot out and return the prewhiten statistics of the full image
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Can not read image "%s"' % image_path)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    mean, std_adj = 0.0, 1.0
+    if do_prewhiten:
+        mean = np.mean(img)
+        std_adj = np.maximum(np.std(img), 1.0/np.sqrt(img.size))
+    out[...] = crop(img, do_random_crop, out.shape[0])
+    return mean, std_adj
+
+def load_batch(image_paths, do_random_crop, do_random_flip, image_size, do_prewhiten=True, pool=None, buffer=None):
+    # Decode into a uint8 buffer, then prewhiten and flip the whole batch as float32
     nrof_samples = len(image_paths)
-    images = np.zeros((nrof_samples, image_size, image_size, 3))
-    for i in range(nrof_samples):
-        img = misc.imread(image_paths[i])
-        if img.ndim == 2:
-            img = to_rgb(img)
-        if do_prewhiten:
-            img = prewhiten(img)
-        img = crop(img, do_random_crop, image_size)
-        img = flip(img, do_random_flip)
-        images[i,:,:,:] = img
+    if buffer is None or len(buffer) < nrof_samples:
+        buffer = np.empty((nrof_samples, image_size, image_size, 3), dtype=np.uint8)
+    decode = lambda i: decode_image(image_paths[i], buffer[i], do_random_crop, do_prewhiten)
+    stats = list(pool.map(decode, range(nrof_samples)) if pool is not None else map(decode, range(nrof_samples)))
+    images = buffer[:nrof_samples].astype(np.float32)
+    if do_prewhiten and nrof_samples > 0:
+        mean, std_adj = np.array(stats, dtype=np.float32).T
+        images -= mean[:, None, None, None]
+        images /= std_adj[:, None, None, None]
+    if do_random_flip:
+        flipped = np.random.choice([True, False], nrof_samples)
+        images[flipped] = images[flipped, :, ::-1, :]
     return images
 
+def load_data(image_paths, do_random_crop, do_random_flip, image_size, do_prewhiten=True, nrof_threads=None):
+    # float32 images of image_paths, decoded by nrof_threads threads (one per CPU by default)
+    with ThreadPoolExecutor(nrof_threads) as pool:
+        return load_batch(image_paths, do_random_crop, do_random_flip, image_size, do_prewhiten, pool)
+
+def iterate_data(image_paths, batch_size, do_random_crop, do_random_flip, image_size, do_prewhiten=True,
+                 nrof_threads=None):
+    # Same as load_data in batches of batch_size images, so memory does not grow with the dataset
+    buffer = np.empty((batch_size, image_size, image_size, 3), dtype=np.uint8)
+    with ThreadPoolExecutor(nrof_threads) as pool:
+        for start in range(0, len(image_paths), batch_size):
+            yield load_batch(image_paths[start:start+batch_size], do_random_crop, do_random_flip, image_size,
+                             do_prewhiten, pool, buffer)
+
+def prefetch(iterable, nrof_items=2):
+    # Produce the next items of iterable on a background thread while the caller works on the current one
+    items = queue.Queue(maxsize=nrof_items)
+    def produce():
+        try:
+            for item in iterable:
+                items.put((True, item))
+        except Exception as e:
+            items.put((False, e))
+            return
+        items.put((False, None))
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        ok, item = items.get()
+        if not ok:
+            if item is not None:
+                raise item
+            return
+        yield item
+
 def get_label_batch(label_data, batch_size, batch_index):
     nrof_examples = np.size(label_data, 0)
     j = batch_index*batch_size % nrof_examples
@@ -365,7 +419,10 @@ def load_model(model, input_map=None):
     # Check if the model is a model directory (containing a metagraph and a checkpoint file)
     #  or if it is a protobuf file with a frozen graph
     model_exp = os.path.expanduser(model)
-    if (os.path.isfile(model_exp)):
+    if model_exp.endswith('.tflite'):
+        print('TFLite model filename: %s' % model_exp)
+        load_tflite_model(model_exp, input_map)
+    elif (os.path.isfile(model_exp)):
         print('Model filename: %s' % model_exp)
         with gfile.FastGFile(model_exp,'rb') as f:
             graph_def = tf.GraphDef()
@@ -381,6 +438,53 @@ def load_model(model, input_map=None):
         saver = tf.train.import_meta_graph(os.path.join(model_exp, meta_file), input_map=input_map)
         saver.restore(tf.get_default_session(), os.path.join(model_exp, ckpt_file))
     
+class TFLiteModel():
+    "Runs a .tflite model written by quantize_model.py on float32 batches"
+
+    def __init__(self, model_path, nrof_threads=None, model_content=None):
+        # model_content, the bytes of the .tflite file, is used in place of model_path when given. The
+        # constant tensors point into it, processes forked after reading it share the weights
+        if model_content is not None:
+            self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=nrof_threads)
+        else:
+            self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=nrof_threads)
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+        # The interpreter is not thread safe
+        self.lock = threading.Lock()
+
+    def predict(self, images):
+        images = np.asarray(images, dtype=np.float32)
+        if len(images) == 0:
+            return np.zeros((0, self.output_details['shape'][-1]), dtype=np.float32)
+        with self.lock:
+            if self.batch_size != len(images):
+                self.interpreter.resize_tensor_input(self.input_details['index'], images.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = len(images)
+            self.interpreter.set_tensor(self.input_details['index'], images)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_details['index']).copy()
+
+def load_tflite_model(model_exp, input_map=None, model_content=None):
+    # Wrap the interpreter into the default graph, so input:0 and embeddings:0 work as for a frozen graph
+    if input_map is not None:
+        raise ValueError('input_map is not supported for a TFLite model')
+    model = TFLiteModel(model_exp, model_content=model_content)
+    images = tf.placeholder(tf.float32, [None] + list(model.input_details['shape'][1:]), name='input')
+    embeddings = tf.numpy_function(model.predict, [images], tf.float32, name='embeddings')
+    embeddings.set_shape([None, model.output_details['shape'][-1]])
+    return model
+
+def phase_train_feed(graph=None):
+    # phase_train=False for a training metagraph, a frozen inference graph has no such placeholder
+    graph = graph if graph is not None else tf.get_default_graph()
+    try:
+        return {graph.get_tensor_by_name('phase_train:0'): False}
+    except KeyError:
+        return {}
+
 def get_model_filenames(model_dir):
     files = os.listdir(model_dir)
     meta_files = [s for s in files if s.endswith('.meta')]
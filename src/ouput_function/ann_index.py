@@ -0,0 +1,274 @@
+"""Inverted file index with product quantization for approximate search of large galleries."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import json
+import numpy as np
+
+
+def squared_distances(x, centroids):
+    return (np.sum(x ** 2, axis=1)[:, None] - 2 * np.dot(x, centroids.T)
+            + np.sum(centroids ** 2, axis=1)[None, :])
+
+
+def assign(x, centroids, batch_size=16384):
+    # Nearest centroid of every row, in batches to bound the size of the distance matrix
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), batch_size):
+        batch = np.asarray(x[start:start + batch_size], dtype=np.float32)
+        labels[start:start + batch_size] = np.argmin(squared_distances(batch, centroids), axis=1)
+    return labels
+
+
+def kmeans(x, k, nrof_iter=20, random_state=None):
+    # Lloyd iterations, empty clusters are moved to random points
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[random_state.choice(len(x), k, replace=False)].copy()
+    for _ in range(nrof_iter):
+        labels = assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        for d in range(x.shape[1]):
+            centroids[:, d] = np.bincount(labels, weights=x[:, d], minlength=k)
+        empty = counts == 0
+        centroids[~empty] /= counts[~empty, None]
+        centroids[empty] = x[random_state.choice(len(x), np.count_nonzero(empty))]
+    return centroids
+
+
+def encode(embeddings, coarse_centroids, pq_centroids):
+    # Inverted list, residual codes and ||r||^2 + 2 c.r of the quantized residual of every embedding
+    nrof_subspaces, _, subspace_dim = pq_centroids.shape
+    lists = assign(embeddings, coarse_centroids)
+    residuals = embeddings - coarse_centroids[lists]
+    codes = np.stack([assign(residuals[:, j * subspace_dim:(j + 1) * subspace_dim], pq_centroids[j])
+                      for j in range(nrof_subspaces)], axis=1).astype(np.uint8)
+    quantized = pq_centroids[np.arange(nrof_subspaces), codes].reshape(len(embeddings), -1)
+    terms = np.sum(quantized ** 2, axis=1) + 2 * np.sum(coarse_centroids[lists] * quantized, axis=1)
+    return lists, codes, terms.astype(np.float32)
+
+
+def save_array(path, array):
+    # Write next to the file and rename, a memory-mapped copy of the old file stays valid
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+class IVFPQIndex():
+    """Approximate nearest neighbours of the rows of an embedding matrix.
+
+    Every vector is stored in the inverted list of its nearest coarse centroid
+    as nrof_subspaces uint8 codes of its residual, 16 bytes instead of 512 for
+    a 128-d float32 embedding. A query only scans the nprobe lists nearest to
+    it. With ||q - c - r||^2 = ||q - c||^2 + (||r||^2 + 2 c.r) - 2 q.r, the
+    middle term is stored per vector and q.r is read from one lookup table per
+    query, shared by all the lists it probes. When the original embeddings are
+    available, the refine * k best candidates are re-ranked with the exact
+    distance. nprobe and refine trade recall for speed at query time.
+    """
+
+    def __init__(self, coarse_centroids, pq_centroids, codes, terms, ids, offsets, embeddings=None,
+                 nprobe=8, refine=4):
+        self.coarse_centroids = coarse_centroids
+        self.pq_centroids = pq_centroids
+        self.codes = codes
+        self.terms = terms
+        self.ids = ids
+        self.offsets = offsets
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        self.refine = refine
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _with_vectors(self, lists, codes, terms, ids):
+        # Index over the given vectors, stored contiguously per list
+        order = np.argsort(lists, kind='stable')
+        offsets = np.searchsorted(lists[order], np.arange(len(self.coarse_centroids) + 1))
+        return IVFPQIndex(self.coarse_centroids, self.pq_centroids, codes[order], terms[order], ids[order],
+                          offsets, self.embeddings, self.nprobe, self.refine)
+
+    def _lists(self):
+        return np.repeat(np.arange(len(self.coarse_centroids)), np.diff(self.offsets))
+
+    def add(self, embeddings, ids):
+        """New index with the embeddings added, encoded with the trained quantizers."""
+        lists, codes, terms = encode(np.asarray(embeddings, dtype=np.float32), self.coarse_centroids,
+                                     self.pq_centroids)
+        return self._with_vectors(np.concatenate([self._lists(), lists]),
+                                  np.concatenate([np.asarray(self.codes), codes]),
+                                  np.concatenate([np.asarray(self.terms), terms]),
+                                  np.concatenate([np.asarray(self.ids), np.asarray(ids, dtype=np.int64)]))
+
+    def remove(self, ids):
+        """New index without the vectors of the given ids."""
+        keep = ~np.isin(self.ids, ids)
+        return self._with_vectors(self._lists()[keep], np.asarray(self.codes)[keep],
+                                  np.asarray(self.terms)[keep], np.asarray(self.ids)[keep])
+
+    def renumber(self, new_ids):
+        """New index where the vector of id i has the id new_ids[i]."""
+        return IVFPQIndex(self.coarse_centroids, self.pq_centroids, self.codes, self.terms,
+                          np.asarray(new_ids, dtype=np.int64)[self.ids], self.offsets, self.embeddings,
+                          self.nprobe, self.refine)
+
+    def search(self, queries, k=5, nprobe=None, refine=None, batch_size=256):
+        """Ids and euclidean distances of the k nearest vectors of every query, nearest first.
+
+        Missing neighbours, when the probed lists hold fewer than k vectors,
+        have the id -1 and an infinite distance. The queries are scored
+        batch_size at a time, every batch with one lookup per subspace over
+        the rows of all the lists its queries probe.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self.coarse_centroids))
+        refine = self.refine if refine is None else refine
+        refine = refine if refine > 0 and self.embeddings is not None else 0
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for start in range(0, len(queries), batch_size):
+            end = start + batch_size
+            ids[start:end], distances[start:end] = self._search_batch(queries[start:end], k, nprobe, refine)
+        return ids, distances
+
+    def _search_batch(self, queries, k, nprobe, refine):
+        nrof_queries = len(queries)
+        ids = np.full((nrof_queries, k), -1, dtype=np.int64)
+        result = np.full((nrof_queries, k), np.inf, dtype=np.float32)
+        coarse_distances = squared_distances(queries, self.coarse_centroids)
+        probed = np.argpartition(coarse_distances, nprobe - 1, axis=1)[:, :nprobe]
+        starts = self.offsets[probed].ravel()
+        lengths = self.offsets[probed + 1].ravel() - starts
+        nrof_rows = lengths.reshape(nrof_queries, nprobe).sum(axis=1)
+        if nrof_rows.sum() == 0:
+            return ids, result
+        nrof_subspaces, nrof_codes, subspace_dim = self.pq_centroids.shape
+        # -2 q.r for every codeword of every subspace, one flat (query, codeword) table per subspace
+        tables = -2 * np.matmul(queries.reshape(nrof_queries, nrof_subspaces, subspace_dim).transpose(1, 0, 2),
+                                self.pq_centroids.transpose(0, 2, 1)).reshape(nrof_subspaces, -1)
+
+        # Rows of all the probed lists of all the queries, the rows of a query are contiguous
+        rows = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        query = np.repeat(np.arange(nrof_queries), nrof_rows)
+        # One contiguous line of codes per subspace
+        codes = np.ascontiguousarray(np.asarray(self.codes[rows]).T)
+        distances = (np.repeat(np.take_along_axis(coarse_distances, probed, axis=1).ravel(), lengths)
+                     + np.asarray(self.terms[rows]))
+        query_offsets = query * nrof_codes
+        for j in range(nrof_subspaces):
+            distances += np.take(tables[j], query_offsets + codes[j])
+
+        # One line per query padded with infinite distances, the best candidates of every line
+        column = np.arange(len(rows)) - np.repeat(np.cumsum(nrof_rows) - nrof_rows, nrof_rows)
+        width = nrof_rows.max()
+        padded = np.full((nrof_queries, width), np.inf, dtype=np.float32)
+        padded[query, column] = distances
+        padded_rows = np.zeros((nrof_queries, width), dtype=np.int64)
+        padded_rows[query, column] = rows
+        nrof_candidates = min(k * max(refine, 1), width)
+        if width > nrof_candidates:
+            keep = np.argpartition(padded, nrof_candidates - 1, axis=1)[:, :nrof_candidates]
+            padded = np.take_along_axis(padded, keep, axis=1)
+            padded_rows = np.take_along_axis(padded_rows, keep, axis=1)
+        found = np.isfinite(padded)
+        candidate_ids = np.where(found, np.asarray(self.ids)[padded_rows], -1)
+        if refine:
+            # Exact distances of the best candidates, the only rows read from the embeddings
+            exact = np.asarray(self.embeddings[candidate_ids[found]], dtype=np.float32)
+            padded = np.full(padded.shape, np.inf, dtype=np.float32)
+            difference = exact - queries[np.nonzero(found)[0]]
+            padded[found] = np.einsum('ij,ij->i', difference, difference)
+        top = np.argsort(padded, axis=1)[:, :k]
+        top_distances = np.take_along_axis(padded, top, axis=1)
+        top_ids = np.take_along_axis(candidate_ids, top, axis=1)
+        ids[:, :top.shape[1]] = np.where(np.isfinite(top_distances), top_ids, -1)
+        result[:, :top.shape[1]] = np.sqrt(np.maximum(top_distances, 0))
+        return ids, result
+
+    def save(self, path, embeddings=True):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        save_array(os.path.join(path, 'coarse_centroids.npy'), np.asarray(self.coarse_centroids, dtype=np.float32))
+        save_array(os.path.join(path, 'pq_centroids.npy'), np.asarray(self.pq_centroids, dtype=np.float32))
+        save_array(os.path.join(path, 'codes.npy'), np.asarray(self.codes, dtype=np.uint8))
+        save_array(os.path.join(path, 'terms.npy'), np.asarray(self.terms, dtype=np.float32))
+        save_array(os.path.join(path, 'ids.npy'), np.asarray(self.ids, dtype=np.int64))
+        save_array(os.path.join(path, 'offsets.npy'), np.asarray(self.offsets, dtype=np.int64))
+        if embeddings and self.embeddings is not None:
+            save_array(os.path.join(path, 'embeddings.npy'), np.asarray(self.embeddings, dtype=np.float32))
+        with open(os.path.join(path, 'ivfpq.json'), 'w') as f:
+            json.dump({'nprobe': self.nprobe, 'refine': self.refine}, f, indent=2)
+
+
+def build_index(embeddings, nrof_lists=0, nrof_subspaces=16, nrof_train=65536, nrof_iter=20,
+                keep_embeddings=True, nprobe=8, refine=4, seed=0):
+    """Train the coarse and product quantizers on a sample of embeddings and encode all of them.
+
+    nrof_lists defaults to 4 * sqrt(len(embeddings)). The embedding size must
+    be a multiple of nrof_subspaces.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    nrof_embeddings, embedding_size = embeddings.shape
+    if embedding_size % nrof_subspaces != 0:
+        raise ValueError('The embedding size %d is not a multiple of nrof_subspaces=%d' % (embedding_size, nrof_subspaces))
+    if nrof_lists <= 0:
+        nrof_lists = int(4 * np.sqrt(nrof_embeddings))
+    random_state = np.random.RandomState(seed)
+    train = embeddings[random_state.choice(nrof_embeddings, min(nrof_train, nrof_embeddings), replace=False)]
+    nrof_lists = min(nrof_lists, len(train))
+    nrof_codes = min(256, len(train))
+
+    coarse_centroids = kmeans(train, nrof_lists, nrof_iter, random_state)
+    train_residuals = train - coarse_centroids[assign(train, coarse_centroids)]
+    subspace_dim = embedding_size // nrof_subspaces
+    pq_centroids = np.stack([kmeans(train_residuals[:, j * subspace_dim:(j + 1) * subspace_dim], nrof_codes,
+                                    nrof_iter, random_state) for j in range(nrof_subspaces)])
+
+    lists, codes, terms = encode(embeddings, coarse_centroids, pq_centroids)
+    # Store the lists contiguously
+    ids = np.argsort(lists, kind='stable')
+    offsets = np.searchsorted(lists[ids], np.arange(nrof_lists + 1))
+    return IVFPQIndex(coarse_centroids, pq_centroids, codes[ids], terms[ids], ids, offsets,
+                      embeddings if keep_embeddings else None, nprobe, refine)
+
+
+def is_index(path):
+    return os.path.isfile(os.path.join(path, 'ivfpq.json'))
+
+
+def load_index(path, mmap=True, embeddings=None):
+    # embeddings replaces the saved ones, e.g. with the memory-mapped embeddings of a gallery
+    with open(os.path.join(path, 'ivfpq.json')) as f:
+        meta = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    embeddings_file = os.path.join(path, 'embeddings.npy')
+    if embeddings is None and os.path.isfile(embeddings_file):
+        embeddings = np.load(embeddings_file, mmap_mode=mmap_mode)
+    return IVFPQIndex(np.load(os.path.join(path, 'coarse_centroids.npy')),
+                      np.load(os.path.join(path, 'pq_centroids.npy')),
+                      np.load(os.path.join(path, 'codes.npy'), mmap_mode=mmap_mode),
+                      np.load(os.path.join(path, 'terms.npy'), mmap_mode=mmap_mode),
+                      np.load(os.path.join(path, 'ids.npy'), mmap_mode=mmap_mode),
+                      np.load(os.path.join(path, 'offsets.npy')),
+                      embeddings, meta['nprobe'], meta['refine'])
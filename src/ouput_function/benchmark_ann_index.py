@@ -0,0 +1,116 @@
+"""Recall and speed of the IVF-PQ index against exact search."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+import ann_index
+import gallery_index
+
+
+def synthetic_embeddings(random_state, nrof_embeddings, nrof_identities, embedding_size=128, noise=0.5):
+    # Unit vectors clustered around one random center per identity, like FaceNet embeddings
+    centers = random_state.randn(nrof_identities, embedding_size)
+    labels = random_state.randint(0, nrof_identities, nrof_embeddings)
+    embeddings = centers[labels] + noise * random_state.randn(nrof_embeddings, embedding_size)
+    return gallery_index.l2_normalize(embeddings), centers, labels
+
+def load_embeddings(path):
+    # A gallery folder or a .npy file of embeddings
+    if os.path.isdir(path):
+        return gallery_index.l2_normalize(gallery_index.load_gallery(path, mmap=False).embeddings)
+    return gallery_index.l2_normalize(np.load(path))
+
+def exact_search(embeddings, queries, k, batch_size=256):
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), batch_size):
+        scores = np.dot(queries[start:start + batch_size], embeddings.T)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        ids[start:start + batch_size] = np.take_along_axis(top, order, axis=1)
+    return ids
+
+def recall(ids, exact_ids, k):
+    # Fraction of the exact k nearest neighbours found in the k results
+    return np.mean([len(np.intersect1d(a[:k], b[:k])) / float(k) for a, b in zip(ids, exact_ids)])
+
+def main(args):
+    random_state = np.random.RandomState(0)
+    if args.embeddings is not None:
+        embeddings = load_embeddings(args.embeddings)
+        # Queries are noisy copies of gallery embeddings
+        queries = embeddings[random_state.choice(len(embeddings), args.nrof_queries)]
+        queries = gallery_index.l2_normalize(queries + 0.05 * random_state.randn(*queries.shape))
+    else:
+        embeddings, centers, _ = synthetic_embeddings(random_state, args.nrof_embeddings, args.nrof_identities)
+        queries = gallery_index.l2_normalize(centers[random_state.randint(0, len(centers), args.nrof_queries)]
+                                             + 0.5 * random_state.randn(args.nrof_queries, embeddings.shape[1]))
+    print('%d embeddings of size %d, %d queries, k=%d' % (len(embeddings), embeddings.shape[1], len(queries), args.k))
+
+    start = time.time()
+    exact_ids = exact_search(embeddings, queries, args.k)
+    exact_time = time.time() - start
+    print('%-24s %8.0f queries/s' % ('exact', len(queries) / exact_time))
+
+    start = time.time()
+    index = ann_index.build_index(embeddings, args.nrof_lists, args.nrof_subspaces)
+    print('Built IVF-PQ index with %d lists and %d sub-quantizers in %.1f s' % (
+        len(index.coarse_centroids), args.nrof_subspaces, time.time() - start))
+
+    for refine in [0, args.refine]:
+        for nprobe in args.nprobes:
+            start = time.time()
+            ids, _ = index.search(queries, args.k, nprobe, refine)
+            elapsed = time.time() - start
+            print('nprobe=%-4d refine=%-3d recall@1=%.3f recall@%d=%.3f %8.0f queries/s (%.1fx)' % (
+                nprobe, refine, recall(ids, exact_ids, 1), args.k, recall(ids, exact_ids, args.k),
+                len(queries) / elapsed, exact_time / elapsed))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--embeddings', type=str,
+                        help='Gallery folder or .npy file of embeddings, synthetic embeddings if not set', default=None)
+    parser.add_argument('--nrof_embeddings', type=int,
+                        help='Number of synthetic embeddings', default=200000)
+    parser.add_argument('--nrof_identities', type=int,
+                        help='Number of synthetic identities', default=100000)
+    parser.add_argument('--nrof_queries', type=int,
+                        help='Number of queries', default=1000)
+    parser.add_argument('--k', type=int,
+                        help='Number of neighbours per query', default=10)
+    parser.add_argument('--nrof_lists', type=int,
+                        help='Number of inverted lists, 0 picks it from the number of embeddings', default=0)
+    parser.add_argument('--nrof_subspaces', type=int,
+                        help='Number of sub-quantizers (bytes per embedding)', default=16)
+    parser.add_argument('--nprobes', type=int, nargs='+',
+                        help='Number of lists scanned per query', default=[1, 4, 16, 64])
+    parser.add_argument('--refine', type=int,
+                        help='Candidates re-ranked with the exact distance, as a multiple of k', default=4)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
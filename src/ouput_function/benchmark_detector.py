@@ -0,0 +1,103 @@
+"""Detector latency and recall of MTCNN at several detection resolutions."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+import warnings
+warnings.filterwarnings("ignore")
+
+import face_detection
+import face_tracker
+from mtcnn import MTCNN
+
+
+def read_sample_frames(input_video, nrof_frames):
+    # Frames spread evenly over the whole video
+    cap = cv2.VideoCapture(input_video)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    for index in np.linspace(0, max(frame_count - 1, 0), nrof_frames).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret == True:
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+def detect_boxes(detector, frames, detect_max_side, min_confidence):
+    # Boxes found in every frame and the detector latency of every frame
+    boxes, latencies = [], []
+    for img in frames:
+        start = time.time()
+        results = face_detection.detect_faces(detector, img, detect_max_side)
+        latencies.append(time.time() - start)
+        boxes.append([face['box'] for face in results if face['confidence'] >= min_confidence])
+    return boxes, latencies
+
+def main(args):
+    frames = read_sample_frames(args.input_video, args.nrof_frames)
+    if len(frames) == 0:
+        raise ValueError('No frame could be read from "%s"' % args.input_video)
+    height, width = frames[0].shape[:2]
+    print('Benchmarking %d frames of %dx%d' % (len(frames), width, height))
+
+    detector = MTCNN()
+    # Warm up the networks so graph building is not timed
+    face_detection.detect_faces(detector, frames[0])
+
+    # Detections at full resolution are the reference for the recall
+    reference, latencies = detect_boxes(detector, frames, 0, args.min_confidence)
+    nrof_reference = sum(len(boxes) for boxes in reference)
+    print('%10s %10s %10s %10s %8s' % ('max side', 'mean ms', 'p50 ms', 'p95 ms', 'recall'))
+    print('%10s %10.1f %10.1f %10.1f %8s' % ('full', 1000 * np.mean(latencies), 1000 * np.percentile(latencies, 50),
+                                              1000 * np.percentile(latencies, 95), '1.000'))
+    for max_side in args.max_sides:
+        boxes, latencies = detect_boxes(detector, frames, max_side, args.min_confidence)
+        nrof_found = sum(len(face_tracker.match_boxes(ref_boxes, found_boxes, args.iou_threshold))
+                         for ref_boxes, found_boxes in zip(reference, boxes))
+        recall = nrof_found / nrof_reference if nrof_reference > 0 else float('nan')
+        print('%10d %10.1f %10.1f %10.1f %8.3f' % (max_side, 1000 * np.mean(latencies),
+                                                   1000 * np.percentile(latencies, 50),
+                                                   1000 * np.percentile(latencies, 95), recall))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('input_video', type=str,
+                        help='Path to the video')
+    parser.add_argument('--nrof_frames', type=int,
+                        help='Number of frames sampled evenly from the video', default=50)
+    parser.add_argument('--max_sides', type=int, nargs='+',
+                        help='Detection long sides to benchmark against the full resolution',
+                        default=[1080, 720, 540, 360])
+    parser.add_argument('--min_confidence', type=float,
+                        help='Minimum MTCNN confidence of a face', default=0.8)
+    parser.add_argument('--iou_threshold', type=float,
+                        help='Minimum IoU with a full resolution face to count it as found', default=0.5)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
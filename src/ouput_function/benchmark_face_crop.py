@@ -0,0 +1,108 @@
+"""Microbenchmark of the face crop path: PIL per face against batched OpenCV."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+import face_crop
+
+
+def crop_faces_pil(img, boxes, image_size=160, margin=44):
+    # Previous path of extract_faces and load_image, one face at a time
+    faces = []
+    for x1, y1, width, height in boxes:
+        x1, y1 = abs(x1), abs(y1)
+        x2, y2 = x1 + width, y1 + height
+        x1 = x1 - margin / 2 if x1 - margin / 2 > 0 else 0
+        y1 = y1 - margin / 2 if y1 - margin / 2 > 0 else 0
+        x2 = x2 + margin / 2 if x2 + margin / 2 < img.shape[1] else img.shape[1]
+        y2 = y2 + margin / 2 if y2 + margin / 2 < img.shape[0] else img.shape[0]
+        face = Image.fromarray(img[int(y1):int(y2), int(x1):int(x2)])
+        face = face.resize((image_size, image_size)).convert('RGB')
+        faces.append(np.asarray(face))
+    return faces
+
+def load_images_pil(faces, image_size=160):
+    images = np.zeros((len(faces), image_size, image_size, 3), dtype=np.float32)
+    for i, face in enumerate(faces):
+        image = np.zeros((1, image_size, image_size, 3))
+        mean, std = np.mean(face), np.std(face)
+        std_adj = np.maximum(std, 1.0 / np.sqrt(face.size))
+        image[0] = np.multiply(np.subtract(face, mean), 1 / std_adj)
+        images[i] = image[0]
+    return images
+
+def random_boxes(random_state, shape, nrof_faces, min_size, max_size):
+    sizes = random_state.randint(min_size, max_size, nrof_faces)
+    x = random_state.randint(0, shape[1] - max_size, nrof_faces)
+    y = random_state.randint(0, shape[0] - max_size, nrof_faces)
+    return [[int(a), int(b), int(s), int(s * 1.2)] for a, b, s in zip(x, y, sizes)]
+
+def main(args):
+    random_state = np.random.RandomState(0)
+    img = random_state.randint(0, 256, (args.height, args.width, 3)).astype(np.uint8)
+    boxes = random_boxes(random_state, img.shape, args.nrof_faces, args.min_face_size, args.max_face_size)
+
+    def run_pil():
+        return load_images_pil(crop_faces_pil(img, boxes))
+
+    def run_batch():
+        return face_crop.load_batch(face_crop.crop_faces(img, boxes))
+
+    print('%d faces of %d-%d pixels in a %dx%d frame' % (args.nrof_faces, args.min_face_size, args.max_face_size,
+                                                          args.width, args.height))
+    timings = {}
+    for name, run in [('PIL per face', run_pil), ('OpenCV batch', run_batch)]:
+        run()
+        start = time.time()
+        for _ in range(args.nrof_runs):
+            images = run()
+        timings[name] = (time.time() - start) / args.nrof_runs
+        print('%14s: %8.2f ms per frame, %6.3f ms per face' % (
+            name, 1000 * timings[name], 1000 * timings[name] / args.nrof_faces))
+    print('Speed-up: %.2fx' % (timings['PIL per face'] / timings['OpenCV batch']))
+    # Both paths only differ by the resize interpolation
+    print('Mean absolute difference of the prewhitened batches: %.3f' % np.mean(np.abs(run_pil() - images)))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--width', type=int,
+                        help='Width of the synthetic frame', default=1920)
+    parser.add_argument('--height', type=int,
+                        help='Height of the synthetic frame', default=1080)
+    parser.add_argument('--nrof_faces', type=int,
+                        help='Number of faces per frame', default=16)
+    parser.add_argument('--min_face_size', type=int,
+                        help='Smallest face width in pixels', default=60)
+    parser.add_argument('--max_face_size', type=int,
+                        help='Largest face width in pixels', default=300)
+    parser.add_argument('--nrof_runs', type=int,
+                        help='Number of timed frames', default=100)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
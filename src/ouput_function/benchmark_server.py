@@ -0,0 +1,114 @@
+"""Load generator reporting latency and throughput of face_server.py."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import json
+import time
+import argparse
+import socket
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    "HTTP client connection over a Unix socket"
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(args):
+    if args.socket:
+        return UnixHTTPConnection(args.socket)
+    return http.client.HTTPConnection(args.host, args.port, timeout=60)
+
+def request(args, body):
+    # Latency of one request on a new connection
+    path = '/identify?crop=1' if args.crop else '/identify'
+    conn = connect(args)
+    start = time.time()
+    conn.request('POST', path, body, {'Content-Type': 'application/octet-stream'})
+    response = conn.getresponse()
+    response.read()
+    latency = time.time() - start
+    conn.close()
+    if response.status != 200:
+        raise RuntimeError('Server answered %d' % response.status)
+    return latency
+
+def server_stats(args):
+    conn = connect(args)
+    conn.request('GET', '/stats')
+    stats = json.loads(conn.getresponse().read())
+    conn.close()
+    return stats
+
+def main(args):
+    bodies = []
+    for image_path in args.image_paths:
+        with open(image_path, 'rb') as f:
+            bodies.append(f.read())
+    # Warm up the server before timing
+    request(args, bodies[0])
+
+    print('%12s %10s %10s %10s' % ('concurrency', 'p50 ms', 'p99 ms', 'req/s'))
+    for concurrency in args.concurrency:
+        before = server_stats(args)
+        start = time.time()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(lambda i: request(args, bodies[i % len(bodies)]), range(args.nrof_requests)))
+        wall_time = time.time() - start
+        after = server_stats(args)
+        nrof_batches = after['nrof_batches'] - before['nrof_batches']
+        mean_batch = (after['nrof_faces'] - before['nrof_faces']) / nrof_batches if nrof_batches > 0 else 0.0
+        print('%12d %10.1f %10.1f %10.1f   (mean batch %.1f faces)' % (
+            concurrency, 1000 * np.percentile(latencies, 50), 1000 * np.percentile(latencies, 99),
+            len(latencies) / wall_time, mean_batch))
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('image_paths', type=str, nargs='+',
+                        help='Images sent in turn as request bodies')
+    parser.add_argument('--host', type=str,
+                        help='Address of the server', default='127.0.0.1')
+    parser.add_argument('--port', type=int,
+                        help='Port of the server', default=8000)
+    parser.add_argument('--socket', type=str,
+                        help='Unix socket of the server instead of host and port', default='')
+    parser.add_argument('--crop', action='store_true',
+                        help='The images are aligned face crops, skip the detection')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        help='Numbers of concurrent clients to benchmark', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--nrof_requests', type=int,
+                        help='Number of requests at every concurrency level', default=200)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
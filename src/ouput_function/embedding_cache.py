@@ -0,0 +1,92 @@
+"""Reuse the embedding of a face crop that barely changed since an earlier frame."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+
+def difference_hash(face, hash_size=8):
+    # 64 bit perceptual hash: sign of the horizontal gradients of a tiny grayscale copy
+    face = np.asarray(face, dtype=np.uint8)
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(face, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')
+
+
+class EmbeddingCache():
+    """LRU cache of the embedding and prediction of recently seen face crops.
+
+    An entry is keyed by the difference hash of the aligned crop and the
+    bucket of its box position, bucket_size pixels wide. A crop hits when an
+    entry of the same bucket has a hash at most max_distance bits away, so a
+    face that stays still is embedded once while a face moving to another
+    place of the frame is always embedded again. At most capacity entries
+    are kept, the least recently used one is dropped first.
+    """
+
+    def __init__(self, capacity=256, max_distance=4, bucket_size=32):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.bucket_size = bucket_size
+        self.entries = OrderedDict()
+        self.nrof_hits = 0
+        self.nrof_misses = 0
+
+    def _bucket(self, bbox):
+        x, y, w, h = bbox
+        return (int(x + w / 2) // self.bucket_size, int(y + h / 2) // self.bucket_size,
+                int(w) // self.bucket_size)
+
+    def get(self, face, bbox):
+        """Returns the key of the crop and the cached value, None when it is a miss."""
+        key = (self._bucket(bbox), difference_hash(face))
+        found = key if key in self.entries else None
+        if found is None and self.max_distance > 0:
+            for entry_key in reversed(self.entries):
+                if entry_key[0] == key[0] and hamming_distance(entry_key[1], key[1]) <= self.max_distance:
+                    found = entry_key
+                    break
+        if found is None:
+            self.nrof_misses += 1
+            return key, None
+        self.nrof_hits += 1
+        self.entries.move_to_end(found)
+        return key, self.entries[found]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def report(self, file=sys.stdout):
+        total = self.nrof_hits + self.nrof_misses
+        hit_rate = 100.0 * self.nrof_hits / total if total > 0 else 0.0
+        print('Embedding cache: %d hits, %d misses (%.1f%% of embeddings reused)' % (
+            self.nrof_hits, self.nrof_misses, hit_rate), file=file)
@@ -0,0 +1,142 @@
+"""On-disk embeddings of image files, reused by later classifier training runs."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import json
+import hashlib
+import numpy as np
+
+import ann_index
+
+# get() result for an image where MTCNN found no face, it is not detected again
+NO_FACE = 'no face'
+
+
+def file_key(path):
+    # An image is embedded again when its size or modification time changes
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def model_fingerprint(model_files, **options):
+    """Hash of the model files (names, sizes, modification times) and of the preprocessing options.
+
+    model_files are only the files the model is loaded from, other files of
+    the model folder (e.g. classifier outputs) must not change the hash.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(os.path.abspath(os.path.expanduser(path)) for path in model_files):
+        if os.path.isfile(path):
+            digest.update(json.dumps([path] + file_key(path)).encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class EmbeddingStore():
+    """Embeddings of image files keyed by absolute path, size and modification time.
+
+    The float32 matrix is memory-mapped and index.json maps every path to its
+    row. A store written for another model fingerprint is ignored, as are
+    images whose size or modification time changed. An image without a face
+    is stored with the row -1. New embeddings are kept in memory until
+    save(), which rewrites the matrix with the images read or embedded in this
+    run only, the entries of deleted or unused images are dropped.
+    """
+
+    def __init__(self, path, fingerprint, invalidate=False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.embeddings = None
+        self.entries = {}
+        self.new_embeddings = []
+        # Paths read or embedded since the store was opened, the ones save() keeps
+        self.used = set()
+        self.nrof_hits = 0
+        self.nrof_misses = 0
+        index_file = os.path.join(path, 'index.json')
+        if not invalidate and os.path.isfile(index_file):
+            with open(index_file) as f:
+                index = json.load(f)
+            if index['fingerprint'] == fingerprint:
+                self.entries = index['entries']
+                self.embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode='r')
+
+    def _nrof_rows(self):
+        # Rows of the memory-mapped matrix, the new embeddings come after them
+        return 0 if self.embeddings is None else len(self.embeddings)
+
+    def get(self, image_path):
+        # Stored embedding of the image, NO_FACE when it has no face, None when it has to be embedded
+        image_path = os.path.abspath(image_path)
+        entry = self.entries.get(image_path)
+        if entry is not None and entry[1:] == file_key(image_path):
+            self.nrof_hits += 1
+            self.used.add(image_path)
+            if entry[0] < 0:
+                return NO_FACE
+            if entry[0] >= self._nrof_rows():
+                return self.new_embeddings[entry[0] - self._nrof_rows()]
+            return np.asarray(self.embeddings[entry[0]])
+        self.nrof_misses += 1
+        return None
+
+    def put(self, image_path, embedding):
+        # embedding is None for an image without a face
+        image_path = os.path.abspath(image_path)
+        self.used.add(image_path)
+        if embedding is None:
+            self.entries[image_path] = [-1] + file_key(image_path)
+            return
+        self.entries[image_path] = [self._nrof_rows() + len(self.new_embeddings)] + file_key(image_path)
+        self.new_embeddings.append(np.asarray(embedding, dtype=np.float32).reshape(-1))
+
+    def save(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        nrof_rows = self._nrof_rows()
+        used = sorted(p for p in self.entries if p in self.used)
+        no_face = [p for p in used if self.entries[p][0] < 0]
+        paths = [p for p in used if self.entries[p][0] >= 0]
+        rows = np.array([self.entries[p][0] for p in paths], dtype=np.int64)
+        embeddings = np.zeros((len(paths), self.embedding_size()), dtype=np.float32)
+        old = rows < nrof_rows
+        if np.any(old):
+            embeddings[old] = self.embeddings[rows[old]]
+        if np.any(~old):
+            embeddings[~old] = np.stack(self.new_embeddings)[rows[~old] - nrof_rows]
+        ann_index.save_array(os.path.join(self.path, 'embeddings.npy'), embeddings)
+        entries = {p: [i] + self.entries[p][1:] for i, p in enumerate(paths)}
+        entries.update((p, self.entries[p]) for p in no_face)
+        tmp_file = os.path.join(self.path, 'index.json.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump({'fingerprint': self.fingerprint, 'entries': entries}, f)
+        os.replace(tmp_file, os.path.join(self.path, 'index.json'))
+        self.embeddings = np.load(os.path.join(self.path, 'embeddings.npy'), mmap_mode='r')
+        self.entries = entries
+        self.new_embeddings = []
+
+    def embedding_size(self):
+        if len(self.new_embeddings) > 0:
+            return len(self.new_embeddings[0])
+        return 0 if self.embeddings is None else self.embeddings.shape[1]
+
+    def report(self):
+        print('Embedding store "%s": %d images loaded, %d embedded' % (self.path, self.nrof_hits, self.nrof_misses))
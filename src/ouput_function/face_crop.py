@@ -0,0 +1,92 @@
+"""Crop, resize and prewhiten the detected faces of an image as whole batches."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import threading
+import cv2
+import numpy as np
+
+
+def clamp_boxes(boxes, shape, margin=44):
+    """(x1, y1, x2, y2) pixel boxes of MTCNN (x, y, w, h) boxes, grown by margin
+    and clamped to an image of the given shape, for all boxes at once."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    height, width = shape[:2]
+    # MTCNN can return slightly negative corners
+    x1, y1 = np.abs(boxes[:, 0]), np.abs(boxes[:, 1])
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    x1 = np.clip(x1 - margin / 2, 0, width - 1)
+    y1 = np.clip(y1 - margin / 2, 0, height - 1)
+    x2 = np.clip(x2 + margin / 2, x1 + 1, width)
+    y2 = np.clip(y2 + margin / 2, y1 + 1, height)
+    return np.stack([x1, y1, x2, y2], axis=1).astype(np.int32)
+
+
+def crop_faces(img, boxes, image_size=160, margin=44):
+    # uint8 (N, image_size, image_size, 3) crops, every face is resized by OpenCV straight into its slot
+    boxes = clamp_boxes(boxes, img.shape, margin)
+    faces = np.empty((len(boxes), image_size, image_size, 3), dtype=np.uint8)
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        interpolation = cv2.INTER_AREA if x2 - x1 > image_size else cv2.INTER_CUBIC
+        cv2.resize(img[y1:y2, x1:x2], (image_size, image_size), dst=faces[i], interpolation=interpolation)
+    return faces
+
+
+def prewhiten_batch(images):
+    # facenet.prewhiten of every image of a float32 batch, in place
+    flat = images.reshape(len(images), -1)
+    mean = flat.mean(axis=1, keepdims=True)
+    std = np.maximum(flat.std(axis=1, keepdims=True), 1.0 / np.sqrt(flat.shape[1]))
+    flat -= mean
+    flat /= std
+    return images
+
+
+class FaceBatch():
+    """float32 (N, image_size, image_size, 3) buffer reused from one batch to the next.
+
+    The buffer only grows, so once warm no batch allocates memory. A batch is a
+    view of the buffer and is overwritten by the next load().
+    """
+
+    def __init__(self, image_size=160):
+        self.image_size = image_size
+        self.buffer = np.empty((0, image_size, image_size, 3), dtype=np.float32)
+
+    def load(self, faces, do_prewhiten=True):
+        if len(faces) > len(self.buffer):
+            self.buffer = np.empty((len(faces), self.image_size, self.image_size, 3), dtype=np.float32)
+        images = self.buffer[:len(faces)]
+        for i, face in enumerate(faces):
+            if face.ndim == 2:
+                face = face[:, :, np.newaxis]
+            images[i] = face
+        if do_prewhiten:
+            prewhiten_batch(images)
+        return images
+
+
+_batches = threading.local()
+
+def load_batch(faces, image_size=160, do_prewhiten=True):
+    # Batch of the FaceBatch of the calling thread, so pipeline stages never share a buffer
+    if getattr(_batches, 'batch', None) is None or _batches.batch.image_size != image_size:
+        _batches.batch = FaceBatch(image_size)
+    return _batches.batch.load(faces, do_prewhiten)
@@ -0,0 +1,44 @@
+"""Run MTCNN on a downscaled copy of a frame and map the results back."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import cv2
+
+
+def detect_faces(detector, img, detect_max_side=0):
+    """Same results as detector.detect_faces(img), in the coordinates of img.
+
+    When the long side of img is above detect_max_side, MTCNN runs on a resized
+    copy, which makes the P-Net image pyramid much cheaper on 4K input. Boxes
+    and keypoints are scaled back, so the crops can still be cut from the full
+    resolution image. 0 disables the resize.
+    """
+    long_side = max(img.shape[0], img.shape[1])
+    if detect_max_side <= 0 or long_side <= detect_max_side:
+        return detector.detect_faces(img)
+    scale = detect_max_side / long_side
+    small = cv2.resize(img, (int(round(img.shape[1] * scale)), int(round(img.shape[0] * scale))),
+                       interpolation=cv2.INTER_AREA)
+    results = detector.detect_faces(small)
+    for face in results:
+        face['box'] = [int(round(v / scale)) for v in face['box']]
+        face['keypoints'] = {name: (int(round(x / scale)), int(round(y / scale)))
+                             for name, (x, y) in face['keypoints'].items()}
+    return results
@@ -0,0 +1,205 @@
+"""Importable face search engine that keeps its models loaded between inputs."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import argparse
+import multiprocessing
+import cv2
+import tensorflow.compat.v1 as tf
+
+import facenet
+import face_timeline
+import find_person_in_video_triplet_model as video_search
+import video_writer
+from mtcnn import MTCNN
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class FaceSearch():
+    """Owns the MTCNN detector, the facenet embedder and the classifier.
+
+    The models are loaded once and every process_* call runs through the same
+    warm session, so a batch job over many short clips only pays the
+    TensorFlow start up once. options are the optional arguments of
+    find_person_in_video_triplet_model (threshold, id, frame_skip,
+    detect_every, cache_size, ...).
+
+    The classifier is read in the constructor, the model, the session and
+    the detector only in load(). run_parallel() forks worker processes from
+    an engine that has not been loaded, see its docstring.
+    """
+
+    def __init__(self, model_path, model_classfier_path, **options):
+        self.args = video_search.parse_arguments([model_path, model_classfier_path, '', ''])
+        for name, value in options.items():
+            if not hasattr(self.args, name):
+                raise TypeError('Unknown FaceSearch option "%s"' % name)
+            setattr(self.args, name, value)
+        self.model, self.class_names = video_search.load_model_classfier(model_classfier_path, model_path)
+        # Bytes of a .tflite embedder read by run_parallel() before forking
+        self.model_content = None
+        self.sess = None
+        self.detector = None
+
+    def load(self, nrof_threads=0):
+        if self.sess is not None:
+            return
+        config = tf.ConfigProto(intra_op_parallelism_threads=nrof_threads, inter_op_parallelism_threads=nrof_threads)
+        graph = tf.Graph()
+        self.sess = tf.Session(graph=graph, config=config)
+        with tf.device('/GPU:0'):
+            with graph.as_default():
+                with self.sess.as_default():
+                    if self.model_content is not None:
+                        facenet.load_tflite_model(self.args.model_path, model_content=self.model_content)
+                    else:
+                        facenet.load_model(self.args.model_path)
+                    self.detector = MTCNN()
+
+    def close(self):
+        if self.sess is not None:
+            self.sess.close()
+            self.sess, self.detector = None, None
+
+    def _options(self, **overrides):
+        args = argparse.Namespace(**vars(self.args))
+        for name, value in overrides.items():
+            setattr(args, name, value)
+        return args
+
+    def process_frames(self, images):
+        """Returns a record (frame_number, bboxs, class_indices, class_probabilities) per BGR image."""
+        self.load()
+        records = []
+
+        def write_frames(frames):
+            records.extend(video_search.frame_record(frame) for frame in frames)
+
+        frames = ({'frame_number': i, 'image': image, 'sampled': True} for i, image in enumerate(images))
+        video_search.run_pipeline(self._options(export_video=False), self.sess, self.detector, self.model, 1,
+                                  write_frames, report=False, frames=frames)
+        return records
+
+    def process_image(self, image):
+        # image is a BGR array or the path of an image file
+        if isinstance(image, str):
+            image = cv2.imread(image)
+            if image is None:
+                raise ValueError('Can not read image')
+        return self.process_frames([image])[0]
+
+    def process_video(self, input_video, output_loc=None, export_video=False):
+        """Returns the records of the sampled frames of input_video.
+
+        With output_loc the timeline, and with export_video the annotated
+        video, are written to that folder like the command line script does.
+        """
+        self.load()
+        args = self._options(input_video=input_video, export_video=export_video and output_loc is not None)
+        cap = cv2.VideoCapture(input_video)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        frame_skip = args.frame_skip if args.frame_skip > 0 else int(fps)
+        writer, timeline = None, None
+        if output_loc is not None:
+            if not os.path.isdir(output_loc):
+                os.makedirs(output_loc)
+            timeline = face_timeline.TimelineWriter(os.path.join(output_loc, 'timeline.' + args.timeline_format),
+                                                    self.class_names, fps, args.timeline_gap, args.threshold * 100,
+                                                    args.id)
+            if args.export_video:
+                writer = video_writer.FFmpegWriter(os.path.join(output_loc, 'result_vid_with_audio.mp4'),
+                                                   input_video, fps)
+        records = []
+
+        def write_frames(frames):
+            for frame in frames:
+                if writer is not None:
+                    writer.write(video_search.draw_frame(frame, args.id, self.class_names, args.threshold))
+                if frame['sampled']:
+                    records.append(video_search.frame_record(frame))
+                    if timeline is not None:
+                        video_search.log_frame(frame, timeline)
+
+        try:
+            video_search.run_pipeline(args, self.sess, self.detector, self.model, frame_skip, write_frames,
+                                      report=False)
+        finally:
+            if writer is not None:
+                writer.close()
+            if timeline is not None:
+                timeline.close()
+        return records
+
+    def process(self, path, output_loc=None, export_video=False):
+        # Dispatch on the file extension, every video gets its own folder under output_loc
+        if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+            return self.process_image(path)
+        if output_loc is not None:
+            output_loc = os.path.join(output_loc, os.path.splitext(os.path.basename(path))[0])
+        return self.process_video(path, output_loc, export_video)
+
+    def run(self, inputs, output_loc=None, export_video=False):
+        """Yields (path, result) for every path of inputs through the warm models.
+
+        inputs can be any iterable, e.g. iter(queue.get, None) to serve a queue
+        until a None is put.
+        """
+        for path in inputs:
+            yield path, self.process(path, output_loc, export_video)
+
+    def run_parallel(self, inputs, nrof_workers, output_loc=None, export_video=False):
+        """Same as run() on a pool of nrof_workers forked processes, results come back in input order.
+
+        The embedder must be a .tflite model (quantize_model.py). Its bytes
+        are read here and the workers are forked from this engine, so they
+        share the classifier and the embedder weights copy-on-write: the
+        interpreter of a worker runs on the constant tensors of the parent
+        buffer. A TensorFlow session is not fork safe and holds its own copy
+        of the weights, so the engine must not have been loaded (no session,
+        no process_* call) and every worker only builds its session, the
+        small MTCNN networks and the interpreter after the fork.
+        """
+        if not self.args.model_path.endswith('.tflite'):
+            raise ValueError('run_parallel shares the weights of a .tflite embedder, convert "%s" with '
+                             'quantize_model.py' % self.args.model_path)
+        if self.sess is not None:
+            raise ValueError('run_parallel forks the engine, it must be called before load() or any process_* call')
+        with open(self.args.model_path, 'rb') as f:
+            self.model_content = f.read()
+        nrof_threads = max(multiprocessing.cpu_count() // nrof_workers, 1)
+        global _engine
+        _engine = self
+        with multiprocessing.get_context('fork').Pool(nrof_workers, _init_worker, (nrof_threads,)) as pool:
+            for result in pool.imap(_process_in_worker, ((path, output_loc, export_video) for path in inputs)):
+                yield result
+
+
+# Engine forked from the parent by run_parallel
+_engine = None
+
+def _init_worker(nrof_threads):
+    _engine.load(nrof_threads)
+
+def _process_in_worker(item):
+    path, output_loc, export_video = item
+    return path, _engine.process(path, output_loc, export_video)
@@ -0,0 +1,250 @@
+"""Local HTTP server identifying faces with cross-request dynamic batching."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import cv2
+import numpy as np
+
+import face_search
+import find_person_in_video_triplet_model as video_search
+
+
+class DynamicBatcher():
+    """Runs func on the items of concurrent callers at once.
+
+    A batch is started as soon as a caller submits, then waits at most
+    max_wait seconds for other callers while it holds less than
+    max_batch_size items. A caller whose items would go over max_batch_size
+    starts the next batch, and a caller with more than max_batch_size items is
+    split into chunks of at most max_batch_size, so no batch is larger. func
+    gets the list of all items and must return one result per item, every
+    caller gets back the results of its own items.
+    """
+
+    def __init__(self, func, max_batch_size=32, max_wait=0.005):
+        self.func = func
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.carry = None
+        self.nrof_batches = 0
+        self.nrof_items = 0
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def submit(self, items):
+        # Blocks until the results of items are ready
+        if len(items) == 0:
+            return []
+        requests = [{'items': items[start:start + self.max_batch_size], 'done': threading.Event(), 'results': None,
+                     'error': None} for start in range(0, len(items), self.max_batch_size)]
+        for request in requests:
+            self.queue.put(request)
+        results = []
+        for request in requests:
+            request['done'].wait()
+            if request['error'] is not None:
+                raise request['error']
+            results.extend(request['results'])
+        return results
+
+    def _next_batch(self):
+        requests = [self.carry if self.carry is not None else self.queue.get()]
+        self.carry = None
+        size = len(requests[0]['items'])
+        deadline = time.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if size + len(request['items']) > self.max_batch_size:
+                self.carry = request
+                break
+            requests.append(request)
+            size += len(request['items'])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+            items = [item for request in requests for item in request['items']]
+            try:
+                results = self.func(items)
+            except Exception as e:
+                for request in requests:
+                    request['error'] = e
+            else:
+                start = 0
+                for request in requests:
+                    request['results'] = results[start:start + len(request['items'])]
+                    start += len(request['items'])
+            self.nrof_batches += 1
+            self.nrof_items += len(items)
+            for request in requests:
+                request['done'].set()
+
+
+class FaceServer():
+    "Detection and identification of the HTTP handlers, the embedder is shared through the batcher"
+
+    def __init__(self, engine, max_batch_size=32, max_wait=0.005, detect_max_side=0):
+        self.engine = engine
+        self.engine.load()
+        self.detect_max_side = detect_max_side
+        # MTCNN is not thread safe, detections of concurrent requests run one at a time
+        self.detect_lock = threading.Lock()
+        self.batcher = DynamicBatcher(self._identify, max_batch_size, max_wait)
+
+    def _identify(self, faces):
+        # The default session is per thread, enter it on the batcher and handler threads
+        with self.engine.sess.as_default(), self.engine.sess.graph.as_default():
+            class_indices, class_probabilities = video_search.identify_faces(faces, self.engine.model,
+                                                                             self.engine.sess, len(faces))
+        return list(zip(class_indices, class_probabilities))
+
+    def identify(self, image, crop=False):
+        """Faces of a BGR image, or of an aligned face crop when crop is set."""
+        if crop:
+            face = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (160, 160), interpolation=cv2.INTER_AREA)
+            faces, bboxs = [face], [None]
+        else:
+            with self.detect_lock:
+                with self.engine.sess.as_default(), self.engine.sess.graph.as_default():
+                    faces, bboxs = video_search.extract_faces(image, self.engine.detector, image_size=160,
+                                                              detect_max_side=self.detect_max_side)
+        results = self.batcher.submit(faces)
+        return [{'bbox': [int(v) for v in bbox] if bbox is not None else None,
+                 'class_index': int(class_index), 'name': self.engine.class_names[class_index],
+                 'probability': round(float(class_probability), 2)}
+                for bbox, (class_index, class_probability) in zip(bboxs, results)]
+
+    def stats(self):
+        batcher = self.batcher
+        mean_batch = batcher.nrof_items / batcher.nrof_batches if batcher.nrof_batches > 0 else 0.0
+        return {'nrof_batches': batcher.nrof_batches, 'nrof_faces': batcher.nrof_items,
+                'mean_batch_size': round(mean_batch, 2)}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """POST /identify with an encoded image as body, add ?crop=1 for an aligned face crop.
+    GET /stats returns the batching statistics."""
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/stats':
+            return self._reply(404, {'error': 'Unknown path'})
+        self._reply(200, self.server.face_server.stats())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/identify':
+            return self._reply(404, {'error': 'Unknown path'})
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return self._reply(400, {'error': 'Can not decode image'})
+        crop = parse_qs(url.query).get('crop', ['0'])[0] not in ('0', 'false', '')
+        try:
+            faces = self.server.face_server.identify(image, crop)
+        except Exception as e:
+            return self._reply(500, {'error': str(e)})
+        self._reply(200, {'faces': faces})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+def main(args):
+    engine = face_search.FaceSearch(args.model_path, args.model_classfier_path)
+    print('Loading models')
+    face_server = FaceServer(engine, args.max_batch_size, args.max_wait_ms / 1000.0, args.detect_max_side)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, RequestHandler)
+        print('Serving on unix socket %s' % args.socket)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        print('Serving on http://%s:%d' % (args.host, args.port))
+    server.face_server = face_server
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.close()
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('model_path', type=str,
+                        help='Path to the facenet model training with triplet')
+    parser.add_argument('model_classfier_path', type=str,
+                        help='Path to the classfier model')
+    parser.add_argument('--host', type=str,
+                        help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('--port', type=int,
+                        help='Port to listen on', default=8000)
+    parser.add_argument('--socket', type=str,
+                        help='Listen on this unix socket instead of host and port', default='')
+    parser.add_argument('--max_batch_size', type=int,
+                        help='Maximum number of faces of concurrent requests embedded together', default=32)
+    parser.add_argument('--max_wait_ms', type=float,
+                        help='Maximum time a batch waits for other requests in milliseconds', default=5)
+    parser.add_argument('--detect_max_side', type=int,
+                        help='Run MTCNN on a copy of the image resized to this long side, 0 uses the full resolution',
+                        default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,125 @@
+"""Merge the recognised faces of a video into per identity time intervals."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import csv
+import json
+
+
+class Interval():
+    "Consecutive appearances of one identity"
+
+    def __init__(self, class_index, time, probability, bbox):
+        self.class_index = class_index
+        self.start = self.end = time
+        self.nrof_frames = 1
+        self.max_probability = self.sum_probability = probability
+        self.bbox = bbox
+
+    def extend(self, time, probability, bbox):
+        self.end = time
+        self.nrof_frames += 1
+        self.sum_probability += probability
+        if probability > self.max_probability:
+            self.max_probability, self.bbox = probability, bbox
+
+
+class TimelineWriter():
+    """Buffers the appearances of every identity for the whole run.
+
+    A detection extends the open interval of its identity when it comes at
+    most gap seconds after the end of that interval, otherwise the interval is
+    closed and a new one starts. Closed intervals are kept in memory and
+    written every flush_every intervals, so the output file is opened once and
+    written in large blocks. Only faces above threshold (in percent, like the
+    class probabilities) and, when id is not -1, of class id are kept. The
+    output is JSON lines or CSV depending on the extension of output_file, one
+    interval per row with its start and end in seconds, the identity, the max
+    and mean probability and the bbox of the best detection.
+    """
+
+    fields = ['start', 'end', 'class_index', 'name', 'nrof_frames', 'max_probability', 'mean_probability', 'bbox']
+
+    def __init__(self, output_file, class_names, fps, gap=2.0, threshold=50.0, id=-1, flush_every=100):
+        self.output_file = output_file
+        self.class_names = class_names
+        self.fps = fps
+        self.gap = gap
+        self.threshold = threshold
+        self.id = id
+        self.flush_every = flush_every
+        self.format = 'csv' if os.path.splitext(output_file)[1].lower() == '.csv' else 'jsonl'
+        self.open_intervals = {}
+        self.closed_intervals = []
+        self.nrof_intervals = 0
+        self.file = open(output_file, 'w', newline='')
+        self.writer = None
+        if self.format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.fields)
+
+    def add(self, frame_number, bboxs, class_indices, class_probabilities):
+        time = frame_number / self.fps
+        # Best face of every accepted identity in the frame
+        best = {}
+        for bbox, class_index, class_probability in zip(bboxs, class_indices, class_probabilities):
+            if class_probability <= self.threshold or (self.id != -1 and class_index != self.id):
+                continue
+            if class_index not in best or class_probability > best[class_index][0]:
+                best[class_index] = (float(class_probability), [int(v) for v in bbox])
+        for class_index, (probability, bbox) in best.items():
+            interval = self.open_intervals.get(class_index)
+            if interval is not None and time - interval.end <= self.gap:
+                interval.extend(time, probability, bbox)
+            else:
+                if interval is not None:
+                    self.closed_intervals.append(interval)
+                self.open_intervals[class_index] = Interval(class_index, time, probability, bbox)
+        # Close the intervals that can no longer be extended
+        for class_index, interval in list(self.open_intervals.items()):
+            if time - interval.end > self.gap:
+                self.closed_intervals.append(self.open_intervals.pop(class_index))
+        if len(self.closed_intervals) >= self.flush_every:
+            self.flush()
+
+    def _row(self, interval):
+        return [round(interval.start, 2), round(interval.end, 2), int(interval.class_index),
+                self.class_names[interval.class_index], interval.nrof_frames,
+                round(interval.max_probability, 2), round(interval.sum_probability / interval.nrof_frames, 2),
+                interval.bbox]
+
+    def flush(self):
+        intervals = sorted(self.closed_intervals, key=lambda interval: interval.start)
+        self.closed_intervals = []
+        if self.format == 'csv':
+            self.writer.writerows([row[:-1] + [' '.join(str(v) for v in row[-1])]
+                                   for row in map(self._row, intervals)])
+        else:
+            self.file.write(''.join(json.dumps(dict(zip(self.fields, self._row(interval)))) + '\n'
+                                    for interval in intervals))
+        self.nrof_intervals += len(intervals)
+        self.file.flush()
+
+    def close(self):
+        self.closed_intervals.extend(self.open_intervals.values())
+        self.open_intervals = {}
+        self.flush()
+        self.file.close()
@@ -0,0 +1,183 @@
+"""Follow detected faces across frames so detection and embedding run less often."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import cv2
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    # Intersection over union of every pair of (x, y, w, h) boxes
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+    y2 = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+    inter = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    union = (a[:, None, 2] * a[:, None, 3]) + (b[None, :, 2] * b[None, :, 3]) - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def match_boxes(boxes_a, boxes_b, threshold=0.3):
+    # Greedy matching, best overlap first
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return []
+    iou = iou_matrix(boxes_a, boxes_b)
+    matches = []
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < threshold:
+            break
+        matches.append((int(i), int(j)))
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return matches
+
+
+class Track():
+    "A face followed across frames"
+
+    def __init__(self, track_id, bbox):
+        self.track_id = track_id
+        self.bbox = [float(v) for v in bbox]
+
+    def int_bbox(self):
+        return [int(round(v)) for v in self.bbox]
+
+
+class FaceTracker():
+    """Runs the detector every detect_every frames and optical flow in between.
+
+    Between two detections every track is moved with the median Lucas-Kanade
+    flow of the corners found inside its box. A track that keeps fewer than
+    min_points corners is lost and forces a detection on the same frame. On a
+    detection frame the detections are matched to the tracks by IoU: matched
+    tracks keep their id (and so their identity), the others are dropped and
+    unmatched detections start new tracks, the only faces that need to be
+    embedded.
+    """
+
+    def __init__(self, detect_every=5, iou_threshold=0.3, min_points=4, max_corners=30):
+        self.detect_every = max(int(detect_every), 1)
+        self.iou_threshold = iou_threshold
+        self.min_points = min_points
+        self.max_corners = max_corners
+        self.tracks = []
+        self.prev_gray = None
+        self.next_track_id = 0
+        self.since_detection = 0
+        self.nrof_frames = 0
+        self.nrof_detections = 0
+        self.nrof_new_tracks = 0
+
+    def _flow(self, gray):
+        # Move every track with the optical flow, returns False once a track is lost
+        height, width = gray.shape
+        for track in self.tracks:
+            x, y, w, h = track.bbox
+            x1, y1 = int(max(x, 0)), int(max(y, 0))
+            x2, y2 = int(min(x + w, width)), int(min(y + h, height))
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                return False
+            mask = np.zeros_like(self.prev_gray)
+            mask[y1:y2, x1:x2] = 255
+            points = cv2.goodFeaturesToTrack(self.prev_gray, self.max_corners, 0.01, 3, mask=mask)
+            if points is None or len(points) < self.min_points:
+                return False
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, points, None)
+            status = status.reshape(-1) == 1
+            if np.count_nonzero(status) < self.min_points:
+                return False
+            old = points.reshape(-1, 2)[status]
+            new = new_points.reshape(-1, 2)[status]
+            dx, dy = np.median(new - old, axis=0)
+            old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            valid = old_spread > 1e-3
+            scale = np.median(new_spread[valid] / old_spread[valid]) if np.any(valid) else 1.0
+            cx, cy = x + w / 2 + dx, y + h / 2 + dy
+            w, h = w * scale, h * scale
+            track.bbox = [cx - w / 2, cy - h / 2, w, h]
+        return True
+
+    def update(self, image, detect):
+        """Follow the faces into a new frame.
+
+        detect(image) must return the face crops and (x, y, w, h) boxes of the
+        detector. Returns the boxes and track ids of every face in the frame,
+        the crops and track ids of the new tracks and the ids of the tracks
+        that ended.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.nrof_frames += 1
+        self.since_detection += 1
+        tracked = (self.prev_gray is not None and self.since_detection < self.detect_every
+                   and self._flow(gray))
+        self.prev_gray = gray
+        if tracked:
+            return [track.int_bbox() for track in self.tracks], [track.track_id for track in self.tracks], [], [], []
+
+        self.nrof_detections += 1
+        self.since_detection = 0
+        faces, bboxs = detect(image)
+        matches = match_boxes([track.bbox for track in self.tracks], bboxs, self.iou_threshold)
+        tracks = [None] * len(bboxs)
+        for i, j in matches:
+            tracks[j] = self.tracks[i]
+            tracks[j].bbox = [float(v) for v in bboxs[j]]
+        matched = set(i for i, _ in matches)
+        ended_ids = [track.track_id for i, track in enumerate(self.tracks) if i not in matched]
+        new_faces, new_ids = [], []
+        for j in range(len(bboxs)):
+            if tracks[j] is None:
+                tracks[j] = Track(self.next_track_id, bboxs[j])
+                self.next_track_id += 1
+                new_faces.append(faces[j])
+                new_ids.append(tracks[j].track_id)
+        self.nrof_new_tracks += len(new_ids)
+        self.tracks = tracks
+        return list(bboxs), [track.track_id for track in tracks], new_faces, new_ids, ended_ids
+
+    def report(self, file=sys.stdout):
+        saved = 100.0 * (1 - self.nrof_detections / self.nrof_frames) if self.nrof_frames > 0 else 0.0
+        print('Face tracker: detector ran on %d of %d frames (%.1f%% of detector calls saved), %d tracks identified' % (
+            self.nrof_detections, self.nrof_frames, saved, self.nrof_new_tracks), file=file)
+
+
+class TrackIdentities():
+    "Identity computed once per track and propagated to its later frames"
+
+    def __init__(self):
+        self.identities = {}
+
+    def add(self, track_ids, class_indices, class_probabilities):
+        for track_id, class_index, class_probability in zip(track_ids, class_indices, class_probabilities):
+            self.identities[track_id] = (class_index, class_probability)
+
+    def lookup(self, track_ids):
+        class_indices = [self.identities[track_id][0] for track_id in track_ids]
+        class_probabilities = [self.identities[track_id][1] for track_id in track_ids]
+        return class_indices, class_probabilities
+
+    def forget(self, track_ids):
+        for track_id in track_ids:
+            self.identities.pop(track_id, None)
@@ -20,51 +20,28 @@
 #  SOFTWARE.
 
 import sys
-import os
 import numpy as np
 import cv2
-import pickle
 import argparse
 import tensorflow as tf
 import warnings
 import matplotlib.pyplot as plt
 warnings.filterwarnings("ignore")
 
+import face_crop
+import softmax_model
+import face_detection
 from mtcnn import MTCNN
-from PIL import Image
 
 
-def extract_faces(img_array, detector, image_size=160, margin=44):
-    faces_list, bbox = [], []
+def extract_faces(img_array, detector, image_size=160, margin=44, detect_max_side=0):
     # convert channel
     img = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
 
-    results = detector.detect_faces(img)
-    # extract the bounding box from the first face
-    for face in results:
-        confidence = face['confidence']
-        if confidence < 0.8:
-            continue
-        face_bbox = face['box']
-        x1, y1, width, height = face_bbox
-
-        # bug fix
-        x1, y1 = abs(x1), abs(y1)
-        x2, y2 = x1 + width, y1 + height
-
-        x1 = x1 - margin / 2 if x1 - margin / 2 > 0 else 0
-        y1 = y1 - margin / 2 if y1 - margin / 2 > 0 else 0
-        x2 = x2 + margin / 2 if x2 + margin / 2 < img.shape[1] else img.shape[1]
-        y2 = y2 + margin / 2 if y2 + margin / 2 < img.shape[0] else img.shape[0]
-        x1, x2, y1, y2 = int(x1), int(x2), int(y1), int(y2)
-
-        # extract the face
-        face = img[y1:y2, x1:x2]
-        # resize pixels to the model size
-        face = Image.fromarray(face)
-        face = face.resize((image_size,image_size))
-        faces_list.append(face)
-        bbox.append(face_bbox)
+    results = face_detection.detect_faces(detector, img, detect_max_side)
+    # keep the confident faces and crop them all from the full resolution image
+    bbox = [face['box'] for face in results if face['confidence'] >= 0.8]
+    faces_list = face_crop.crop_faces(img, bbox, image_size, margin)
 
     return faces_list, bbox
 
@@ -75,19 +52,17 @@ def draw_bbox(image,bbox,text):
               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
   return image
 
-def detect_face(image, id, model ,detector, threshold=0.5):
-    # Get model and class_names
-    model, class_names = model
+def detect_face(image, id, model ,detector, threshold=0.5, detect_max_side=0):
+    # Get model, class_names and the gallery index if any
+    model, class_names, gallery = model
     # create the detector, using default weights
-    faces_list, bboxs_list = extract_faces(image, detector, image_size=160)
+    faces_list, bboxs_list = extract_faces(image, detector, image_size=160, detect_max_side=detect_max_side)
     # loop through each face in detections
     for i in range(len(faces_list)):
 
         # get embedded image
         # Get input and output tensors
-        img = faces_list[i].convert('RGB')
-        # resize image
-        img = tf.cast(np.array(img), tf.float32) / 255
+        img = tf.cast(faces_list[i], tf.float32) / 255
         # get embeddings for the faces in an image
         img = tf.expand_dims(img, axis=0)
 
@@ -97,6 +72,11 @@ def detect_face(image, id, model ,detector, threshold=0.5):
         bbox = bboxs_list[i]
 
         # get predict from model
+        if gallery is not None:
+            # predictions are embeddings, identify them in the gallery
+            class_index, class_probability = gallery.classify(predictions)
+            predictions = np.zeros((1, len(class_names)))
+            predictions[0, class_index] = class_probability / 100
         class_index = np.argmax(predictions, axis=1)
 
         # get label name
@@ -114,17 +94,17 @@ def main(args):
     with tf.device('/GPU:0'):
         # Load facenet model
         print('Loading feature extraction model')
-        model = tf.keras.models.load_model(args.model_path)
-        model.load_weights(args.model_weights_path)
+        model = softmax_model.load_softmax_model(args.model_path, args.model_weights_path)
         # Create mtcnn model
         detector = MTCNN()
         # Load class name
-        with open(args.class_names, 'rb') as infile:
-            class_names = pickle.load(infile)
+        class_names, gallery = softmax_model.load_class_names(args.class_names, args.model_path)
+        if gallery is not None:
+            model = softmax_model.embedding_model(model)
 
         image = cv2.imread(args.image_path)
 
-        image = detect_face(image, args.id, (model, class_names), detector, args.threshold)
+        image = detect_face(image, args.id, (model, class_names, gallery), detector, args.threshold, args.detect_max_side)
         plt.imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         plt.show()
 
@@ -134,15 +114,18 @@ def parse_arguments(argv):
     parser.add_argument('model_path', type=str,
                         help='Path to the facenet model training with softmax')
     parser.add_argument('model_weights_path', type=str,
-                        help='Path to the facenet model weights training with softmax')
+                        help='Path to the facenet model weights training with softmax, ignored for a .tflite model')
     parser.add_argument('class_names', type=str,
-                        help='Path to the class_names in training classifier model')
+                        help='Path to the class_names in training classifier model, or a gallery index folder')
     parser.add_argument('image_path', type=str,
                         help='Path to the image')
     parser.add_argument('--threshold', type=float,
                         help='Threshold for predict image', default=0.5)
     parser.add_argument('--id', type=int,
                         help='ID of specific person', default=0)
+    parser.add_argument('--detect_max_side', type=int,
+                        help='Run MTCNN on a copy of the image resized to this long side, 0 uses the full resolution',
+                        default=0)
     return parser.parse_args(argv)
 
 
@@ -24,49 +24,34 @@ import os
 import ffmpeg
 import numpy as np
 import cv2
-import pickle
 import argparse
 import tensorflow as tf
 import warnings
 warnings.filterwarnings("ignore")
 
+import face_tracker
+import face_crop
+import face_detection
+import frame_sampler
+import embedding_cache
+import softmax_model
+import motion_gate
+import face_timeline
+import video_pipeline
+import video_writer
 from mtcnn import MTCNN
 from moviepy.editor import *
 from tqdm import tqdm
 from datetime import datetime
-from PIL import Image
 
-def extract_faces(img_array, detector, image_size=160, margin=44):
-    faces_list, bbox = [], []
+def extract_faces(img_array, detector, image_size=160, margin=44, detect_max_side=0):
     # convert channel
     img = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
 
-    results = detector.detect_faces(img)
-    # extract the bounding box from the first face
-    for face in results:
-        confidence = face['confidence']
-        if confidence < 0.8:
-            continue
-        face_bbox = face['box']
-        x1, y1, width, height = face_bbox
-
-        # bug fix
-        x1, y1 = abs(x1), abs(y1)
-        x2, y2 = x1 + width, y1 + height
-
-        x1 = x1 - margin / 2 if x1 - margin / 2 > 0 else 0
-        y1 = y1 - margin / 2 if y1 - margin / 2 > 0 else 0
-        x2 = x2 + margin / 2 if x2 + margin / 2 < img.shape[1] else img.shape[1]
-        y2 = y2 + margin / 2 if y2 + margin / 2 < img.shape[0] else img.shape[0]
-        x1, x2, y1, y2 = int(x1), int(x2), int(y1), int(y2)
-
-        # extract the face
-        face = img[y1:y2, x1:x2]
-        # resize pixels to the model size
-        face = Image.fromarray(face)
-        face = face.resize((image_size,image_size))
-        faces_list.append(face)
-        bbox.append(face_bbox)
+    results = face_detection.detect_faces(detector, img, detect_max_side)
+    # keep the confident faces and crop them all from the full resolution image
+    bbox = [face['box'] for face in results if face['confidence'] >= 0.8]
+    faces_list = face_crop.crop_faces(img, bbox, image_size, margin)
 
     return faces_list, bbox
 
@@ -77,13 +62,6 @@ def draw_bbox(image,bbox,text):
               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
   return image
 
-def out_txt(output_loc,duration,text):
-    out_file = open(output_loc + '/list_faces.txt','a')
-    out_file.write(f'\nTime({duration}),{text}')
-    out_file.close()
-
-
-
 def out_video(images_video_dir,input_video, output_loc, fps=15):
     # Python code to convert video to audio
 
@@ -101,7 +79,7 @@ def out_video(images_video_dir,input_video, output_loc, fps=15):
     img = cv2.imread(filename)
     height, width, layers = img.shape
     size = (width, height)
-    out = cv2.VideoWriter(out_video, cv2.VideoWriter_fourcc(*'DIVX'), 30, size)
+    out = cv2.VideoWriter(out_video, cv2.VideoWriter_fourcc(*'DIVX'), fps, size)
     with tqdm(total=len(list_file) - 1, file=sys.stdout) as pbar:
       for i in range(1, len(list_file)):
           filename = f'{images_video_dir}/{i}.jpg'
@@ -118,74 +96,89 @@ def out_video(images_video_dir,input_video, output_loc, fps=15):
     os.remove(out_audio)
 
 
-def detect_face(image, id, frame_number,frame_count, fps, model, output_loc ,detector, export_video, threshold=0.5):
-    name_tag = ""
-    time_start = []
-    # Get model and class_names
-    model, class_names = model
-    # create the detector, using default weights
-    faces_list, bboxs_list = extract_faces(image, detector, image_size=160)
+def read_frames(sampler):
+    for index, frame, _ in sampler:
+        yield {'frame_number': index, 'image': frame}
+
+def detect_frame(frame, detector, tracker=None, gate=None, detect_max_side=0):
+    # Face Detection
+    if gate is not None and not gate.changed(frame['image']):
+        # Reuse the detections and identities of the last analysed frame
+        frame['same_as'] = gate.last_frame
+        frame['faces'], frame['bboxs'] = [], gate.last_frame['bboxs']
+        return frame
+    if gate is not None:
+        gate.last_frame = frame
+    if tracker is None:
+        frame['faces'], frame['bboxs'] = extract_faces(frame['image'], detector, image_size=160,
+                                                       detect_max_side=detect_max_side)
+    else:
+        # faces only holds the crops of the new tracks
+        (frame['bboxs'], frame['track_ids'], frame['faces'], frame['new_track_ids'],
+         frame['ended_track_ids']) = tracker.update(
+            frame['image'], lambda image: extract_faces(image, detector, image_size=160,
+                                           detect_max_side=detect_max_side))
+    return frame
+
+def face_bboxs(frame):
+    # Boxes of the crops in frame['faces'], only the new tracks when tracking, none for a gated frame
+    if 'same_as' in frame:
+        return []
+    if 'new_track_ids' not in frame:
+        return frame['bboxs']
+    return [frame['bboxs'][frame['track_ids'].index(track_id)] for track_id in frame['new_track_ids']]
+
+def predict_faces(faces, model, gallery=None):
+    images = np.asarray(faces, dtype=np.float32) / 255
+    predictions = model.predict(images)
+    if gallery is not None:
+        # predictions are embeddings, identify them in the gallery
+        return gallery.classify(predictions)
+    class_indices = np.argmax(predictions, axis=1)
+    class_probabilities = predictions[np.arange(len(class_indices)), class_indices] * 100
+    return class_indices, class_probabilities
+
+def identify_frame(frame, model, identities=None, cache=None, gallery=None):
+    if 'same_as' in frame:
+        frame['class_indices'] = frame['same_as']['class_indices']
+        frame['class_probabilities'] = frame['same_as']['class_probabilities']
+        return frame
+    # get predict from model for every face of the frame at once
+    class_indices, class_probabilities = [], []
+    if len(frame['faces']) > 0 and cache is None:
+        class_indices, class_probabilities = predict_faces(frame['faces'], model, gallery)
+    elif len(frame['faces']) > 0:
+        # Only predict the faces the cache has not seen
+        keys, values = zip(*[cache.get(face, bbox) for face, bbox in zip(frame['faces'], face_bboxs(frame))])
+        values = list(values)
+        misses = [i for i, value in enumerate(values) if value is None]
+        if len(misses) > 0:
+            miss_indices, miss_probabilities = predict_faces([frame['faces'][i] for i in misses], model, gallery)
+            for j, i in enumerate(misses):
+                values[i] = (miss_indices[j], miss_probabilities[j])
+                cache.put(keys[i], values[i])
+        class_indices = np.array([value[0] for value in values])
+        class_probabilities = np.array([value[1] for value in values])
+    if identities is None:
+        frame['class_indices'], frame['class_probabilities'] = class_indices, class_probabilities
+    else:
+        identities.add(frame['new_track_ids'], class_indices, class_probabilities)
+        frame['class_indices'], frame['class_probabilities'] = identities.lookup(frame['track_ids'])
+        identities.forget(frame['ended_track_ids'])
+    return frame
+
+def annotate_frame(frame, id, class_names, timeline, threshold=0.5):
+    image = frame['image']
+    threshold *= 100
+    timeline.add(frame['frame_number'], frame['bboxs'], frame['class_indices'], frame['class_probabilities'])
     # loop through each face in detections
-    if len(faces_list) == 0 and export_video:
-        image_path = os.path.join(output_loc, 'images')
-        cv2.imwrite(f'{image_path}/{frame_number}.jpg', image)
-        return
-    for i in range(len(faces_list)):
-
-        # get embedded image
-        # Get input and output tensors
-        img = faces_list[i].convert('RGB')
-        # resize image
-        img = tf.cast(np.array(img), tf.float32) / 255
-        # get embeddings for the faces in an image
-        img = tf.expand_dims(img, axis=0)
-
-        predictions = model.predict(img)
-
-        # get coordinates (x,y) and weight, height (w, h) of the bounding box
-        bbox = bboxs_list[i]
-
-        # get predict from model
-        class_index = np.argmax(predictions, axis=1)
-
-        # get label name
-        predict_name = class_names[class_index[0]]
-
-        # get probability
-        class_probability = predictions[0, class_index] * 100
-        threshold *= 100
-
+    for bbox, class_index, class_probability in zip(frame['bboxs'], frame['class_indices'],
+                                                    frame['class_probabilities']):
         # Accept with the probability > threshold
-
-        duration = round(frame_number / fps, 2)
-        time_cur = [int(duration / 3600), int((duration % 3600) / 60), (duration % 3600) % 60]
-
-        if id != -1:
-            if class_probability > threshold and class_index == id:
-                text = f'{predict_name}:{class_probability}'
-                dura = "{:0>2}:{:0>2}:{:0>2.0f}".format(time_cur[0], time_cur[1], time_cur[2])
-                out_txt(output_loc, dura, text)
-                image = draw_bbox(image, bbox, text)
-        elif class_probability > threshold:
-            text = f'{predict_name}:{class_probability}'
+        if class_probability > threshold and (id == -1 or class_index == id):
+            text = f'{class_names[class_index]}:{class_probability}'
             image = draw_bbox(image, bbox, text)
-            if name_tag == "":
-                name_tag, time_start = predict_name, time_cur
-            elif (name_tag != predict_name):
-                dura = "{:0>2}:{:0>2}:{:0>2.0f}-{:0>2}:{:0>2}:{:0>2.0f}".format(time_start[0], time_start[1],
-                                                                                time_start[2], time_cur[0], time_cur[1],
-                                                                                time_cur[2])
-                out_txt(output_loc, dura, name_tag)
-                # reset
-                name_tag, time_start = predict_name, time_cur
-
-    if export_video:
-        image_path = os.path.join(output_loc, 'images')
-        cv2.imwrite(f'{image_path}/{frame_number}.jpg', image)
-    if frame_number == frame_count and id == -1:
-        dura = "{:0>2}:{:0>2}:{:0>2.0f}-{:0>2}:{:0>2}:{:0>2.0f}".format(time_start[0], time_start[1], time_start[2],
-                                                                        time_cur[0], time_cur[1], time_cur[2])
-        out_txt(output_loc, dura, name_tag)
+    return image
 
 def main(args):
 
@@ -199,15 +192,15 @@ def main(args):
 
         # Load facenet model
         print('Loading feature extraction model')
-        model = tf.keras.models.load_model(args.model_path)
-        model.load_weights(args.model_weights_path)
+        model = softmax_model.load_softmax_model(args.model_path, args.model_weights_path)
 
         # Create mtcnn model
         detector = MTCNN()
 
         # Load class name
-        with open(args.class_names, 'rb') as infile:
-            class_names = pickle.load(infile)
+        class_names, gallery = softmax_model.load_class_names(args.class_names, args.model_path)
+        if gallery is not None:
+            model = softmax_model.embedding_model(model)
 
         # Read video
         cap = cv2.VideoCapture(args.input_video)
@@ -222,38 +215,64 @@ def main(args):
         if args.export_video:
             frame_skip=1
         frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_number = 0
+        sampler = frame_sampler.FrameSampler(cap, frame_skip, frame_sampler.estimate_gop_size(args.input_video))
         print(frame_skip)
-        # Not finding an exact face
-
 
-        # Create folder images for export video
-        if args.export_video:
+        # Create folder images or the encoder for export video
+        writer = None
+        if args.export_video and args.render_mode == 'images':
             images_video_dir = os.path.join(output_loc, 'images')
             os.mkdir(images_video_dir)
+        elif args.export_video:
+            writer = video_writer.FFmpegWriter(os.path.join(output_loc, 'result_vid_with_audio.mp4'),
+                                               args.input_video, fps)
+        timeline = face_timeline.TimelineWriter(os.path.join(output_loc, 'timeline.' + args.timeline_format),
+                                                class_names, fps, args.timeline_gap, args.threshold * 100, args.id)
         print('Processing video...')
         with tqdm(total=(frame_count//frame_skip), file=sys.stdout) as pbar:
-            while cap.isOpened():
-                # Extract the frame
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                ret, frame = cap.read()
-                if ret == True:
-                    # Face Detection
-                    detect_face(frame, args.id, frame_number,frame_count, fps,
-                                (model, class_names), output_loc,
-                                detector, args.export_video, args.threshold)
-                    if args.export_video:
-                        img_path = f'{images_video_dir}/{frame_number}.jpg'
-                        cv2.imwrite(img_path, frame)
-                    frame_number += frame_skip
-                else:
-                    break
+            def write_frame(frame):
+                image = annotate_frame(frame, args.id, class_names, timeline, args.threshold)
+                if writer is not None:
+                    writer.write(image)
+                elif args.export_video:
+                    cv2.imwrite(f'{images_video_dir}/{frame["frame_number"]}.jpg', image)
                 pbar.update(1)
+
+            tracker, identities = None, None
+            if args.detect_every > 0:
+                tracker = face_tracker.FaceTracker(args.detect_every)
+                identities = face_tracker.TrackIdentities()
+            gate = None
+            if args.motion_threshold > 0:
+                gate = motion_gate.MotionGate(args.motion_threshold)
+            cache = None
+            if args.cache_size > 0:
+                cache = embedding_cache.EmbeddingCache(args.cache_size, args.cache_distance)
+            pipeline = video_pipeline.Pipeline(
+                read_frames(sampler),
+                [video_pipeline.Stage('detect', lambda frame: detect_frame(frame, detector, tracker, gate,
+                                                                             args.detect_max_side)),
+                 video_pipeline.Stage('embed', lambda frame: identify_frame(frame, model, identities, cache, gallery)),
+                 video_pipeline.Stage('write', write_frame)],
+                queue_size=args.queue_size)
+            pipeline.run()
         cap.release()
-        print('Successful write .txt file')
+        sampler.report()
+        if tracker is not None:
+            tracker.report()
+        if gate is not None:
+            gate.report()
+        if cache is not None:
+            cache.report()
+        pipeline.report()
+        timeline.close()
+        print('Successful write timeline file: %d intervals' % timeline.nrof_intervals)
 
         # Export video
-        if args.export_video:
+        if writer is not None:
+            writer.close()
+            print('Successful export .mp4 file: ')
+        elif args.export_video:
             print('Rendering video...')
             out_video(images_video_dir, args.input_video, output_loc, fps)
             print('Successful export .mp4 file: ')
@@ -264,9 +283,9 @@ def parse_arguments(argv):
     parser.add_argument('model_path', type=str,
                         help='Path to the facenet model training with softmax')
     parser.add_argument('model_weights_path', type=str,
-                        help='Path to the facenet model weights training with softmax')
+                        help='Path to the facenet model weights training with softmax, ignored for a .tflite model')
     parser.add_argument('class_names', type=str,
-                        help='Path to the class_names in training classifier model')
+                        help='Path to the class_names in training classifier model, or a gallery index folder')
     parser.add_argument('input_video', type=str,
                         help='Video for extract face')
     parser.add_argument('output_loc', type=str,
@@ -279,6 +298,28 @@ def parse_arguments(argv):
                         help='Threshold for predict image', default=0.5)
     parser.add_argument('--id', type=int,
                         help='ID of specific person', default=-1)
+    parser.add_argument('--timeline_format', type=str, choices=['jsonl', 'csv'],
+                        help='Format of the timeline of recognised faces', default='jsonl')
+    parser.add_argument('--timeline_gap', type=float,
+                        help='Maximum gap in seconds between two appearances merged into one interval', default=2.0)
+    parser.add_argument('--detect_max_side', type=int,
+                        help='Run MTCNN on a copy of the frame resized to this long side, 0 uses the full resolution',
+                        default=0)
+    parser.add_argument('--detect_every', type=int,
+                        help='Run MTCNN every N sampled frames and track the faces in between, 0 disables tracking',
+                        default=0)
+    parser.add_argument('--cache_size', type=int,
+                        help='Number of face crops whose prediction is kept for reuse, 0 disables the cache', default=0)
+    parser.add_argument('--cache_distance', type=int,
+                        help='Maximum number of differing bits between the perceptual hashes of two crops '
+                             'considered the same face', default=4)
+    parser.add_argument('--motion_threshold', type=float,
+                        help='Reuse the last detections when the mean pixel change of a downscaled gray frame '
+                             'is below this value (0-255), 0 disables the gate', default=0)
+    parser.add_argument('--render_mode', type=str, choices=['stream', 'images'],
+                        help='stream pipes the frames into ffmpeg, images writes a JPEG per frame first', default='stream')
+    parser.add_argument('--queue_size', type=int,
+                        help='Maximum number of items waiting between two pipeline stages', default=8)
     return parser.parse_args(argv)
 
 
@@ -26,18 +26,41 @@ import numpy as np
 import cv2
 import pickle
 import argparse
+import multiprocessing
 import tensorflow.compat.v1 as tf
 import warnings
 warnings.filterwarnings("ignore")
 
 import facenet
+import face_tracker
+import face_crop
+import face_detection
+import frame_sampler
+import embedding_cache
+import gallery_index
+import linear_classifier
+import motion_gate
+import face_timeline
+import video_pipeline
+import video_writer
 from mtcnn import MTCNN
 from moviepy.editor import *
 from tqdm import tqdm
 from datetime import datetime
-from PIL import Image
 
-def load_model_classfier(model_path):
+def load_model_classfier(model_path, facenet_model_path=None):
+    if os.path.isdir(model_path) and gallery_index.is_gallery(model_path):
+        # Gallery of enrolled embeddings searched with a matrix product instead of the SVM,
+        # it must have been embedded by the facenet model of facenet_model_path
+        model = gallery_index.model_info('triplet', facenet_model_path) if facenet_model_path is not None else None
+        gallery = gallery_index.load_gallery(model_path, model=model)
+        print('Loaded gallery of %d faces from "%s"' % (len(gallery.labels), model_path))
+        return gallery, gallery.class_names_with_unknown()
+    if linear_classifier.is_linear_classifier(model_path):
+        # numpy export of a linear model, same predict_proba without the sklearn overhead
+        model = linear_classifier.load_linear_classifier(model_path)
+        print('Loaded linear classifier from file "%s"' % model_path)
+        return model, model.class_names
     with open(model_path, 'rb') as infile:
         model = pickle.load(infile)
         class_names = pickle.load(infile)
@@ -45,65 +68,57 @@ def load_model_classfier(model_path):
 
     return model, class_names
 
-def extract_faces(img_array, detector, image_size=160, margin=44):
-    faces_list, bbox = [], []
+def extract_faces(img_array, detector, image_size=160, margin=44, detect_max_side=0):
     # convert channel
     img = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
 
-    results = detector.detect_faces(img)
-    # extract the bounding box from the first face
-    for face in results:
-        confidence = face['confidence']
-        if confidence < 0.8:
-            continue
-        face_bbox = face['box']
-        x1, y1, width, height = face_bbox
-
-        # bug fix
-        x1, y1 = abs(x1), abs(y1)
-        x2, y2 = x1 + width, y1 + height
-
-        x1 = x1 - margin / 2 if x1 - margin / 2 > 0 else 0
-        y1 = y1 - margin / 2 if y1 - margin / 2 > 0 else 0
-        x2 = x2 + margin / 2 if x2 + margin / 2 < img.shape[1] else img.shape[1]
-        y2 = y2 + margin / 2 if y2 + margin / 2 < img.shape[0] else img.shape[0]
-        x1, x2, y1, y2 = int(x1), int(x2), int(y1), int(y2)
-
-        # extract the face
-        face = img[y1:y2, x1:x2]
-        # resize pixels to the model size
-        face = Image.fromarray(face)
-        face = face.resize((image_size,image_size))
-        face = face.convert('RGB')
-        face = np.asarray(face)
-        faces_list.append(face)
-        bbox.append(face_bbox)
+    results = face_detection.detect_faces(detector, img, detect_max_side)
+    # keep the confident faces and crop them all from the full resolution image
+    bbox = [face['box'] for face in results if face['confidence'] >= 0.8]
+    faces_list = face_crop.crop_faces(img, bbox, image_size, margin)
 
     return faces_list, bbox
 
-def load_image(img, image_size, do_prewhiten=True):
-    image = np.zeros((1, image_size, image_size, 3))
-    if img.ndim == 2:
-        img = facenet.to_rgb(img)
-    if do_prewhiten:
-        img = facenet.prewhiten(img)
-    img = facenet.crop(img,False, image_size)
-    img = facenet.flip(img, False)
-    image[0,:,:,:] = img
-    return image
-
-
-
-
-def get_embedding(image_path,sess,image_size=160):
+def get_embeddings(faces, sess, image_size=160, batch_size=64):
     # Get input and output tensors
     images_placeholder = tf.get_default_graph().get_tensor_by_name("input:0")
     embeddings = tf.get_default_graph().get_tensor_by_name("embeddings:0")
-    phase_train_placeholder = tf.get_default_graph().get_tensor_by_name("phase_train:0")
-    images = load_image(image_path, image_size)
-    feed_dict = {images_placeholder: images, phase_train_placeholder: False}
-    emb_array= sess.run(embeddings, feed_dict=feed_dict)
-    return emb_array
+    phase_train_feed = facenet.phase_train_feed()
+    # Prewhitened float32 batch of every face crop, in a buffer reused from one call to the next
+    images = face_crop.load_batch(faces, image_size)
+    # Run the network once per batch of at most batch_size faces
+    emb_list = []
+    for start in range(0, len(images), batch_size):
+        feed_dict = {images_placeholder: images[start:start + batch_size]}
+        feed_dict.update(phase_train_feed)
+        emb_list.append(sess.run(embeddings, feed_dict=feed_dict))
+    return np.concatenate(emb_list, axis=0)
+
+def classify_embeddings(embedded_imgs, model):
+    if isinstance(model, gallery_index.GalleryIndex):
+        return model.classify(embedded_imgs)
+    predictions = model.predict_proba(embedded_imgs)
+    class_index = np.argmax(predictions, axis=1)
+    class_probability = predictions[np.arange(len(class_index)), class_index] * 100
+    return class_index, class_probability
+
+def identify_faces(faces, model, sess, batch_size=64, bboxs=None, cache=None):
+    # Embed and classify all faces with one predict_proba call
+    if len(faces) == 0:
+        return np.zeros((0,), dtype=np.int64), np.zeros((0,))
+    if cache is None:
+        return classify_embeddings(get_embeddings(faces, sess, batch_size=batch_size), model)
+    # Only embed the faces the cache has not seen
+    keys, values = zip(*[cache.get(face, bbox) for face, bbox in zip(faces, bboxs)])
+    values = list(values)
+    misses = [i for i, value in enumerate(values) if value is None]
+    if len(misses) > 0:
+        embedded_imgs = get_embeddings([faces[i] for i in misses], sess, batch_size=batch_size)
+        class_index, class_probability = classify_embeddings(embedded_imgs, model)
+        for j, i in enumerate(misses):
+            values[i] = (embedded_imgs[j], class_index[j], class_probability[j])
+            cache.put(keys[i], values[i])
+    return np.array([value[1] for value in values]), np.array([value[2] for value in values])
 
 def draw_bbox(image,bbox,text):
   x,y,w,h = bbox
@@ -112,13 +127,6 @@ def draw_bbox(image,bbox,text):
               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 3)
   return image
 
-def out_txt(output_loc,duration,text):
-    out_file = open(output_loc + '/list_faces.txt','a')
-    out_file.write(f'\nTime({duration}),{text}')
-    out_file.close()
-
-
-
 def out_video(images_video_dir,input_video, output_loc, fps=15):
     # Python code to convert video to audio
 
@@ -136,7 +144,7 @@ def out_video(images_video_dir,input_video, output_loc, fps=15):
     img = cv2.imread(filename)
     height, width, layers = img.shape
     size = (width, height)
-    out = cv2.VideoWriter(out_video, cv2.VideoWriter_fourcc(*'DIVX'), 30, size)
+    out = cv2.VideoWriter(out_video, cv2.VideoWriter_fourcc(*'DIVX'), fps, size)
     with tqdm(total=len(list_file) - 1, file=sys.stdout) as pbar:
       for i in range(1, len(list_file)):
           filename = f'{images_video_dir}/{i}.jpg'
@@ -153,70 +161,223 @@ def out_video(images_video_dir,input_video, output_loc, fps=15):
     os.remove(out_audio)
 
 
-def detect_face(image, id, frame_number,frame_count, fps, model, output_loc ,detector,sess, export_video, threshold=0.5):
-    name_tag = ""
-    time_start = []
-    # Get model and class_names
-    model, class_names = model
-    # create the detector, using default weights
-    faces_list, bboxs_list = extract_faces(image, detector, image_size=160)
-    # loop through each face in detections
-    if len(faces_list) == 0 and export_video:
-        image_path = os.path.join(output_loc, 'images')
-        cv2.imwrite(f'{image_path}/{frame_number}.jpg', image)
-        return
-    for i in range(len(faces_list)):
-
-        # get embedded image
-        embedded_img = get_embedding(faces_list[i],sess)
-
-        # get coordinates (x,y) and weight, height (w, h) of the bounding box
-        bbox = bboxs_list[i]
-
-        # get predict from model
-        predictions = model.predict_proba(embedded_img)
-        class_index = np.argmax(predictions, axis=1)
-
-        # get label name
-        predict_name = class_names[class_index[0]]
-
-        # get probability
-        class_probability = predictions[0, class_index] * 100
-        threshold *= 100
-
-        # Accept with the probability > threshold
-
-        duration = round(frame_number / fps, 2)
-        time_cur = [int(duration / 3600), int((duration % 3600) / 60), (duration % 3600) % 60]
-
-        if id != -1:
-            if class_probability > threshold and class_index == id:
-                text = f'{predict_name}:{class_probability}'
-                dura = "{:0>2}:{:0>2}:{:0>2.0f}".format(time_cur[0], time_cur[1], time_cur[2])
-                out_txt(output_loc, dura, text)
+def read_frames(sampler):
+    # Frames are numbered from 1 in this script
+    for index, frame, sampled in sampler:
+        yield {'frame_number': index + 1, 'image': frame, 'sampled': sampled}
+
+def detect_frame(frame, detector, sess, tracker=None, gate=None, detect_max_side=0):
+    # Face Detection
+    if frame['sampled'] and gate is not None and not gate.changed(frame['image']):
+        # Reuse the detections and identities of the last analysed frame
+        frame['same_as'] = gate.last_frame
+        frame['faces'], frame['bboxs'] = [], gate.last_frame['bboxs']
+    elif frame['sampled']:
+        if gate is not None:
+            gate.last_frame = frame
+        # The default session is per thread, MTCNN must find the one its variables were initialized in
+        with sess.as_default(), sess.graph.as_default():
+            if tracker is None:
+                frame['faces'], frame['bboxs'] = extract_faces(frame['image'], detector, image_size=160,
+                                                               detect_max_side=detect_max_side)
+            else:
+                # faces only holds the crops of the new tracks
+                (frame['bboxs'], frame['track_ids'], frame['faces'], frame['new_track_ids'],
+                 frame['ended_track_ids']) = tracker.update(
+                    frame['image'], lambda image: extract_faces(image, detector, image_size=160,
+                                                   detect_max_side=detect_max_side))
+    return frame
+
+def face_bboxs(frame):
+    # Boxes of the crops in frame['faces'], only the new tracks when tracking, none for a gated frame
+    if 'same_as' in frame:
+        return []
+    if 'new_track_ids' not in frame:
+        return frame['bboxs']
+    return [frame['bboxs'][frame['track_ids'].index(track_id)] for track_id in frame['new_track_ids']]
+
+class FrameEmbedder():
+    "Collects frame_batch sampled frames and identifies all their faces at once"
+
+    def __init__(self, model, sess, frame_batch=1, batch_size=64, identities=None, cache=None):
+        self.model = model
+        self.sess = sess
+        self.frame_batch = frame_batch
+        self.batch_size = batch_size
+        self.identities = identities
+        self.cache = cache
+        self.frames = []
+        self.nrof_sampled = 0
+
+    def __call__(self, frame):
+        self.frames.append(frame)
+        if frame['sampled']:
+            self.nrof_sampled += 1
+        if self.nrof_sampled < self.frame_batch:
+            return None
+        return self.flush()
+
+    def flush(self):
+        frames, self.frames, self.nrof_sampled = self.frames, [], 0
+        if len(frames) == 0:
+            return None
+        sampled = [frame for frame in frames if frame['sampled']]
+        faces_list = [face for frame in sampled for face in frame['faces']]
+        bboxs_list = [bbox for frame in sampled for bbox in face_bboxs(frame)]
+        # get predict from model for every face of every frame at once
+        with self.sess.graph.as_default():
+            class_indices, class_probabilities = identify_faces(faces_list, self.model, self.sess, self.batch_size,
+                                                                bboxs_list, self.cache)
+        start = 0
+        for frame in sampled:
+            end = start + len(frame['faces'])
+            if 'same_as' in frame:
+                frame['class_indices'] = frame['same_as']['class_indices']
+                frame['class_probabilities'] = frame['same_as']['class_probabilities']
+            elif self.identities is None:
+                frame['class_indices'] = class_indices[start:end]
+                frame['class_probabilities'] = class_probabilities[start:end]
+            else:
+                self.identities.add(frame['new_track_ids'], class_indices[start:end], class_probabilities[start:end])
+                frame['class_indices'], frame['class_probabilities'] = self.identities.lookup(frame['track_ids'])
+                self.identities.forget(frame['ended_track_ids'])
+            start = end
+        return frames
+
+def draw_frame(frame, id, class_names, threshold=0.5):
+    image = frame['image']
+    threshold *= 100
+    if frame['sampled']:
+        for bbox, class_index, class_probability in zip(frame['bboxs'], frame['class_indices'],
+                                                        frame['class_probabilities']):
+            if class_probability > threshold and (id == -1 or class_index == id):
+                text = f'{class_names[class_index]}:{class_probability}'
                 image = draw_bbox(image, bbox, text)
-        elif class_probability > threshold:
-            text = f'{predict_name}:{class_probability}'
-            image = draw_bbox(image, bbox, text)
-            if name_tag == "":
-                name_tag, time_start = predict_name, time_cur
-            elif (name_tag != predict_name):
-                dura = "{:0>2}:{:0>2}:{:0>2.0f}-{:0>2}:{:0>2}:{:0>2.0f}".format(time_start[0], time_start[1],
-                                                                                time_start[2], time_cur[0], time_cur[1],
-                                                                                time_cur[2])
-                out_txt(output_loc, dura, name_tag)
-                # reset
-                name_tag, time_start = predict_name, time_cur
-
-    if export_video:
-        image_path = os.path.join(output_loc, 'images')
-        cv2.imwrite(f'{image_path}/{frame_number}.jpg', image)
-    if frame_number == frame_count and id == -1:
-        dura = "{:0>2}:{:0>2}:{:0>2.0f}-{:0>2}:{:0>2}:{:0>2.0f}".format(time_start[0], time_start[1], time_start[2],
-                                                                        time_cur[0], time_cur[1], time_cur[2])
-        out_txt(output_loc, dura, name_tag)
+    return image
+
+def log_frame(frame, timeline):
+    # Only the sampled frames were analysed
+    if frame['sampled']:
+        timeline.add(frame['frame_number'], frame['bboxs'], frame['class_indices'], frame['class_probabilities'])
+
+def frame_record(frame):
+    # Keep what the timeline needs, not the image
+    return {'frame_number': frame['frame_number'], 'sampled': True, 'bboxs': frame['bboxs'],
+            'class_indices': frame['class_indices'], 'class_probabilities': frame['class_probabilities']}
+
+def run_pipeline(args, sess, detector, model, frame_skip, write, start_frame=0, end_frame=None, report=True,
+                 frames=None):
+    # Run the decode / detect / embed / write pipeline over frames [start_frame, end_frame) of the video,
+    # or over the frame dicts of frames when given
+    sampler = None
+    if frames is None:
+        cap = cv2.VideoCapture(args.input_video)
+        # Frames 1, 2 * frame_skip, 3 * frame_skip, ... (numbered from 1) as this script always analysed
+        sampler = frame_sampler.FrameSampler(cap, frame_skip, frame_sampler.estimate_gop_size(args.input_video),
+                                             keep_skipped=args.export_video, start=start_frame, end=end_frame,
+                                             offset=frame_skip - 1)
+        frames = read_frames(sampler)
+    tracker, identities = None, None
+    if args.detect_every > 0:
+        tracker = face_tracker.FaceTracker(args.detect_every)
+        identities = face_tracker.TrackIdentities()
+    gate = None
+    if args.motion_threshold > 0:
+        gate = motion_gate.MotionGate(args.motion_threshold)
+    cache = None
+    if args.cache_size > 0:
+        cache = embedding_cache.EmbeddingCache(args.cache_size, args.cache_distance)
+    embedder = FrameEmbedder(model, sess, args.frame_batch, args.batch_size, identities, cache)
+    pipeline = video_pipeline.Pipeline(
+        frames,
+        [video_pipeline.Stage('detect', lambda frame: detect_frame(frame, detector, sess, tracker, gate,
+                                                                        args.detect_max_side)),
+         video_pipeline.Stage('embed', embedder, embedder.flush),
+         video_pipeline.Stage('write', write)],
+        queue_size=args.queue_size)
+    pipeline.run()
+    if sampler is not None:
+        cap.release()
+    if report:
+        if sampler is not None:
+            sampler.report()
+        if tracker is not None:
+            tracker.report()
+        if gate is not None:
+            gate.report()
+        if cache is not None:
+            cache.report()
+        pipeline.report()
+
+def process_shard(args, shard, frame_skip, fps, start_frame, end_frame, segment_file, images_video_dir,
+                  nrof_threads):
+    # Worker process with its own detector, embedder and classifier for one time segment
+    records = []
+    config = tf.ConfigProto(intra_op_parallelism_threads=nrof_threads, inter_op_parallelism_threads=nrof_threads)
+    with tf.device('/GPU:0'):
+        with tf.Graph().as_default():
+            with tf.Session(config=config) as sess:
+                facenet.load_model(args.model_path)
+                detector = MTCNN()
+                model, class_names = load_model_classfier(args.model_classfier_path, args.model_path)
+                writer = None
+                if segment_file is not None:
+                    writer = video_writer.FFmpegWriter(segment_file, args.input_video, fps, audio=False)
+
+                def write_frames(frames):
+                    for frame in frames:
+                        if args.export_video:
+                            image = draw_frame(frame, args.id, class_names, args.threshold)
+                            if writer is not None:
+                                writer.write(image)
+                            else:
+                                cv2.imwrite(f'{images_video_dir}/{frame["frame_number"]}.jpg', image)
+                        if frame['sampled']:
+                            records.append(frame_record(frame))
+
+                run_pipeline(args, sess, detector, model, frame_skip, write_frames, start_frame, end_frame,
+                             report=False)
+                if writer is not None:
+                    writer.close()
+    print('Shard %d: frames %d-%s done' % (shard, start_frame, end_frame if end_frame is not None else 'end'))
+    return records
+
+def check_sharding(args):
+    # The face tracker, motion gate and embedding cache carry state from one frame to the next, a
+    # segment would start them empty and its records would differ from a sequential run
+    stateful = [name for name in ('detect_every', 'motion_threshold', 'cache_size') if getattr(args, name) > 0]
+    if args.workers > 1 and len(stateful) > 0:
+        raise ValueError('--workers %d can not be used with %s, the segments would not give the same records '
+                         'as a sequential run' % (args.workers, ', '.join('--' + name for name in stateful)))
+
+def process_sharded(args, output_loc, fps, frame_count, frame_skip, images_video_dir):
+    """Split the video into key frame aligned segments and process them in parallel.
+
+    The segments sample the same frames as a sequential run and every sampled
+    frame is analysed on its own (check_sharding rejects the tracker, the
+    motion gate and the cache), so the merged records are the same as the
+    records of a sequential run.
+    """
+    key_frames = frame_sampler.key_frames(args.input_video, fps)
+    segments = frame_sampler.split_segments(key_frames, frame_count, args.workers)
+    segment_files = [None] * len(segments)
+    if args.export_video and args.render_mode == 'stream':
+        segment_files = [os.path.join(output_loc, 'segment_%d.mp4' % i) for i in range(len(segments))]
+    nrof_threads = max(multiprocessing.cpu_count() // len(segments), 1)
+    print('Processing video in %d segments...' % len(segments))
+    # TensorFlow is not fork safe, every worker starts from a fresh interpreter
+    with multiprocessing.get_context('spawn').Pool(len(segments)) as pool:
+        results = pool.starmap(process_shard, [(args, i, frame_skip, fps, start, end, segment_files[i],
+                                                images_video_dir, nrof_threads)
+                                               for i, (start, end) in enumerate(segments)])
+    if segment_files[0] is not None:
+        video_writer.concat_segments(segment_files, args.input_video,
+                                     os.path.join(output_loc, 'result_vid_with_audio.mp4'))
+    # Segments are in time order, so the merged records are in frame order
+    return [record for records in results for record in records]
 
 def main(args):
+    check_sharding(args)
 
     # Create folder
     now = datetime.now()
@@ -224,68 +385,80 @@ def main(args):
     output_loc = os.path.join(args.output_loc, dt_string)
     os.mkdir(output_loc)
 
-    with tf.device('/GPU:0'):
-        with tf.Graph().as_default():
-            with tf.Session() as sess:
-                # Load facenet model
-                print('Loading feature extraction model')
-                facenet.load_model(args.model_path)
-
-                # Create mtcnn model
-                detector = MTCNN()
-
-                # Create model classifer
-                model, class_names = load_model_classfier(args.model_classfier_path)
-
-                # Read video
-                cap = cv2.VideoCapture(args.input_video)
-
-                # Get fpt from video
-                fps = cap.get(cv2.CAP_PROP_FPS)
-
-                # Get frame information
-                if args.frame_skip == 0:
-                    frame_skip = int(fps)
-                else:
-                    frame_skip = args.frame_skip
-                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                frame_number = 0
-
-                # Not finding an exact face
-
-
-                # Create folder images for export video
-                if args.export_video:
-                    images_video_dir = os.path.join(output_loc, 'images')
-                    os.mkdir(images_video_dir)
-                count = frame_skip
-                print('Processing video...')
-                with tqdm(total=(frame_count), file=sys.stdout) as pbar:
-                    while cap.isOpened():
-                        # Extract the frame
-                        ret, frame = cap.read()
-                        if ret == True:
-                            frame_number += 1
-                            if frame_number == 1 or frame_number == count:
-                                # Face Detection
-                                detect_face(frame, args.id, frame_number,frame_count, fps,
-                                            (model, class_names), output_loc,
-                                            detector,sess, args.export_video, args.threshold)
-                                count += frame_skip
-                            elif args.export_video:
-                                img_path = f'{images_video_dir}/{frame_number}.jpg'
-                                cv2.imwrite(img_path, frame)
-                        else:
-                            break
-                        pbar.update(1)
-                cap.release()
-                print('Successful write .txt file')
-
-                # Export video
-                if args.export_video:
-                    print('Rendering video...')
-                    out_video(images_video_dir, args.input_video, output_loc, fps)
-                    print('Successful export .mp4 file: ')
+    # Read video
+    cap = cv2.VideoCapture(args.input_video)
+
+    # Get fpt from video
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    # Get frame information
+    if args.frame_skip == 0:
+        frame_skip = int(fps)
+    else:
+        frame_skip = args.frame_skip
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    # Create folder images or the encoder for export video
+    writer = None
+    images_video_dir = None
+    if args.export_video and args.render_mode == 'images':
+        images_video_dir = os.path.join(output_loc, 'images')
+        os.mkdir(images_video_dir)
+    elif args.export_video and args.workers <= 1:
+        writer = video_writer.FFmpegWriter(os.path.join(output_loc, 'result_vid_with_audio.mp4'),
+                                           args.input_video, fps)
+
+    if args.workers > 1:
+        _, class_names = load_model_classfier(args.model_classfier_path, args.model_path)
+        timeline = face_timeline.TimelineWriter(os.path.join(output_loc, 'timeline.' + args.timeline_format),
+                                                class_names, fps, args.timeline_gap, args.threshold * 100, args.id)
+        records = process_sharded(args, output_loc, fps, frame_count, frame_skip, images_video_dir)
+        # Replay the merged records through the same timeline code as a sequential run
+        for frame in records:
+            log_frame(frame, timeline)
+    else:
+        with tf.device('/GPU:0'):
+            with tf.Graph().as_default():
+                with tf.Session() as sess:
+                    # Load facenet model
+                    print('Loading feature extraction model')
+                    facenet.load_model(args.model_path)
+
+                    # Create mtcnn model
+                    detector = MTCNN()
+
+                    # Create model classifer
+                    model, class_names = load_model_classfier(args.model_classfier_path, args.model_path)
+                    timeline = face_timeline.TimelineWriter(
+                        os.path.join(output_loc, 'timeline.' + args.timeline_format), class_names, fps,
+                        args.timeline_gap, args.threshold * 100, args.id)
+
+                    print('Processing video...')
+                    with tqdm(total=(frame_count), file=sys.stdout) as pbar:
+                        def write_frames(frames):
+                            for frame in frames:
+                                log_frame(frame, timeline)
+                                if args.export_video:
+                                    image = draw_frame(frame, args.id, class_names, args.threshold)
+                                    if writer is not None:
+                                        writer.write(image)
+                                    else:
+                                        cv2.imwrite(f'{images_video_dir}/{frame["frame_number"]}.jpg', image)
+                            pbar.update(frames[-1]['frame_number'] - pbar.n)
+
+                        run_pipeline(args, sess, detector, model, frame_skip, write_frames)
+    timeline.close()
+    print('Successful write timeline file: %d intervals' % timeline.nrof_intervals)
+
+    # Export video
+    if writer is not None:
+        writer.close()
+    elif args.export_video and args.render_mode == 'images':
+        print('Rendering video...')
+        out_video(images_video_dir, args.input_video, output_loc, fps)
+    if args.export_video:
+        print('Successful export .mp4 file: ')
 
 def parse_arguments(argv):
     parser = argparse.ArgumentParser()
@@ -293,7 +466,7 @@ def parse_arguments(argv):
     parser.add_argument('model_path', type=str,
                         help='Path to the facenet model training with triplet')
     parser.add_argument('model_classfier_path', type=str,
-                        help='Path to the classfier model')
+                        help='Path to the classfier model (.sav, or its .npz linear export), or a gallery index folder')
     parser.add_argument('input_video', type=str,
                         help='Video for extract face')
     parser.add_argument('output_loc', type=str,
@@ -306,6 +479,35 @@ def parse_arguments(argv):
                         help='Threshold for predict image', default=0.5)
     parser.add_argument('--id', type=int,
                         help='ID of specific person', default=-1)
+    parser.add_argument('--batch_size', type=int,
+                        help='Maximum number of faces embedded in one session run', default=64)
+    parser.add_argument('--frame_batch', type=int,
+                        help='Number of consecutive sampled frames whose faces are embedded together', default=1)
+    parser.add_argument('--timeline_format', type=str, choices=['jsonl', 'csv'],
+                        help='Format of the timeline of recognised faces', default='jsonl')
+    parser.add_argument('--timeline_gap', type=float,
+                        help='Maximum gap in seconds between two appearances merged into one interval', default=2.0)
+    parser.add_argument('--detect_max_side', type=int,
+                        help='Run MTCNN on a copy of the frame resized to this long side, 0 uses the full resolution',
+                        default=0)
+    parser.add_argument('--detect_every', type=int,
+                        help='Run MTCNN every N sampled frames and track the faces in between, 0 disables tracking',
+                        default=0)
+    parser.add_argument('--cache_size', type=int,
+                        help='Number of face crops whose embedding is kept for reuse, 0 disables the cache', default=0)
+    parser.add_argument('--cache_distance', type=int,
+                        help='Maximum number of differing bits between the perceptual hashes of two crops '
+                             'considered the same face', default=4)
+    parser.add_argument('--motion_threshold', type=float,
+                        help='Reuse the last detections when the mean pixel change of a downscaled gray frame '
+                             'is below this value (0-255), 0 disables the gate', default=0)
+    parser.add_argument('--workers', type=int,
+                        help='Number of processes working on key frame aligned segments of the video, can not be '
+                             'combined with --detect_every, --motion_threshold or --cache_size', default=1)
+    parser.add_argument('--render_mode', type=str, choices=['stream', 'images'],
+                        help='stream pipes the frames into ffmpeg, images writes a JPEG per frame first', default='stream')
+    parser.add_argument('--queue_size', type=int,
+                        help='Maximum number of items waiting between two pipeline stages', default=8)
     return parser.parse_args(argv)
 
 
@@ -0,0 +1,148 @@
+"""Sequential frame sampling for the video scripts."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import cv2
+import ffmpeg
+import numpy as np
+
+
+def estimate_gop_size(input_video, nrof_packets=1000):
+    # Mean distance between key frames in the first packets of the video stream
+    try:
+        probe = ffmpeg.probe(input_video, select_streams='v:0', show_entries='packet=flags',
+                             read_intervals='%+#{}'.format(nrof_packets))
+    except ffmpeg.Error:
+        return None
+    flags = [packet.get('flags', '') for packet in probe.get('packets', [])]
+    key_frames = [i for i, flag in enumerate(flags) if 'K' in flag]
+    if len(key_frames) < 2:
+        return None
+    return int(round(np.mean(np.diff(key_frames))))
+
+
+def key_frames(input_video, fps):
+    # Frame indices of every key frame of the video stream, read from the packet flags
+    probe = ffmpeg.probe(input_video, select_streams='v:0', show_entries='packet=pts_time,flags')
+    indices = set([0])
+    for packet in probe.get('packets', []):
+        if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A':
+            indices.add(int(round(float(packet['pts_time']) * fps)))
+    return sorted(indices)
+
+
+def split_segments(key_frames, frame_count, nrof_segments):
+    # Cut [0, frame_count) into about nrof_segments (start, end) segments starting on key frames,
+    # the last segment runs to the end of the video
+    key_frames = np.asarray(key_frames)
+    bounds = [0]
+    for i in range(1, nrof_segments):
+        target = i * frame_count / nrof_segments
+        key_frame = int(key_frames[np.argmin(np.abs(key_frames - target))])
+        if bounds[-1] < key_frame < frame_count:
+            bounds.append(key_frame)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+class FrameSampler():
+    """Yields (index, frame, sampled) for every frame_skip-th frame of a video.
+
+    Skipped frames are only grab()bed and sampled frames retrieve()d, so the
+    decoder never seeks. When frame_skip is larger than the GOP length, grabbing
+    would decode whole GOPs for nothing and the sampler seeks instead: the
+    decoder jumps to the key frame before each sample and decodes at most one
+    GOP. OpenCV does not tell how many frames a seek decodes, so nrof_decoded
+    only counts the grabbed frames and stays 0 in seek mode. With
+    keep_skipped every frame is retrieved (e.g. to render a video) but only
+    the sampled ones are flagged for analysis. start and end restrict
+    the sampler to the frames [start, end); frames are still sampled on the
+    same grid as a read from the first frame. The grid is the first frame and
+    the frames offset + j * frame_skip, j >= 1.
+    """
+
+    def __init__(self, cap, frame_skip, gop_size=None, keep_skipped=False, start=0, end=None, offset=0):
+        self.cap = cap
+        self.frame_skip = max(int(frame_skip), 1)
+        self.offset = offset % self.frame_skip
+        self.keep_skipped = keep_skipped
+        self.start = start
+        self.end = end
+        self.gop_size = gop_size
+        self.seek = gop_size is not None and self.frame_skip > gop_size and not keep_skipped
+        self.nrof_decoded = 0
+        self.nrof_analysed = 0
+        self.nrof_seeks = 0
+
+    def __iter__(self):
+        if self.seek:
+            return self._seek_frames()
+        return self._grab_frames()
+
+    def _in_range(self, index):
+        return self.end is None or index < self.end
+
+    def _sampled(self, index):
+        return index == 0 or (index > self.offset and (index - self.offset) % self.frame_skip == 0)
+
+    def _next_sample(self, index):
+        # First index of the sampling grid at or after index
+        if index == 0:
+            return 0
+        return self.offset + max(-(-(index - self.offset) // self.frame_skip), 1) * self.frame_skip
+
+    def _grab_frames(self):
+        index = self.start
+        if index > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self.nrof_seeks += 1
+        while self._in_range(index) and self.cap.grab():
+            self.nrof_decoded += 1
+            sampled = self._sampled(index)
+            if sampled or self.keep_skipped:
+                ret, frame = self.cap.retrieve()
+                if ret != True:
+                    break
+                if sampled:
+                    self.nrof_analysed += 1
+                yield index, frame, sampled
+            index += 1
+
+    def _seek_frames(self):
+        index = self._next_sample(self.start)
+        while self._in_range(index):
+            if index > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                self.nrof_seeks += 1
+            ret, frame = self.cap.read()
+            if ret != True:
+                break
+            self.nrof_analysed += 1
+            yield index, frame, True
+            index = self._next_sample(index + 1)
+
+    def report(self, file=sys.stdout):
+        if self.seek:
+            # The frames decoded by the seeks are not known
+            print('Frame sampler (key frame seek, GOP of about %d): analysed %d frames, %d seeks' % (
+                self.gop_size, self.nrof_analysed, self.nrof_seeks), file=file)
+        else:
+            print('Frame sampler (sequential grab): decoded %d frames, analysed %d frames, %d seeks' % (
+                self.nrof_decoded, self.nrof_analysed, self.nrof_seeks), file=file)
@@ -0,0 +1,259 @@
+"""Gallery of known face embeddings searched with one matrix product."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import json
+import numpy as np
+
+import ann_index
+
+UNKNOWN = 'Unknown'
+
+
+def l2_normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-10)
+
+
+class GalleryIndex():
+    """L2 normalized embeddings of known faces with their labels.
+
+    The embeddings are sorted by label, so the best match of every identity is
+    one np.maximum.reduceat over the similarities of a probe batch with the
+    whole gallery, computed by a single matrix product. With method='centroid'
+    the probes are only compared with the mean embedding of every identity.
+    A probe further than threshold (euclidean distance between unit vectors)
+    from every identity is unknown. Loaded galleries are memory-mapped, only
+    the pages touched by the matrix product are read. With an ann_index
+    (method='ann', the default when there is one) the nearest rows are found
+    by an IVF-PQ search instead of the full matrix product. model is the
+    model_info() of the model that embedded the gallery, probes must come from
+    the same model.
+    """
+
+    def __init__(self, embeddings, labels, class_names, threshold=1.1, centroids=None, ann=None, model=None):
+        self.embeddings = embeddings
+        self.labels = labels
+        self.class_names = list(class_names)
+        self.threshold = threshold
+        if centroids is None:
+            centroids = np.zeros((len(self.class_names), embeddings.shape[1]), dtype=np.float32)
+            np.add.at(centroids, labels, embeddings)
+            centroids = l2_normalize(centroids)
+        self.centroids = centroids
+        # First row of every identity that has embeddings
+        self.present = np.unique(labels)
+        self.offsets = np.searchsorted(labels, self.present)
+        self.ann = ann
+        if ann is not None:
+            # The ids of the index are the rows of the gallery, re-ranked with its embeddings
+            ann.embeddings = embeddings
+        self.method = 'ann' if ann is not None else 'nearest'
+        self.model = model
+
+    def similarities(self, probes, method='nearest'):
+        # (nrof_probes, nrof_classes) cosine similarity of every probe with every identity
+        probes = l2_normalize(probes)
+        if method == 'centroid':
+            return probes @ self.centroids.T
+        scores = np.full((len(probes), len(self.class_names)), -1.0, dtype=np.float32)
+        if len(self.present) > 0:
+            scores[:, self.present] = np.maximum.reduceat(probes @ self.embeddings.T, self.offsets, axis=1)
+        return scores
+
+    def _search_ann(self, probes, k):
+        # Several rows may belong to the same identity, keep the nearest one of each. The number of rows
+        # fetched is doubled for the probes with less than k identities until the probed lists run out
+        probes = l2_normalize(probes)
+        top = np.full((len(probes), k), -1, dtype=np.int64)
+        distances = np.full((len(probes), k), np.inf, dtype=np.float32)
+        pending, nrof_rows = np.arange(len(probes)), k * 4
+        while len(pending) > 0:
+            rows, row_distances = self.ann.search(probes[pending], nrof_rows)
+            done = np.zeros(len(pending), dtype=bool)
+            for i, probe in enumerate(pending):
+                found = rows[i] >= 0
+                _, first = np.unique(self.labels[rows[i][found]], return_index=True)
+                first = np.sort(first)[:k]
+                top[probe, :len(first)] = self.labels[rows[i][found][first]]
+                distances[probe, :len(first)] = row_distances[i][found][first]
+                done[i] = len(first) == k or not found.all() or nrof_rows >= len(self.ann)
+            pending, nrof_rows = pending[~done], nrof_rows * 2
+        return top, distances
+
+    def search(self, probes, k=5, method=None):
+        """Class indices and distances of the k nearest identities of every probe, nearest first.
+
+        With method='ann', when the probed lists hold fewer than k identities,
+        the missing ones have the class index -1 and an infinite distance.
+        """
+        method = method or self.method
+        if method == 'ann':
+            return self._search_ann(probes, k)
+        scores = self.similarities(probes, method)
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        return top, np.sqrt(np.maximum(2 - 2 * top_scores, 0))
+
+    def classify(self, probes, method=None):
+        """Class index and confidence (similarity in percent) of every probe, like the classifier pickles.
+
+        Unknown probes get the index len(class_names), the UNKNOWN name added
+        by class_names_with_unknown().
+        """
+        top, distances = self.search(probes, 1, method)
+        class_index, distance = top[:, 0], distances[:, 0]
+        class_probability = np.maximum(1 - distance ** 2 / 2, 0) * 100
+        class_index = np.where(distance > self.threshold, len(self.class_names), class_index)
+        return class_index, class_probability
+
+    def class_rows(self, class_index):
+        return np.searchsorted(self.labels, class_index), np.searchsorted(self.labels, class_index, side='right')
+
+    def enroll(self, name, embeddings):
+        """New gallery with the embeddings of name added, a new identity if name is not known yet.
+
+        Only the centroid of name is recomputed and the new embeddings are
+        encoded into the IVF-PQ index with its trained quantizers, nothing is
+        retrained.
+        """
+        embeddings = l2_normalize(embeddings)
+        class_names = list(self.class_names)
+        if name not in class_names:
+            class_names.append(name)
+        class_index = class_names.index(name)
+        # The new rows go after the last row of the identity, the rows after them move down
+        _, position = self.class_rows(class_index)
+        all_embeddings = np.concatenate([self.embeddings[:position], embeddings, self.embeddings[position:]])
+        labels = np.concatenate([self.labels[:position], np.full(len(embeddings), class_index, dtype=np.int32),
+                                 self.labels[position:]])
+        centroids = np.zeros((len(class_names), all_embeddings.shape[1]), dtype=np.float32)
+        centroids[:len(self.centroids)] = self.centroids
+        start, end = np.searchsorted(labels, class_index), np.searchsorted(labels, class_index, side='right')
+        centroids[class_index] = l2_normalize(np.sum(all_embeddings[start:end], axis=0, keepdims=True))[0]
+        ann = None
+        if self.ann is not None:
+            new_ids = np.arange(len(self.labels))
+            new_ids[position:] += len(embeddings)
+            ann = self.ann.renumber(new_ids).add(embeddings, position + np.arange(len(embeddings)))
+        return GalleryIndex(all_embeddings, labels, class_names, self.threshold, centroids, ann, self.model)
+
+    def remove(self, name):
+        """New gallery without name, the class indices after it move down by one."""
+        if name not in self.class_names:
+            raise ValueError('"%s" is not in the gallery' % name)
+        class_index = self.class_names.index(name)
+        start, end = self.class_rows(class_index)
+        embeddings = np.concatenate([self.embeddings[:start], self.embeddings[end:]])
+        labels = np.concatenate([self.labels[:start], self.labels[end:]])
+        labels[labels > class_index] -= 1
+        class_names = self.class_names[:class_index] + self.class_names[class_index + 1:]
+        centroids = np.delete(self.centroids, class_index, axis=0)
+        ann = None
+        if self.ann is not None:
+            new_ids = np.arange(len(self.labels))
+            new_ids[end:] -= end - start
+            ann = self.ann.remove(np.arange(start, end)).renumber(new_ids)
+        return GalleryIndex(embeddings, labels, class_names, self.threshold, centroids, ann, self.model)
+
+    def class_names_with_unknown(self):
+        return self.class_names + [UNKNOWN]
+
+    def save(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # A gallery loaded from path may still be memory-mapped, the files are replaced and not overwritten
+        ann_index.save_array(os.path.join(path, 'embeddings.npy'), np.asarray(self.embeddings, dtype=np.float32))
+        ann_index.save_array(os.path.join(path, 'labels.npy'), np.asarray(self.labels, dtype=np.int32))
+        ann_index.save_array(os.path.join(path, 'centroids.npy'), np.asarray(self.centroids, dtype=np.float32))
+        with open(os.path.join(path, 'gallery.json'), 'w') as f:
+            json.dump({'class_names': self.class_names, 'threshold': self.threshold, 'model': self.model}, f, indent=2)
+        if self.ann is not None:
+            # The exact re-ranking reads the embeddings of the gallery
+            self.ann.save(os.path.join(path, 'ann'), embeddings=False)
+
+
+def model_info(kind, model_path, embedding_size=None):
+    """Which model embeds the faces: kind is 'triplet' (facenet embeddings) or 'softmax'
+    (L2_normalization layer of the Keras softmax model).
+
+    The model is named by its file or folder name without extension, so a
+    checkpoint folder and the frozen graph exported from it have the same name.
+    """
+    name = os.path.splitext(os.path.basename(os.path.normpath(os.path.expanduser(model_path))))[0]
+    return {'kind': kind, 'model': name, 'embedding_size': int(embedding_size) if embedding_size is not None else None}
+
+
+def check_model(gallery_model, model, path):
+    # Embeddings of different models are not comparable, a gallery is only searched with its own model
+    if model is None:
+        return
+    if gallery_model is None:
+        print('Warning: the gallery "%s" does not record the model that embedded it, it must be a %s model' % (
+            path, model['kind']))
+        return
+    if gallery_model['kind'] != model['kind']:
+        raise ValueError('The gallery "%s" holds %s embeddings (%s), it can not be searched with a %s model' % (
+            path, gallery_model['kind'], gallery_model['model'], model['kind']))
+    if None not in (model['embedding_size'], gallery_model['embedding_size']) and \
+            model['embedding_size'] != gallery_model['embedding_size']:
+        raise ValueError('The gallery "%s" holds embeddings of size %d, the model embeds faces in %d' % (
+            path, gallery_model['embedding_size'], model['embedding_size']))
+    if model['model'] != gallery_model['model']:
+        print('Warning: the gallery "%s" was embedded by the model "%s", not "%s"' % (
+            path, gallery_model['model'], model['model']))
+
+
+def build_gallery(embeddings, labels, class_names, threshold=1.1, nrof_lists=-1, nprobe=8, model=None):
+    """Gallery of the embeddings sorted by label, so the rows of every identity are contiguous.
+
+    nrof_lists > 0 also builds an IVF-PQ index with that many inverted lists,
+    0 picks the number of lists from the gallery size and -1 keeps the exact
+    search only. model is the model_info() of the model that embedded them.
+    """
+    labels = np.asarray(labels, dtype=np.int32)
+    order = np.argsort(labels, kind='stable')
+    embeddings = l2_normalize(embeddings)[order]
+    ann = None
+    if nrof_lists >= 0:
+        ann = ann_index.build_index(embeddings, nrof_lists, nprobe=nprobe)
+    return GalleryIndex(embeddings, labels[order], class_names, threshold, ann=ann, model=model)
+
+
+def is_gallery(path):
+    return os.path.isfile(os.path.join(path, 'gallery.json'))
+
+
+def load_gallery(path, mmap=True, model=None):
+    # model, the model_info() of the caller, is checked against the model that embedded the gallery
+    with open(os.path.join(path, 'gallery.json')) as f:
+        meta = json.load(f)
+    check_model(meta.get('model'), model, path)
+    mmap_mode = 'r' if mmap else None
+    embeddings = np.load(os.path.join(path, 'embeddings.npy'), mmap_mode=mmap_mode)
+    ann = None
+    if ann_index.is_index(os.path.join(path, 'ann')):
+        ann = ann_index.load_index(os.path.join(path, 'ann'), mmap, embeddings)
+    return GalleryIndex(embeddings, np.load(os.path.join(path, 'labels.npy')), meta['class_names'],
+                        meta['threshold'], np.load(os.path.join(path, 'centroids.npy')), ann, meta.get('model'))
@@ -0,0 +1,152 @@
+"""Linear classifiers exported from sklearn and evaluated with numpy only."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import numpy as np
+
+# Bounds of the pairwise probabilities of libsvm
+_MIN_PROB = 1e-7
+
+
+def sigmoid(z):
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+def softmax(z):
+    z = z - np.max(z, axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / np.sum(e, axis=1, keepdims=True)
+
+
+def pairwise_coupling(r):
+    """Class probabilities of the (n, k, k) pairwise probabilities r[:, i, j] = P(i | i or j).
+
+    Method 2 of Wu, Lin and Weng (2004), the same fixed point iteration as
+    libsvm's multiclass_probability, run on the whole batch at once.
+    """
+    n, k, _ = r.shape
+    Q = -r * r.transpose(0, 2, 1)
+    diagonal = np.sum(r.transpose(0, 2, 1) ** 2, axis=2) - np.diagonal(r, axis1=1, axis2=2) ** 2
+    Q[:, np.arange(k), np.arange(k)] = diagonal
+    p = np.full((n, k), 1.0 / k)
+    eps = 0.005 / k
+    for _ in range(max(100, k)):
+        Qp = np.einsum('ntj,nj->nt', Q, p)
+        pQp = np.sum(p * Qp, axis=1)
+        # Converged rows stop moving, like libsvm stops per sample
+        active = np.max(np.abs(Qp - pQp[:, None]), axis=1) >= eps
+        if not np.any(active):
+            break
+        for t in range(k):
+            diff = np.where(active, (pQp - Qp[:, t]) / Q[:, t, t], 0.0)
+            p[:, t] += diff
+            pQp = (pQp + diff * (diff * Q[:, t, t] + 2 * Qp[:, t])) / (1 + diff) ** 2
+            Qp = (Qp + diff[:, None] * Q[:, t, :]) / (1 + diff)[:, None]
+            p /= (1 + diff)[:, None]
+    return p
+
+
+class LinearClassifier():
+    """Weights, bias and calibration of a fitted linear model.
+
+    kind is 'multinomial' (softmax of the scores), 'ovr' (normalized
+    sigmoids of one-vs-rest scores) or 'ovo' (Platt-scaled one-vs-one linear
+    SVM with pairwise coupling, prob_a and prob_b are the Platt parameters).
+    predict_proba scores the whole batch with one matrix product, like the
+    sklearn model it was exported from.
+    """
+
+    def __init__(self, kind, weights, bias, class_names, prob_a=None, prob_b=None):
+        self.kind = kind
+        self.weights = weights
+        self.bias = bias
+        self.class_names = list(class_names)
+        self.prob_a = prob_a
+        self.prob_b = prob_b
+        self.classes_ = np.arange(len(self.class_names))
+
+    def decision_function(self, x):
+        return np.dot(np.asarray(x, dtype=self.weights.dtype), self.weights.T) + self.bias
+
+    def predict_proba(self, x):
+        z = self.decision_function(x)
+        nrof_classes = len(self.classes_)
+        if self.kind == 'multinomial':
+            if z.shape[1] == 1:
+                z = np.concatenate([-z, z], axis=1)
+            return softmax(z)
+        if self.kind == 'ovr':
+            if z.shape[1] == 1:
+                return np.concatenate([1 - sigmoid(z), sigmoid(z)], axis=1)
+            p = sigmoid(z)
+            return p / np.sum(p, axis=1, keepdims=True)
+        # libsvm decision values of every pair (i, j), i < j, positive for i
+        r = np.clip(sigmoid(-(z * self.prob_a + self.prob_b)), _MIN_PROB, 1 - _MIN_PROB)
+        # The libsvm of sklearn couples two classes as well, instead of returning r. The coupling starts from
+        # [0.5, 0.5] and stops within 0.005 / k, so near the boundary it differs from r by up to 2.5e-3
+        pairwise = np.zeros((len(z), nrof_classes, nrof_classes))
+        i, j = np.triu_indices(nrof_classes, 1)
+        pairwise[:, i, j] = r
+        pairwise[:, j, i] = 1 - r
+        return pairwise_coupling(pairwise)
+
+    def predict(self, x):
+        return np.argmax(self.predict_proba(x), axis=1)
+
+    def save(self, path):
+        arrays = {'kind': np.array(self.kind), 'weights': self.weights, 'bias': self.bias,
+                  'class_names': np.array(self.class_names)}
+        if self.prob_a is not None:
+            arrays.update(prob_a=self.prob_a, prob_b=self.prob_b)
+        np.savez(path, **arrays)
+
+
+def from_sklearn(model, class_names):
+    """LinearClassifier of a fitted LogisticRegression or linear SVC, its labels must be 0..n-1.
+
+    The model is read through its attributes only, so sklearn is not imported.
+    """
+    name = type(model).__name__
+    if not (name == 'LogisticRegression' or (name == 'SVC' and model.kernel == 'linear' and model.probability)):
+        raise ValueError('%s can not be exported as a linear classifier' % name)
+    weights = np.asarray(model.coef_, dtype=np.float32)
+    bias = np.asarray(model.intercept_, dtype=np.float32)
+    nrof_classes = len(model.classes_)
+    if name == 'LogisticRegression':
+        multi_class = getattr(model, 'multi_class', 'auto')
+        ovr = multi_class in ('ovr', 'warn') or (multi_class in ('auto', 'deprecated') and
+                                                 (nrof_classes <= 2 or model.solver == 'liblinear'))
+        return LinearClassifier('ovr' if ovr else 'multinomial', weights, bias, class_names)
+    if nrof_classes == 2:
+        # sklearn flips the sign of a binary SVC, libsvm's decision value is positive for class 0
+        weights, bias = -weights, -bias
+    return LinearClassifier('ovo', weights, bias, class_names,
+                            np.asarray(model.probA_, dtype=np.float32), np.asarray(model.probB_, dtype=np.float32))
+
+
+def is_linear_classifier(path):
+    return path.endswith('.npz')
+
+
+def load_linear_classifier(path):
+    data = np.load(path)
+    prob_a = data['prob_a'] if 'prob_a' in data else None
+    prob_b = data['prob_b'] if 'prob_b' in data else None
+    return LinearClassifier(str(data['kind']), data['weights'], data['bias'], data['class_names'], prob_a, prob_b)
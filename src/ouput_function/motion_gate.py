@@ -0,0 +1,58 @@
+"""Skip face detection on frames that did not change since the last analysed frame."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import cv2
+import numpy as np
+
+
+class MotionGate():
+    """Compares a small grayscale copy of each frame with the last analysed one.
+
+    The frame is analysed when the mean absolute pixel difference (0-255) is
+    above threshold, otherwise the caller reuses the detections and identities
+    of last_frame, the last analysed frame. The reference only moves on
+    analysed frames, so a slow drift still triggers a detection eventually.
+    """
+
+    def __init__(self, threshold=3.0, size=(64, 64)):
+        self.threshold = threshold
+        self.size = size
+        self.reference = None
+        self.last_frame = None
+        self.nrof_analysed = 0
+        self.nrof_gated = 0
+
+    def changed(self, image):
+        small = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+        small = small.astype(np.float32)
+        if self.reference is not None and np.mean(np.abs(small - self.reference)) <= self.threshold:
+            self.nrof_gated += 1
+            return False
+        self.reference = small
+        self.nrof_analysed += 1
+        return True
+
+    def report(self, file=sys.stdout):
+        total = self.nrof_analysed + self.nrof_gated
+        gated = 100.0 * self.nrof_gated / total if total > 0 else 0.0
+        print('Motion gate: analysed %d frames, gated %d frames (%.1f%% of detections skipped)' % (
+            self.nrof_analysed, self.nrof_gated, gated), file=file)
@@ -0,0 +1,55 @@
+"""Load the Keras or TFLite softmax model and its class names for the softmax scripts."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import pickle
+import tensorflow as tf
+
+import facenet
+import gallery_index
+
+
+def load_class_names(class_names_path, model_path=None):
+    # The class_names pickle, or a gallery index folder whose embeddings replace the softmax layer,
+    # built from the softmax model of model_path by classifier_softmax_facenet.py --gallery_path
+    if os.path.isdir(class_names_path) and gallery_index.is_gallery(class_names_path):
+        model = gallery_index.model_info('softmax', model_path) if model_path is not None else None
+        gallery = gallery_index.load_gallery(class_names_path, model=model)
+        print('Loaded gallery of %d faces from "%s"' % (len(gallery.labels), class_names_path))
+        return gallery.class_names_with_unknown(), gallery
+    with open(class_names_path, 'rb') as infile:
+        return pickle.load(infile), None
+
+
+def embedding_model(model):
+    # Output of the L2 normalized embedding before the softmax layer
+    if isinstance(model, facenet.TFLiteModel):
+        raise ValueError('A gallery index needs the Keras model, the .tflite model only has the softmax output')
+    return tf.keras.models.Model(inputs=[model.input], outputs=[model.get_layer('L2_normalization').output])
+
+
+def load_softmax_model(model_path, model_weights_path):
+    # A .tflite model from quantize_model.py has its weights inside
+    if model_path.endswith('.tflite'):
+        return facenet.TFLiteModel(model_path)
+    model = tf.keras.models.load_model(model_path)
+    model.load_weights(model_weights_path)
+    return model
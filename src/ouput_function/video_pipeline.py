@@ -0,0 +1,157 @@
+"""Threaded decode / detect / embed / write pipeline for the video scripts."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sys
+import time
+import queue
+import threading
+
+# Marker sent down the queues once the source is exhausted
+_STOP = object()
+
+
+class StageStats():
+    "Throughput and input queue depth of one pipeline stage"
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.depth_samples = 0
+
+    def sample_depth(self, depth):
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.depth_samples += 1
+
+    def __str__(self):
+        rate = self.items / self.busy_time if self.busy_time > 0 else 0.0
+        depth_mean = self.depth_sum / self.depth_samples if self.depth_samples > 0 else 0.0
+        return '%-8s items=%-7d busy=%8.2fs  %8.2f items/s  queue mean=%5.2f max=%d' % (
+            self.name, self.items, self.busy_time, rate, depth_mean, self.depth_max)
+
+
+class Stage():
+    """One step of the pipeline, run on its own thread.
+
+    func is called with every item of the input queue and its result is passed
+    to the next stage, unless it is None. flush is called once after the last
+    item and may return a final item (e.g. a partially filled batch).
+    """
+
+    def __init__(self, name, func, flush=None):
+        self.name = name
+        self.func = func
+        self.flush = flush
+        self.stats = StageStats(name)
+
+
+class Pipeline():
+    """Decoder thread and stages joined by bounded queues.
+
+    Every stage runs on a single thread and the queues are FIFO, so items reach
+    the last stage in the order the source produced them and the output stays
+    deterministic.
+    """
+
+    def __init__(self, source, stages, queue_size=8):
+        self.source = source
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.decoder_stats = StageStats('decode')
+        self.error = None
+        self.abort = threading.Event()
+        self.wall_time = 0.0
+
+    def _put(self, out_queue, item):
+        if out_queue is not None:
+            out_queue.put(item)
+
+    def _decode(self):
+        out_queue = self.queues[0]
+        try:
+            start = time.time()
+            for item in self.source:
+                self.decoder_stats.busy_time += time.time() - start
+                if self.abort.is_set():
+                    break
+                self.decoder_stats.items += 1
+                out_queue.put(item)
+                start = time.time()
+        except Exception as e:
+            self._fail(e)
+        out_queue.put(_STOP)
+
+    def _run_stage(self, index):
+        stage = self.stages[index]
+        in_queue = self.queues[index]
+        out_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        while True:
+            stage.stats.sample_depth(in_queue.qsize())
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            # Keep draining after a failure so upstream threads never block
+            if self.abort.is_set():
+                continue
+            start = time.time()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                self._fail(e)
+                continue
+            stage.stats.busy_time += time.time() - start
+            stage.stats.items += 1
+            if result is not None:
+                self._put(out_queue, result)
+        if stage.flush is not None and not self.abort.is_set():
+            try:
+                result = stage.flush()
+                if result is not None:
+                    self._put(out_queue, result)
+            except Exception as e:
+                self._fail(e)
+        self._put(out_queue, _STOP)
+
+    def _fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.abort.set()
+
+    def run(self):
+        start = time.time()
+        threads = [threading.Thread(target=self._decode, name='decode')]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._run_stage, args=(i,), name=stage.name))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_time = time.time() - start
+        if self.error is not None:
+            raise self.error
+
+    def report(self, file=sys.stdout):
+        print('Pipeline wall time: %.2fs' % self.wall_time, file=file)
+        for stats in [self.decoder_stats] + [stage.stats for stage in self.stages]:
+            print('  ' + str(stats), file=file)
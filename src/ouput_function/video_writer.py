@@ -0,0 +1,91 @@
+"""Stream annotated frames straight into an ffmpeg encoder."""
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import ffmpeg
+import numpy as np
+
+
+def has_audio(input_video):
+    probe = ffmpeg.probe(input_video)
+    return any(stream['codec_type'] == 'audio' for stream in probe['streams'])
+
+
+class FFmpegWriter():
+    """Pipes raw BGR frames into an ffmpeg process.
+
+    The video is encoded with libx264 at the source fps and the audio stream of
+    input_video, if any, is copied without re-encoding, so no intermediate image
+    or wav file is written. The encoder is started on the first frame, when the
+    frame size is known. With audio=False only the video stream is written.
+    """
+
+    def __init__(self, output_file, input_video, fps, vcodec='libx264', crf=23, audio=True):
+        self.output_file = output_file
+        self.input_video = input_video
+        self.fps = fps
+        self.audio = audio
+        self.vcodec = vcodec
+        self.crf = crf
+        self.process = None
+        self.nrof_frames = 0
+
+    def _open(self, width, height):
+        video_stream = ffmpeg.input('pipe:', format='rawvideo', pix_fmt='bgr24',
+                                    s='{}x{}'.format(width, height), framerate=self.fps)
+        streams = [video_stream]
+        if self.audio and has_audio(self.input_video):
+            streams.append(ffmpeg.input(self.input_video).audio)
+        output = ffmpeg.output(*streams, self.output_file, vcodec=self.vcodec, crf=self.crf,
+                               pix_fmt='yuv420p', acodec='copy', shortest=None)
+        self.process = output.overwrite_output().global_args('-loglevel', 'error').run_async(pipe_stdin=True)
+
+    def write(self, image):
+        if self.process is None:
+            height, width = image.shape[:2]
+            self._open(width, height)
+        self.process.stdin.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+        self.nrof_frames += 1
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError('ffmpeg failed to encode "%s"' % self.output_file)
+        self.process = None
+
+
+def concat_segments(segment_files, input_video, output_file):
+    # Join the encoded segments without re-encoding and copy the audio of input_video
+    list_file = os.path.splitext(output_file)[0] + '_segments.txt'
+    segment_files = [segment_file for segment_file in segment_files if os.path.exists(segment_file)]
+    with open(list_file, 'w') as f:
+        for segment_file in segment_files:
+            f.write("file '%s'\n" % os.path.abspath(segment_file))
+    streams = [ffmpeg.input(list_file, format='concat', safe=0).video]
+    if has_audio(input_video):
+        streams.append(ffmpeg.input(input_video).audio)
+    ffmpeg.output(*streams, output_file, c='copy', shortest=None).overwrite_output() \
+        .global_args('-loglevel', 'error').run()
+    os.remove(list_file)
+    for segment_file in segment_files:
+        os.remove(segment_file)
@@ -0,0 +1,217 @@
+"""Post-training quantization of the facenet embedder to TFLite with an accuracy gate."""
+
+#   MIT License
+#  Copyright (c) 2021. TranPhuongNam,DaoLeBaoThoa,NguyenDiemUyenPhuong
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import cv2
+import numpy as np
+import tensorflow.compat.v1 as tf
+from tensorflow import lite
+
+import freeze_graph
+from models import facenet
+
+
+def load_faces(image_paths, image_size, keras_model):
+    # Aligned faces preprocessed like the model expects, prewhitened for a triplet model, scaled to [0, 1] for Keras
+    images = np.zeros((len(image_paths), image_size, image_size, 3), dtype=np.float32)
+    for i, image_path in enumerate(image_paths):
+        img = cv2.cvtColor(cv2.imread(os.path.expanduser(image_path)), cv2.COLOR_BGR2RGB)
+        if img.shape[:2] != (image_size, image_size):
+            img = cv2.resize(img, (image_size, image_size), interpolation=cv2.INTER_AREA)
+        images[i] = img / 255.0 if keras_model else facenet.prewhiten(img)
+    return images
+
+def read_pairs(pairs_file):
+    # One "path1 path2 1|0" line per pair, relative paths start from the folder of the pair list
+    base_dir = os.path.dirname(os.path.abspath(os.path.expanduser(pairs_file)))
+    paths1, paths2, issame = [], [], []
+    with open(os.path.expanduser(pairs_file)) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 3:
+                continue
+            paths1.append(os.path.join(base_dir, fields[0]))
+            paths2.append(os.path.join(base_dir, fields[1]))
+            issame.append(fields[2] == '1')
+    return paths1, paths2, np.array(issame)
+
+def convert(converter, mode, calibration_images):
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        # Calibrate the activation ranges on the sample, inputs and outputs stay float32
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis]]
+        converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+def embed(predict, images, batch_size):
+    emb = np.concatenate([predict(images[start:start + batch_size]) for start in range(0, len(images), batch_size)])
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+def evaluate(emb, issame, nrof_folds, far_target):
+    # Verification accuracy and validation rate of the pairs, embeddings of a pair are consecutive rows
+    thresholds = np.arange(0, 4, 0.01)
+    _, _, accuracy = facenet.calculate_roc(thresholds, emb[0::2], emb[1::2], issame, nrof_folds=nrof_folds)
+    val, _, far = facenet.calculate_val(thresholds, emb[0::2], emb[1::2], issame, far_target, nrof_folds=nrof_folds)
+    return np.mean(accuracy), val, far
+
+def top1_agreement(float_predict, quantized_predict, images, batch_size):
+    # Fraction of the images where both models predict the same class
+    agree = 0
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        agree += np.sum(np.argmax(float_predict(batch), axis=1) == np.argmax(quantized_predict(batch), axis=1))
+    return agree / max(len(images), 1)
+
+def timed(predict, images, batch_size):
+    # Embeddings of images and mean latency of a batch
+    predict(images[:batch_size])
+    start = time.time()
+    emb = embed(predict, images, batch_size)
+    return emb, (time.time() - start) / max(len(images) // batch_size, 1)
+
+def main(args):
+    random.seed(args.seed)
+    model_path = os.path.expanduser(args.model_path)
+    keras_model = model_path.endswith('.h5')
+    dataset = facenet.get_dataset(args.calibration_dir)
+    image_paths, _ = facenet.get_image_paths_and_labels(dataset)
+    random.shuffle(image_paths)
+    calibration_images = load_faces(image_paths[:args.nrof_calibration_images], args.image_size, keras_model)
+    paths1, paths2, issame = read_pairs(args.pairs)
+    pair_paths = [path for pair in zip(paths1, paths2) for path in pair]
+    pair_images = load_faces(pair_paths, args.image_size, keras_model)
+    print('Calibrating on %d faces, evaluating on %d pairs' % (len(calibration_images), len(issame)))
+
+    if keras_model:
+        model = tf.keras.models.load_model(model_path)
+        if args.model_weights_path:
+            model.load_weights(args.model_weights_path)
+        # Quality is checked on the L2 normalized embedding before the softmax layer
+        embedder = tf.keras.models.Model(inputs=[model.input], outputs=[model.get_layer('L2_normalization').output])
+        tflite_model = convert(lite.TFLiteConverter.from_keras_model(model), args.mode, calibration_images)
+        tflite_embedder = convert(lite.TFLiteConverter.from_keras_model(embedder), args.mode, calibration_images)
+        float_predict = embedder.predict
+    else:
+        frozen_file = model_path
+        if os.path.isdir(model_path):
+            # Freeze the checkpoint first, the converter needs a graph with input and embeddings only
+            frozen_file = os.path.join(tempfile.mkdtemp(), 'frozen.pb')
+            graph_def = freeze_graph.freeze_graph(model_path, args.model_def, args.image_size, args.embedding_size)
+            with tf.gfile.GFile(frozen_file, 'wb') as f:
+                f.write(graph_def.SerializeToString())
+        # The TF1 converter reads a frozen graph, the Keras models go through the TF2 one
+        converter = tf.lite.TFLiteConverter.from_frozen_graph(
+            frozen_file, ['input'], ['embeddings'], {'input': [1, args.image_size, args.image_size, 3]})
+        tflite_model = tflite_embedder = convert(converter, args.mode, calibration_images)
+        sess = tf.Session(graph=tf.Graph())
+        with sess.graph.as_default():
+            with sess.as_default():
+                facenet.load_model(frozen_file)
+        images_placeholder = sess.graph.get_tensor_by_name('input:0')
+        embeddings = sess.graph.get_tensor_by_name('embeddings:0')
+        float_predict = lambda images: sess.run(embeddings, feed_dict={images_placeholder: images})
+
+    embedder_file = os.path.join(tempfile.mkdtemp(), 'embedder.tflite')
+    with open(embedder_file, 'wb') as f:
+        f.write(tflite_embedder)
+    quantized_predict = facenet.TFLiteModel(embedder_file).predict
+
+    float_emb, float_latency = timed(float_predict, pair_images, args.batch_size)
+    quantized_emb, quantized_latency = timed(quantized_predict, pair_images, args.batch_size)
+    float_accuracy, float_val, float_far = evaluate(float_emb, issame, args.nrof_folds, args.far_target)
+    accuracy, val, far = evaluate(quantized_emb, issame, args.nrof_folds, args.far_target)
+    print('%10s %10s %16s %12s' % ('model', 'accuracy', 'val@far', 'batch ms'))
+    print('%10s %10.4f %9.4f@%.4f %12.1f' % ('float32', float_accuracy, float_val, float_far, 1000 * float_latency))
+    print('%10s %10.4f %9.4f@%.4f %12.1f' % (args.mode, accuracy, val, far, 1000 * quantized_latency))
+    print('Speed-up: %.2fx, accuracy loss: %.4f, validation rate loss: %.4f' % (
+        float_latency / quantized_latency, float_accuracy - accuracy, float_val - val))
+
+    if float_accuracy - accuracy > args.max_accuracy_drop:
+        raise ValueError('Accuracy drops by %.4f, more than %.4f, the model is not written' % (
+            float_accuracy - accuracy, args.max_accuracy_drop))
+    if keras_model:
+        # The softmax model written is a conversion of its own, its classes are checked against the float model
+        model_file = os.path.join(tempfile.mkdtemp(), 'model.tflite')
+        with open(model_file, 'wb') as f:
+            f.write(tflite_model)
+        agreement = top1_agreement(model.predict, facenet.TFLiteModel(model_file).predict,
+                                   np.concatenate([calibration_images, pair_images]), args.batch_size)
+        print('Top-1 class agreement with the float model: %.4f' % agreement)
+        if agreement < args.min_top1_agreement:
+            raise ValueError('Top-1 class agreement is %.4f, less than %.4f, the model is not written' % (
+                agreement, args.min_top1_agreement))
+    with open(os.path.expanduser(args.output_file), 'wb') as f:
+        f.write(tflite_model)
+    print('Quantized model written to "%s"' % args.output_file)
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('model_path', type=str,
+                        help='Triplet checkpoint directory, frozen .pb from freeze_graph.py or Keras softmax .h5 model')
+    parser.add_argument('calibration_dir', type=str,
+                        help='Directory with aligned faces in one folder per class used for calibration')
+    parser.add_argument('pairs', type=str,
+                        help='Held-out pair list, one "path1 path2 1|0" line per pair (1 for the same person)')
+    parser.add_argument('output_file', type=str,
+                        help='Filename of the quantized .tflite model')
+    parser.add_argument('--model_weights_path', type=str,
+                        help='Weights of the Keras softmax model', default='')
+    parser.add_argument('--mode', type=str, choices=['int8', 'float16'],
+                        help='int8 quantizes weights and activations, float16 only stores the weights in float16',
+                        default='int8')
+    parser.add_argument('--nrof_calibration_images', type=int,
+                        help='Number of faces used to calibrate the activation ranges', default=200)
+    parser.add_argument('--max_accuracy_drop', type=float,
+                        help='Largest allowed drop of the pair verification accuracy', default=0.01)
+    parser.add_argument('--min_top1_agreement', type=float,
+                        help='Smallest allowed fraction of faces where a quantized Keras softmax model predicts the same class as the float model',
+                        default=0.99)
+    parser.add_argument('--far_target', type=float,
+                        help='False accept rate of the reported validation rate', default=1e-3)
+    parser.add_argument('--nrof_folds', type=int,
+                        help='Number of folds of the cross validation', default=10)
+    parser.add_argument('--batch_size', type=int,
+                        help='Number of images in an evaluation batch', default=64)
+    parser.add_argument('--model_def', type=str,
+                        help='Model definition of a checkpoint directory', default='models.inception_resnet_v1')
+    parser.add_argument('--image_size', type=int,
+                        help='Image size (height, width) in pixels', default=160)
+    parser.add_argument('--embedding_size', type=int,
+                        help='Dimensionality of the embedding of a checkpoint directory', default=128)
+    parser.add_argument('--seed', type=int,
+                        help='Random seed of the calibration sample', default=666)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main(parse_arguments(sys.argv[1:]))
@@ -0,0 +1,81 @@
+"""IVF-PQ index against the exact search, and its add/remove/renumber/save/load."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import ann_index
+
+
+def unit_vectors(n, size=32, seed=0):
+    x = np.random.RandomState(seed).randn(n, size).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def exact_search(embeddings, queries, k):
+    distances = np.sqrt(np.maximum(ann_index.squared_distances(queries, embeddings), 0))
+    ids = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return ids, np.take_along_axis(distances, ids, axis=1)
+
+
+@pytest.fixture(scope='module')
+def data():
+    embeddings = unit_vectors(300)
+    index = ann_index.build_index(embeddings, nrof_lists=8, nrof_subspaces=16, nrof_iter=5)
+    return embeddings, index
+
+
+def test_every_list_and_refine_is_exact(data):
+    embeddings, index = data
+    queries = unit_vectors(20, seed=1)
+    ids, distances = index.search(queries, 5, nprobe=8, refine=len(embeddings), batch_size=7)
+    exact_ids, exact_distances = exact_search(embeddings, queries, 5)
+    assert np.array_equal(ids, exact_ids)
+    assert np.allclose(distances, exact_distances, atol=1e-5)
+
+
+def test_vector_finds_itself(data):
+    embeddings, index = data
+    ids, distances = index.search(embeddings[:50], 1)
+    assert np.array_equal(ids[:, 0], np.arange(50))
+    assert np.all(distances[:, 0] < 1e-3)
+
+
+def test_missing_neighbours():
+    embeddings = unit_vectors(10)
+    index = ann_index.build_index(embeddings, nrof_lists=2, nrof_subspaces=16, nrof_iter=5)
+    ids, distances = index.search(embeddings[:1], 20, nprobe=2)
+    assert np.all(ids[0, :10] >= 0) and np.all(ids[0, 10:] == -1)
+    assert np.all(np.isinf(distances[0, 10:]))
+
+
+def test_add_remove_renumber(data):
+    embeddings, index = data
+    new = unit_vectors(5, seed=2)
+    added = index.add(new, np.arange(300, 305))
+    assert len(added) == 305 and len(index) == 300
+    added.embeddings = np.concatenate([embeddings, new])
+    assert np.array_equal(added.search(new, 1)[0][:, 0], np.arange(300, 305))
+
+    removed = added.remove(np.arange(0, 300))
+    assert sorted(removed.ids) == list(range(300, 305))
+    renumbered = removed.renumber(np.concatenate([np.zeros(300, dtype=np.int64), np.arange(5)]))
+    renumbered.embeddings = new
+    assert np.array_equal(renumbered.search(new, 1)[0][:, 0], np.arange(5))
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load(data, tmp_path, mmap):
+    embeddings, index = data
+    path = str(tmp_path / 'ann')
+    index.save(path)
+    assert ann_index.is_index(path)
+    loaded = ann_index.load_index(path, mmap)
+    assert isinstance(loaded.codes, np.memmap) == mmap
+    queries = unit_vectors(10, seed=3)
+    for expected, result in zip(index.search(queries, 5), loaded.search(queries, 5)):
+        assert np.array_equal(expected, result)
@@ -0,0 +1,45 @@
+"""MTCNN called from a pipeline thread that did not open the session."""
+import os
+import sys
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+tf = pytest.importorskip('tensorflow.compat.v1')
+pytest.importorskip('mtcnn')
+pytest.importorskip('ffmpeg')
+pytest.importorskip('moviepy.editor')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import find_person_in_video_triplet_model as video_search
+from mtcnn import MTCNN
+
+
+def run_on_thread(func):
+    # Result or exception of func called on a new thread
+    outcome = {}
+    def target():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def test_detect_frame_on_worker_thread():
+    tf.disable_eager_execution()
+    image = np.zeros((240, 320, 3), dtype=np.uint8)
+    with tf.Graph().as_default():
+        with tf.Session() as sess:
+            detector = MTCNN()
+            frame = {'frame_number': 1, 'image': image, 'sampled': True}
+            frame = run_on_thread(lambda: video_search.detect_frame(frame, detector, sess))
+    assert frame['faces'] == []
+    assert frame['bboxs'] == []
@@ -0,0 +1,83 @@
+"""Batches formed by the DynamicBatcher of the face server."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('tensorflow.compat.v1')
+pytest.importorskip('mtcnn')
+pytest.importorskip('ffmpeg')
+pytest.importorskip('moviepy.editor')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import face_server
+
+
+class RecordingFunc():
+    "Doubles the items and records every batch, the first batch waits for release"
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, items):
+        if not self.batches:
+            self.started.set()
+            self.release.wait()
+        self.batches.append(list(items))
+        return [2 * item for item in items]
+
+
+def submit_on_thread(batcher, items, results):
+    thread = threading.Thread(target=lambda: results.append((items[0], batcher.submit(items))))
+    thread.start()
+    return thread
+
+
+def wait_for_queue(batcher, size):
+    deadline = time.time() + 5
+    while batcher.queue.qsize() < size:
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+def test_large_submit_is_split():
+    func = RecordingFunc()
+    func.release.set()
+    batcher = face_server.DynamicBatcher(func, max_batch_size=4, max_wait=0)
+    assert batcher.submit(list(range(10))) == [2 * i for i in range(10)]
+    assert [len(batch) for batch in func.batches] == [4, 4, 2]
+    assert batcher.submit([]) == []
+
+
+def test_concurrent_callers_share_a_batch_and_overflow_is_carried():
+    func = RecordingFunc()
+    batcher = face_server.DynamicBatcher(func, max_batch_size=4, max_wait=0.05)
+    results = []
+    # A full batch holds the worker while the other callers queue up in order
+    threads = [submit_on_thread(batcher, [0, 1, 2, 3], results)]
+    assert func.started.wait(5)
+    for size, items in enumerate([[10, 11, 12], [20, 21], [30]]):
+        threads.append(submit_on_thread(batcher, items, results))
+        wait_for_queue(batcher, size + 1)
+    func.release.set()
+    for thread in threads:
+        thread.join()
+    # [20, 21] does not fit next to [10, 11, 12] and starts the next batch, which [30] joins
+    assert func.batches == [[0, 1, 2, 3], [10, 11, 12], [20, 21, 30]]
+    assert sorted(results) == [(0, [0, 2, 4, 6]), (10, [20, 22, 24]), (20, [40, 42]), (30, [60])]
+    assert (batcher.nrof_batches, batcher.nrof_items) == (3, 10)
+
+
+def test_error_reaches_every_caller_of_the_batch():
+    def fail(items):
+        raise RuntimeError('embedder failed')
+    batcher = face_server.DynamicBatcher(fail, max_batch_size=4, max_wait=0)
+    with pytest.raises(RuntimeError):
+        batcher.submit([1, 2])
@@ -0,0 +1,60 @@
+"""Embedding cache hits for near-identical crops at the same place."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import embedding_cache
+
+
+def face(seed):
+    return np.random.RandomState(seed).randint(0, 256, (160, 160, 3)).astype(np.uint8)
+
+
+def test_same_crop_same_place_hits():
+    cache = embedding_cache.EmbeddingCache()
+    key, value = cache.get(face(0), [10, 10, 50, 50])
+    assert value is None
+    cache.put(key, 'embedding')
+    _, value = cache.get(face(0), [12, 11, 50, 50])
+    assert value == 'embedding'
+    assert (cache.nrof_hits, cache.nrof_misses) == (1, 1)
+
+
+def test_slightly_changed_crop_hits():
+    cache = embedding_cache.EmbeddingCache(max_distance=4)
+    image = face(0)
+    key, _ = cache.get(image, [10, 10, 50, 50])
+    cache.put(key, 'embedding')
+    noisy = np.clip(image.astype(np.int16) + 1, 0, 255).astype(np.uint8)
+    assert cache.get(noisy, [10, 10, 50, 50])[1] == 'embedding'
+
+
+def test_other_place_or_other_face_misses():
+    cache = embedding_cache.EmbeddingCache()
+    key, _ = cache.get(face(0), [10, 10, 50, 50])
+    cache.put(key, 'embedding')
+    assert cache.get(face(0), [200, 10, 50, 50])[1] is None
+    assert cache.get(face(1), [10, 10, 50, 50])[1] is None
+
+
+def test_least_recently_used_is_dropped():
+    cache = embedding_cache.EmbeddingCache(capacity=2, max_distance=0)
+    keys = []
+    for i in range(3):
+        key, _ = cache.get(face(i), [10, 10, 50, 50])
+        cache.put(key, i)
+        keys.append(key)
+        if i == 1:
+            # Using the first entry makes the second the least recently used
+            assert cache.get(face(0), [10, 10, 50, 50])[1] == 0
+    assert list(cache.entries) == [keys[0], keys[2]]
+
+
+def test_hamming_distance():
+    assert embedding_cache.hamming_distance(0b1011, 0b0001) == 2
@@ -0,0 +1,99 @@
+"""Embedding store reuse and invalidation by image, model fingerprint and pruning."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import embedding_store
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / ('image_%d.png' % i)
+        path.write_bytes(b'image %d' % i)
+        paths.append(str(path))
+    return paths
+
+
+def open_store(tmp_path, fingerprint='model', invalidate=False):
+    return embedding_store.EmbeddingStore(str(tmp_path / 'store'), fingerprint, invalidate)
+
+
+def fill(store, images):
+    for i, path in enumerate(images):
+        assert store.get(path) is None
+        store.put(path, np.full(4, i, dtype=np.float32))
+    store.save()
+
+
+def test_embeddings_are_reused(tmp_path, images):
+    store = open_store(tmp_path)
+    fill(store, images)
+    store = open_store(tmp_path)
+    for i, path in enumerate(images):
+        assert np.array_equal(store.get(path), np.full(4, i))
+    assert (store.nrof_hits, store.nrof_misses) == (3, 0)
+
+
+def test_changed_image_is_embedded_again(tmp_path, images):
+    fill(open_store(tmp_path), images)
+    with open(images[0], 'ab') as f:
+        f.write(b' edited')
+    stat = os.stat(images[1])
+    os.utime(images[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    store = open_store(tmp_path)
+    assert store.get(images[0]) is None
+    assert store.get(images[1]) is None
+    assert store.get(images[2]) is not None
+
+
+def test_other_model_or_invalidate_ignores_the_store(tmp_path, images):
+    fill(open_store(tmp_path), images)
+    assert open_store(tmp_path, 'other model').get(images[0]) is None
+    assert open_store(tmp_path, invalidate=True).get(images[0]) is None
+    assert open_store(tmp_path).get(images[0]) is not None
+
+
+def test_fingerprint_depends_on_the_model_files_and_options(tmp_path):
+    model_file = tmp_path / 'model.pb'
+    model_file.write_bytes(b'weights')
+    other_file = tmp_path / 'model_classifier.pkl'
+    other_file.write_bytes(b'classifier')
+    fingerprint = embedding_store.model_fingerprint([str(model_file)], margin=44)
+    assert embedding_store.model_fingerprint([str(model_file)], margin=32) != fingerprint
+    other_file.write_bytes(b'retrained classifier')
+    assert embedding_store.model_fingerprint([str(model_file)], margin=44) == fingerprint
+    model_file.write_bytes(b'new weights')
+    assert embedding_store.model_fingerprint([str(model_file)], margin=44) != fingerprint
+
+
+def test_unused_entries_are_pruned(tmp_path, images):
+    fill(open_store(tmp_path), images)
+    store = open_store(tmp_path)
+    assert np.array_equal(store.get(images[2]), np.full(4, 2))
+    store.put(images[0], np.full(4, 5, dtype=np.float32))
+    store.save()
+    assert sorted(store.entries) == sorted(os.path.abspath(p) for p in [images[0], images[2]])
+    assert store.embeddings.shape == (2, 4)
+    store = open_store(tmp_path)
+    assert store.get(images[1]) is None
+    assert np.array_equal(store.get(images[0]), np.full(4, 5))
+    assert np.array_equal(store.get(images[2]), np.full(4, 2))
+
+
+def test_image_without_face_is_remembered(tmp_path, images):
+    store = open_store(tmp_path)
+    store.put(images[0], None)
+    store.put(images[1], np.ones(4, dtype=np.float32))
+    assert store.get(images[0]) == embedding_store.NO_FACE
+    store.save()
+    store = open_store(tmp_path)
+    assert store.get(images[0]) == embedding_store.NO_FACE
+    assert np.array_equal(store.get(images[1]), np.ones(4))
+    assert store.embeddings.shape == (1, 4)
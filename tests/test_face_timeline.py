@@ -0,0 +1,66 @@
+"""Intervals merged by TimelineWriter."""
+import csv
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import face_timeline
+
+CLASS_NAMES = ['alice', 'bob']
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_appearances_within_gap_are_merged(tmp_path):
+    output_file = str(tmp_path / 'timeline.jsonl')
+    timeline = face_timeline.TimelineWriter(output_file, CLASS_NAMES, fps=10, gap=1.0)
+    # alice at 0.0 s, 0.5 s and 1.5 s, then again at 3.0 s after a gap of 1.5 s
+    for frame_number, probability in [(0, 80), (5, 90), (15, 70), (30, 60)]:
+        timeline.add(frame_number, [[1, 2, 3, 4]], [0], [probability])
+    timeline.close()
+    rows = read_jsonl(output_file)
+    assert [(row['start'], row['end'], row['nrof_frames']) for row in rows] == [(0.0, 1.5, 3), (3.0, 3.0, 1)]
+    assert rows[0]['max_probability'] == 90
+    assert rows[0]['mean_probability'] == 80
+    assert rows[0]['name'] == 'alice'
+    assert timeline.nrof_intervals == 2
+
+
+def test_best_face_of_an_identity_per_frame(tmp_path):
+    output_file = str(tmp_path / 'timeline.jsonl')
+    timeline = face_timeline.TimelineWriter(output_file, CLASS_NAMES, fps=1)
+    timeline.add(0, [[0, 0, 1, 1], [5, 5, 2, 2]], [1, 1], [60, 95])
+    timeline.close()
+    rows = read_jsonl(output_file)
+    assert len(rows) == 1
+    assert rows[0]['nrof_frames'] == 1
+    assert rows[0]['bbox'] == [5, 5, 2, 2]
+
+
+def test_threshold_and_id_filter(tmp_path):
+    output_file = str(tmp_path / 'timeline.jsonl')
+    timeline = face_timeline.TimelineWriter(output_file, CLASS_NAMES, fps=1, threshold=50, id=1)
+    timeline.add(0, [[0, 0, 1, 1], [0, 0, 1, 1]], [0, 1], [99, 40])
+    timeline.add(1, [[0, 0, 1, 1]], [1], [70])
+    timeline.close()
+    rows = read_jsonl(output_file)
+    assert [(row['class_index'], row['start']) for row in rows] == [(1, 1.0)]
+
+
+def test_intervals_are_written_in_start_order(tmp_path):
+    output_file = str(tmp_path / 'timeline.csv')
+    timeline = face_timeline.TimelineWriter(output_file, CLASS_NAMES, fps=1, gap=1.0, flush_every=1)
+    timeline.add(0, [[0, 0, 1, 1]], [1], [90])
+    timeline.add(1, [[0, 0, 1, 1], [2, 2, 1, 1]], [0, 1], [90, 90])
+    timeline.add(2, [[0, 0, 1, 1]], [0], [90])
+    timeline.close()
+    with open(output_file, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['name'], row['start'], row['end']) for row in rows] == [
+        ('bob', '0.0', '1.0'), ('alice', '1.0', '2.0')]
+    assert rows[0]['bbox'] == '0 0 1 1'
@@ -0,0 +1,43 @@
+"""Greedy IoU matching of the face tracker."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import face_tracker
+
+
+def test_iou_matrix():
+    iou = face_tracker.iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 10, 10], [20, 20, 5, 5]])
+    assert np.allclose(iou, [[1.0, 50.0 / 150.0, 0.0]])
+
+
+def test_match_boxes_best_overlap_first():
+    boxes_a = [[0, 0, 10, 10], [100, 100, 10, 10]]
+    boxes_b = [[101, 100, 10, 10], [2, 0, 10, 10], [1, 0, 10, 10]]
+    assert sorted(face_tracker.match_boxes(boxes_a, boxes_b)) == [(0, 2), (1, 0)]
+
+
+def test_match_boxes_threshold():
+    # IoU of 1/3 is matched at 0.3, not at 0.5
+    boxes_a, boxes_b = [[0, 0, 10, 10]], [[5, 0, 10, 10]]
+    assert face_tracker.match_boxes(boxes_a, boxes_b, 0.3) == [(0, 0)]
+    assert face_tracker.match_boxes(boxes_a, boxes_b, 0.5) == []
+
+
+def test_match_boxes_empty():
+    assert face_tracker.match_boxes([], [[0, 0, 1, 1]]) == []
+    assert face_tracker.match_boxes([[0, 0, 1, 1]], []) == []
+
+
+def test_track_identities():
+    identities = face_tracker.TrackIdentities()
+    identities.add([3, 4], [1, 0], [90.0, 80.0])
+    class_indices, class_probabilities = identities.lookup([4, 3])
+    assert list(class_indices) == [0, 1]
+    assert list(class_probabilities) == [80.0, 90.0]
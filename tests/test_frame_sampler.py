@@ -0,0 +1,87 @@
+"""Frames sampled by grab, by key frame seek and in key frame aligned segments."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('ffmpeg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import frame_sampler
+
+
+class FakeCapture():
+    "cv2.VideoCapture over a list of frames, every frame holds its own index"
+
+    def __init__(self, nrof_frames):
+        self.frames = [np.full((2, 2, 3), i, dtype=np.uint8) for i in range(nrof_frames)]
+        self.position = 0
+        self.grabbed = None
+
+    def set(self, prop, value):
+        assert prop == cv2.CAP_PROP_POS_FRAMES
+        self.position = int(value)
+        return True
+
+    def grab(self):
+        if self.position >= len(self.frames):
+            return False
+        self.grabbed = self.position
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        return True, self.frames[self.grabbed]
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+
+def sample(nrof_frames, frame_skip, gop_size=None, **kwargs):
+    sampler = frame_sampler.FrameSampler(FakeCapture(nrof_frames), frame_skip, gop_size, **kwargs)
+    return [(index, int(frame[0, 0, 0]), sampled) for index, frame, sampled in sampler], sampler
+
+
+def test_grab_samples_the_grid():
+    frames, sampler = sample(20, 5)
+    assert frames == [(i, i, True) for i in [0, 5, 10, 15]]
+    assert sampler.nrof_decoded == 20
+    assert sampler.nrof_analysed == 4
+
+
+def test_offset_moves_the_grid_but_keeps_the_first_frame():
+    frames, _ = sample(20, 5, offset=4)
+    assert [index for index, _, _ in frames] == [0, 4 + 5, 4 + 10, 4 + 15]
+
+
+def test_seek_samples_the_same_frames_as_grab():
+    grabbed, _ = sample(50, 10, offset=3)
+    sought, sampler = sample(50, 10, gop_size=4, offset=3)
+    assert sampler.seek
+    assert sought == grabbed
+    # The frames decoded by a seek are not known
+    assert sampler.nrof_decoded == 0
+
+
+def test_keep_skipped_returns_every_frame():
+    frames, _ = sample(12, 4, keep_skipped=True)
+    assert [index for index, _, _ in frames] == list(range(12))
+    assert [index for index, _, sampled in frames if sampled] == [0, 4, 8]
+
+
+def test_segments_sample_the_same_frames_as_one_pass():
+    whole, _ = sample(100, 7, offset=6)
+    segments = frame_sampler.split_segments([0, 24, 48, 72, 96], 100, 4)
+    assert segments == [(0, 24), (24, 48), (48, 72), (72, None)]
+    parts = [frame for start, end in segments for frame in sample(100, 7, offset=6, start=start, end=end)[0]]
+    assert parts == whole
+
+
+def test_split_segments_skips_repeated_key_frames():
+    # A single key frame can not be cut into several segments
+    assert frame_sampler.split_segments([0], 100, 4) == [(0, None)]
@@ -0,0 +1,98 @@
+"""Gallery search by identity, enroll/remove and save/load with and without the ANN index."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import gallery_index
+
+CLASS_NAMES = ['alice', 'bob', 'carol', 'dave']
+
+
+def gallery_data(nrof_per_class=20, size=32, seed=0):
+    # Tight clusters around one direction per identity, the labels are shuffled
+    random_state = np.random.RandomState(seed)
+    centers = gallery_index.l2_normalize(random_state.randn(len(CLASS_NAMES), size))
+    labels = random_state.permutation(np.repeat(np.arange(len(CLASS_NAMES)), nrof_per_class))
+    embeddings = centers[labels] + 0.05 * random_state.randn(len(labels), size)
+    return gallery_index.l2_normalize(embeddings), labels, centers
+
+
+@pytest.fixture(params=[-1, 4], ids=['exact', 'ann'])
+def gallery(request):
+    embeddings, labels, centers = gallery_data()
+    return gallery_index.build_gallery(embeddings, labels, CLASS_NAMES, nrof_lists=request.param), centers
+
+
+def test_rows_are_sorted_by_label(gallery):
+    gallery, _ = gallery
+    assert np.all(np.diff(gallery.labels) >= 0)
+    assert gallery.method == ('ann' if gallery.ann is not None else 'nearest')
+
+
+def test_search_returns_distinct_identities(gallery):
+    gallery, centers = gallery
+    # Every identity has 20 rows closer to its center than any row of another identity, more than the
+    # 4 * k rows the ANN search fetches first
+    top, distances = gallery.search(centers, k=4)
+    assert np.array_equal(top[:, 0], np.arange(len(CLASS_NAMES)))
+    assert all(sorted(row) == list(range(len(CLASS_NAMES))) for row in top)
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+
+def test_classify_unknown(gallery):
+    gallery, centers = gallery
+    far = -np.sum(centers, axis=0, keepdims=True)
+    class_index, class_probability = gallery.classify(np.concatenate([centers[2:3], far]))
+    assert class_index[0] == 2 and class_probability[0] > 90
+    assert class_index[1] == len(CLASS_NAMES)
+    assert gallery.class_names_with_unknown()[class_index[1]] == gallery_index.UNKNOWN
+
+
+def test_enroll_and_remove(gallery):
+    gallery, centers = gallery
+    new = gallery_index.l2_normalize(np.random.RandomState(1).randn(1, centers.shape[1]))
+    enrolled = gallery.enroll('erin', np.repeat(new, 3, axis=0))
+    assert enrolled.class_names == CLASS_NAMES + ['erin']
+    assert enrolled.classify(new)[0][0] == 4
+    # More rows of an existing identity go next to its other rows
+    enrolled = enrolled.enroll('bob', centers[1:2])
+    assert np.all(np.diff(enrolled.labels) >= 0)
+    assert np.sum(enrolled.labels == 1) == 21
+
+    removed = enrolled.remove('bob')
+    assert removed.class_names == ['alice', 'carol', 'dave', 'erin']
+    assert list(removed.classify(np.concatenate([centers[[0, 2, 3]], new]))[0]) == [0, 1, 2, 3]
+    with pytest.raises(ValueError):
+        removed.remove('bob')
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load(gallery, tmp_path, mmap):
+    gallery, centers = gallery
+    path = str(tmp_path / 'gallery')
+    model = gallery_index.model_info('triplet', '/models/20180402-114759.pb', 32)
+    gallery.model = model
+    gallery.save(path)
+    assert gallery_index.is_gallery(path)
+    loaded = gallery_index.load_gallery(path, mmap, model)
+    assert loaded.class_names == CLASS_NAMES and loaded.model == model
+    assert (loaded.ann is None) == (gallery.ann is None)
+    for expected, result in zip(gallery.search(centers, 4), loaded.search(centers, 4)):
+        assert np.array_equal(expected, result)
+    # A loaded gallery can be changed and saved over itself while memory-mapped
+    loaded.enroll('erin', centers[:1]).save(path)
+    assert gallery_index.load_gallery(path, mmap).class_names == CLASS_NAMES + ['erin']
+
+
+def test_other_model_is_rejected(tmp_path):
+    embeddings, labels, _ = gallery_data()
+    path = str(tmp_path / 'gallery')
+    gallery_index.build_gallery(embeddings, labels, CLASS_NAMES,
+                                model=gallery_index.model_info('triplet', 'facenet.pb', 32)).save(path)
+    with pytest.raises(ValueError):
+        gallery_index.load_gallery(path, model=gallery_index.model_info('softmax', 'softmax.h5', 32))
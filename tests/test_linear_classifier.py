@@ -0,0 +1,49 @@
+"""numpy linear classifier against the sklearn model it is exported from."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import SVC
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import linear_classifier
+
+
+def embeddings(nrof_classes, nrof_per_class=30, size=16, seed=0):
+    random_state = np.random.RandomState(seed)
+    centers = random_state.randn(nrof_classes, size)
+    y = np.repeat(np.arange(nrof_classes), nrof_per_class)
+    x = centers[y] + 0.8 * random_state.randn(len(y), size)
+    return x.astype(np.float32), y
+
+
+@pytest.mark.parametrize('model, nrof_classes', [
+    (LogisticRegression(max_iter=1000), 4),
+    (LogisticRegression(max_iter=1000), 2),
+    (SVC(kernel='linear', probability=True, random_state=0), 4),
+    (SVC(kernel='linear', probability=True, random_state=0), 2),
+])
+def test_same_probabilities_as_sklearn(model, nrof_classes, tmp_path):
+    x, y = embeddings(nrof_classes)
+    model.fit(x, y)
+    class_names = ['person_%d' % i for i in range(nrof_classes)]
+    path = str(tmp_path / 'model_classifier.npz')
+    linear_classifier.from_sklearn(model, class_names).save(path)
+    assert linear_classifier.is_linear_classifier(path)
+    linear = linear_classifier.load_linear_classifier(path)
+    assert linear.class_names == class_names
+    assert np.max(np.abs(linear.predict_proba(x) - model.predict_proba(x))) < 1e-4
+    assert np.array_equal(linear.predict(x), np.argmax(model.predict_proba(x), axis=1))
+
+
+def test_not_linear_model_is_rejected():
+    x, y = embeddings(3)
+    model = SVC(kernel='rbf', probability=True).fit(x, y)
+    with pytest.raises(ValueError):
+        linear_classifier.from_sklearn(model, ['a', 'b', 'c'])
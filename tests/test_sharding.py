@@ -0,0 +1,91 @@
+"""Records of a video processed in key frame aligned segments against a sequential run."""
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+tf = pytest.importorskip('tensorflow.compat.v1')
+pytest.importorskip('mtcnn')
+pytest.importorskip('ffmpeg')
+pytest.importorskip('moviepy.editor')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'ouput_function'))
+
+import frame_sampler
+import find_person_in_video_triplet_model as video_search
+
+
+class BrightBoxDetector():
+    "Detects the bright square of the synthetic video as one face"
+
+    def detect_faces(self, img):
+        ys, xs = np.nonzero(img.max(axis=2) > 128)
+        if len(xs) == 0:
+            return []
+        box = [int(xs.min()), int(ys.min()), int(xs.max() - xs.min() + 1), int(ys.max() - ys.min() + 1)]
+        return [{'box': box, 'confidence': 0.99, 'keypoints': {}}]
+
+
+class SoftmaxModel():
+    "Classifier whose probabilities are the softmax of the embedding"
+
+    def predict_proba(self, x):
+        e = np.exp(x - x.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+
+def write_video(path, nrof_frames=60, fps=10):
+    # A square moving across a dark background, its color changes over time
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (160, 120))
+    for i in range(nrof_frames):
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        x = 10 + 2 * i
+        frame[40:80, x:x + 40] = (255, 160 + i, 255 - 2 * i)
+        writer.write(frame)
+    writer.release()
+
+
+def record_values(records):
+    return [(r['frame_number'], [list(b) for b in r['bboxs']], np.asarray(r['class_indices']).tolist())
+            for r in records]
+
+
+def test_sharded_records_match_sequential(tmp_path):
+    tf.disable_eager_execution()
+    input_video = str(tmp_path / 'synthetic.mp4')
+    write_video(input_video)
+    args = video_search.parse_arguments(['model', 'classifier', input_video, str(tmp_path)])
+    args.workers = 3
+    video_search.check_sharding(args)
+    frame_skip, fps, frame_count = 5, 10, 60
+    segments = frame_sampler.split_segments(frame_sampler.key_frames(input_video, fps), frame_count, args.workers)
+    assert len(segments) > 1
+
+    with tf.Graph().as_default():
+        images = tf.placeholder(tf.float32, [None, 160, 160, 3], name='input')
+        tf.identity(tf.nn.l2_normalize(tf.reduce_mean(images, axis=[1, 2]), axis=1), name='embeddings')
+        with tf.Session() as sess:
+            def run(start=0, end=None):
+                records = []
+                video_search.run_pipeline(args, sess, BrightBoxDetector(), SoftmaxModel(), frame_skip,
+                                          lambda frames: records.extend(video_search.frame_record(frame)
+                                                                        for frame in frames if frame['sampled']),
+                                          start, end, report=False)
+                return records
+
+            sequential = run()
+            sharded = [record for start, end in segments for record in run(start, end)]
+
+    assert len(sequential) > 0
+    assert record_values(sharded) == record_values(sequential)
+
+
+def test_stateful_options_are_rejected_with_workers():
+    args = video_search.parse_arguments(['model', 'classifier', 'video.mp4', 'out', '--workers', '2',
+                                         '--detect_every', '5'])
+    with pytest.raises(ValueError):
+        video_search.check_sharding(args)
+    args.workers = 1
+    video_search.check_sharding(args)